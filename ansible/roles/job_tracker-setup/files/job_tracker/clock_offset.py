@@ -0,0 +1,89 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    clock_offset
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    running estimate of the clock offset (source host clock - local clock)
+    per source host, from the clock records fetches carry along
+    ("message-queue.py --clock").
+
+    the source host reads its clock somewhere between the start of the
+    fetch and the arrival of the clock record. a sample is the clock
+    compared to the midpoint of both, the error is at most half the round
+    trip (the midpoint of an asymmetric round trip). samples are smoothed
+    (exponentially weighted), samples of fetches with a long round trip
+    (slow connection or busy host) count less than the fastest one seen.
+
+    timestamps of the source host minus its offset are local time.
+'''
+
+import threading
+
+
+class clock_offset():
+
+    # weight of a sample with the best round trip
+    smoothing = 0.2
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.lock = threading.Lock()
+
+        # key: hostname, value: offset in seconds (float)
+        self.offsets = dict()
+        # key: hostname, value: shortest round trip seen (float)
+        self.best_round_trip = dict()
+        # hostnames with an offset beyond <controller_interval>
+        self.drifting = set()
+
+
+    def add_sample(self, hostname, remote_time, sent, received):
+        ''' Takes:
+                hostname (string)
+                remote_time (float) clock of <hostname> read during the fetch
+                sent (float) epoche the fetch was started
+                received (float) epoche <remote_time> arrived '''
+
+        round_trip = max(received - sent, 0.001)
+        sample = remote_time - (sent + received) / 2.0
+
+        with self.lock:
+
+            best = min(self.best_round_trip.get(hostname, round_trip), round_trip)
+            self.best_round_trip[hostname] = best
+
+            if hostname not in self.offsets:
+                offset = sample
+            else:
+                weight = self.smoothing * best / round_trip
+                offset = self.offsets[hostname] + weight * (sample - self.offsets[hostname])
+
+            self.offsets[hostname] = offset
+
+        self.logger.debug('clock_offset - %s: %.3f sec (sample: %.3f sec, round trip: %.3f sec)' % (
+            hostname, offset, sample, round_trip))
+
+        if abs(offset) > self.cfg.controller_interval and hostname not in self.drifting:
+            self.drifting.add(hostname)
+            self.logger.warning('clock_offset - time drift between local and source host %s greater than %s [sec]: %.1f sec' % (
+                hostname, self.cfg.controller_interval, offset))
+
+        elif abs(offset) <= self.cfg.controller_interval and hostname in self.drifting:
+            self.drifting.discard(hostname)
+            self.logger.info('clock_offset - time drift of source host %s back to %.1f sec' % (hostname, offset))
+
+
+    def get_offset(self, hostname):
+
+        return self.offsets.get(hostname, 0.0)
+
+
+    def normalize(self, hostname, timestamp):
+        ''' Returns:
+                <timestamp> of <hostname> in local time '''
+
+        return timestamp - self.offsets.get(hostname, 0.0)
@@ -8,6 +8,9 @@ Description:
 import os, sys
 import json
 
+# job_tracker
+from record_codec import encode_strings
+
 
 class Config():
 
@@ -41,7 +44,7 @@ class Config():
 
         try:
             with open(configfile, 'r') as f:
-                self.item = json.load(f)
+                self.item = encode_strings(json.load(f))
         except Exception as err: 
             print 'init checks - failed to load config file: %s. exiting.' % err
             sys.exit(1)
@@ -53,6 +56,57 @@ class Config():
         self.log_level               = self.item['global_config'][0]['log_level']
         self.controller_interval     = self.item['global_config'][0]['controller_interval_in_sec']
         self.controller_run_duration = 5.0
+        self.controller_data_load_workers = int(self.item['global_config'][0].get('controller_data_load_workers', 8))
+        self.controller_ssh_multiplexing  = bool(self.item['global_config'][0].get('controller_ssh_multiplexing', True))
+        self.controller_ssh_master_check_interval = float(self.item['global_config'][0].get('controller_ssh_master_check_interval_in_sec', 60))
+        self.controller_fetch_engine         = self.item['global_config'][0].get('controller_fetch_engine', 'pool')
+        self.controller_fetch_timeout        = float(self.item['global_config'][0].get('controller_fetch_timeout_in_sec', 60))
+        self.controller_max_fetches_in_flight = int(self.item['global_config'][0].get('controller_max_fetches_in_flight', 1000))
+
+        self.controller_drain_max_rows  = int(self.item['global_config'][0].get('controller_drain_max_rows', 10000))
+        self.controller_drain_max_bytes = int(self.item['global_config'][0].get('controller_drain_max_bytes', 16 * 1024 * 1024))
+        self.controller_drain_max_sec   = float(self.item['global_config'][0].get('controller_drain_max_sec', self.controller_interval))
+
+        self.controller_poll_interval_min = float(self.item['global_config'][0].get('controller_poll_interval_min_in_sec', self.controller_interval))
+        self.controller_poll_interval_max = float(self.item['global_config'][0].get('controller_poll_interval_max_in_sec', self.controller_interval))
+
+        self.controller_breaker_failure_threshold = int(self.item['global_config'][0].get('controller_breaker_failure_threshold', 3))
+        self.controller_breaker_backoff_min = float(self.item['global_config'][0].get('controller_breaker_backoff_min_in_sec', self.controller_interval))
+        self.controller_breaker_backoff_max = float(self.item['global_config'][0].get('controller_breaker_backoff_max_in_sec', 600))
+
+        self.controller_dedup_window_entries  = int(self.item['global_config'][0].get('controller_dedup_window_entries', 100000))
+        self.controller_dedup_window_sec      = float(self.item['global_config'][0].get('controller_dedup_window_sec', 3600))
+        self.controller_dedup_content_tolerance = float(self.item['global_config'][0].get('controller_dedup_content_tolerance_sec', 0))
+
+        self.controller_wire_format = self.item['global_config'][0].get('controller_wire_format', 'json')
+        self.controller_pipeline    = bool(self.item['global_config'][0].get('controller_pipeline', False))
+        self.controller_queue_protocol = self.item['global_config'][0].get('controller_queue_protocol', 'remove')
+        self.controller_reorder_grace  = float(self.item['global_config'][0].get('controller_reorder_grace_in_sec', 0))
+        self.controller_clock_sync     = bool(self.item['global_config'][0].get('controller_clock_sync', False))
+        self.controller_filter_pushdown = bool(self.item['global_config'][0].get('controller_filter_pushdown', False))
+
+        self.history_compaction_records = int(self.item['global_config'][0].get('history_compaction_records',
+                                                  self.item['global_config'][0]['job_history_entry_count']))
+        self.history_compaction_bytes   = int(self.item['global_config'][0].get('history_compaction_bytes', 1024 * 1024))
+        self.history_backend            = self.item['global_config'][0].get('history_backend', 'file')
+        self.history_db                 = self.item['global_config'][0].get('history_db', '%s/job_history.sqlite' % self.run_dir)
+        self.history_ring_text_bytes    = int(self.item['global_config'][0].get('history_ring_text_bytes', 256))
+
+        if self.history_backend not in ('file', 'sqlite', 'ring'):
+            print 'wrong parameter for history_backend in config file. exiting'
+            sys.exit(1)
+
+        if self.controller_fetch_engine not in ('pool', 'event_loop', 'agent'):
+            print 'wrong parameter for controller_fetch_engine in config file. exiting'
+            sys.exit(1)
+
+        if self.controller_wire_format not in ('json', 'ndjson', 'binary'):
+            print 'wrong parameter for controller_wire_format in config file. exiting'
+            sys.exit(1)
+
+        if self.controller_queue_protocol not in ('remove', 'cursor'):
+            print 'wrong parameter for controller_queue_protocol in config file. exiting'
+            sys.exit(1)
         
         self.job_start_keyword = self.item['global_config'][0]['jobs_start_keyword']
         self.job_error_keyword = self.item['global_config'][0]['jobs_error_keyword']
@@ -78,6 +132,16 @@ class Config():
             print 'wrong parameter for monitoring_backend_based_on_event_or_status in config file. exiting'
             sys.exit(1)
 
+        for host in self.item['source_hosts']:
+            # no transport: ssh, see transport.py
+            if host.get('transport') not in (None, 'ssh', 'local-sqlite', 'unix-socket'):
+                print 'wrong transport for source host %s in config file. exiting' % host['hostname']
+                sys.exit(1)
+
+            if host.get('transport') == 'unix-socket' and 'socket' not in host:
+                print 'socket missing for source host %s in config file. exiting' % host['hostname']
+                sys.exit(1)
+
         for job in self.item['jobs']:
             job['timeout_sec']            = self.str_to_sec(job['timeout_hh:mm:ss'])
             job['cyclic_interval_sec']       = self.str_to_sec(job['cyclic_interval_hh:mm:ss'])
@@ -6,16 +6,31 @@ Description:
 '''
 
 import time
+import json
+import zlib
 import signal
 import sys
 import shutil
-import random
 import inspect  # debugging: allows the inspection of the calling func within a func
+import threading
+import Queue
 from subprocess import Popen, PIPE
 
 # job_tracker
 import job_ruler
+import record_codec
 from job_history import job_history
+from sqlite_filer import get_database
+from ssh_master import ssh_master_pool
+from fetch_loop import fetch_loop
+from queue_agent import queue_agent_pool
+from decoder import message_decoder, binary_decoder
+from poll_scheduler import poll_scheduler
+from host_health import host_health
+from dedup_window import dedup_window
+from reorder_buffer import reorder_buffer
+from clock_offset import clock_offset
+from transport import get_transport
 
 
 class Controller():
@@ -38,6 +53,47 @@ class Controller():
         self.stderr_path = '/dev/tty'
         self.pidfile_path =  self.cfg.pidfile_path
         self.pidfile_timeout = 5
+        self.ssh_masters = None
+        self.fetch_loop = fetch_loop(self.cfg, self.logger)
+        self.queue_agents = None
+
+        # key: hostname, value: messages left in the queue after the last cycle (-1: unknown)
+        self.queue_remaining = dict()
+
+        # depend on the loaded cfg file (not loaded to stop the daemon), see setup
+        self.poll_scheduler = None
+        self.host_health = None
+        self.dedup_window = None
+        self.clock_offset = None
+
+        # key: hostname, value: transport (obj)
+        self.transports = dict()
+        # key: hostname, value: key in the message ids, see get_source_key
+        self.source_keys = dict()
+        # key: hostname, value: queue ids fetched in this cycle, acknowledged after it
+        self.pending_acks = dict()
+        # key: hostname, value: queue ids held back while older messages are in a reorder buffer
+        self.deferred_acks = dict()
+
+        # (env, job) of all jobs in the cfg file
+        self.job_index = set()
+        # job_index as "message-queue.py --filter" input, see get_job_filter
+        self.job_filter = None
+        # key: (env, job) not in the cfg file, value: number of messages received
+        self.unknown_messages = dict()
+
+        # set by SIGHUP, see sighup_handler
+        self.history_invalidated = False
+
+
+    def setup(self):
+        ''' Desc:
+                creates the helpers depending on the loaded cfg file, called by run '''
+
+        self.poll_scheduler = poll_scheduler(self.cfg, self.logger)
+        self.host_health = host_health(self.cfg, self.logger)
+        self.dedup_window = dedup_window(self.cfg, self.logger)
+        self.clock_offset = clock_offset(self.cfg, self.logger)
 
 
     def get_timestamp_from_epoche(self, epoche, format='%Y-%m-%d %H:%M:%S'):
@@ -77,6 +133,10 @@ class Controller():
         if not src_key == '':
             ssh_cmd += ' -i %s' % src_key
 
+        # while the master is not up, a plain (direct) ssh connection
+        if self.ssh_masters and self.ssh_masters.ensure(src_user, src_key, src_host):
+            ssh_cmd += ' -o ControlMaster=no -o ControlPath=%s' % self.ssh_masters.get_control_path(src_user, src_host)
+
         ssh_cmd += ' -x -o ConnectTimeout=%s -o BatchMode=yes -o StrictHostKeyChecking=no %s@%s' % (
             str(self.cfg.item['global_config'][0]['controller_data_load_timeout']), 
             src_user, src_host)
@@ -84,11 +144,17 @@ class Controller():
         return ssh_cmd
 
 
-    def get_sql_data_over_ssh(self, user, key, host, q, q_handler):
-        ''' return: 
-                dict (stdout, stderr, rc) '''
+    def get_sql_command_over_ssh(self, user, key, host, q, q_handler, q_cmd=''):
+        ''' takes:
+                (optional) q_cmd (string) message-queue.py command, default: remove one page
+            return: 
+                ssh command (string) removing messages from queue <q> on <host> '''
 
-        cmd = '%s -f %s remove -t EPOCHE -i %s' % (q_handler, q, self.cfg.item['global_config'][0]['job_history_entry_count'])
+        if q_cmd == '':
+            q_cmd = 'remove -t EPOCHE -i %s%s' % (self.cfg.item['global_config'][0]['job_history_entry_count'],
+                                                  self.get_output_option())
+
+        cmd = '%s -f %s %s' % (q_handler, q, q_cmd)
 
         ssh_cmd = self.get_ssh_command(user, key, host)
 
@@ -97,7 +163,26 @@ class Controller():
         # if self.cfg.log_level == 'debug':
         #     print ssh_cmd
 
-        return self.run_shell(ssh_cmd)
+        return ssh_cmd
+
+
+    def get_output_option(self):
+        ''' returns:
+                message-queue.py option (string) for <controller_wire_format>.
+                none for "json", the format every message-queue.py prints
+                (older ones do not know -o) '''
+
+        if self.cfg.controller_wire_format == 'json':
+            return ''
+
+        return ' -o %s' % self.cfg.controller_wire_format
+
+
+    def get_sql_data_over_ssh(self, user, key, host, q, q_handler):
+        ''' return: 
+                dict (stdout, stderr, rc) '''
+
+        return self.run_shell(self.get_sql_command_over_ssh(user, key, host, q, q_handler))
 
 
     # def get_sql_data_over_ssh(self, src_user, src_key, src_host, src_db, src_table=''):
@@ -144,8 +229,27 @@ class Controller():
         self.cfg.exit_flag = True
 
 
+    def sighup_handler(self, signum, frame):
+        ''' handles SIGHUP: the job histories are read from their files again
+            before the next cycle is processed '''
+
+        self.history_invalidated = True
+
+
     def cleanup(self):
         
+        if self.queue_agents:
+            self.queue_agents.stop_all()
+
+        if self.ssh_masters:
+            self.ssh_masters.stop_all()
+
+        for transport in self.transports.values():
+            transport.close()
+
+        if self.cfg.history_backend == 'sqlite':
+            get_database(self.cfg, self.logger).close()
+
         try:
             pass
             # shutil.rmtree(self.cfg.run_dir)
@@ -155,79 +259,659 @@ class Controller():
         self.logger.info('========= %s terminated =========' % self.cfg.me)
 
 
-    def get_message_as_dict(self, msg):
+    def get_message_as_dict(self, msg, source=''):
         ''' Takes:
                 msg (dict)
+                (optional) source (string) hostname <msg> was fetched from
             Desc:
                 converts <message> string to dict according to the pattern:
-                    json: { "timestamp": (int), "instance": (string) e.g. "P", "job": (string), "message": (string), "_id": (int), "event": (string) }
-                    dict:   { id: (string), epoche_timestamp: (float), env: (string), job: (string), event: (string), message_text: (string) } 
+                    json: { "timestamp": (float), "instance": (string) e.g. "P", "job": (string), "message": (string), "_id": (int), "event": (string) }
+                    dict:   { id: (string), epoche_timestamp: (float), env: (string), job: (string), event: (string), message_text: (string),
+                              source: (string), source_id: (int) }
+
+                the id is the identity of the message: <source key>:<_id>:<timestamp in ms>
+                (see get_source_key). the timestamp tells apart rows of a queue which
+                reuses its ids after it ran empty
+
+                epoche_timestamp is in local time, corrected by the clock offset of <source>
+                all strings are utf-8 encoded
             Returns:
                 message (dict) '''
 
+        timestamp = float(msg["timestamp"])
+
+        if source:
+            message_id = '%s:%d:%d' % (self.get_source_key(source), msg["_id"], int(round(timestamp * 1000)))
+        else:
+            message_id = ''
+
+        # decoded JSON (and the hostnames of the cfg file) are unicode, the
+        # binary format is utf-8. history and status files expect plain strings,
+        # mixing both fails on the first non-ascii character
+        return record_codec.encode_strings(dict([ ('id', message_id ), 
+                                                  ('source', source ), 
+                                                  ('source_id', msg["_id"] ), 
+                                                  ('epoche_timestamp', self.clock_offset.normalize(source, timestamp) ), 
+                                                  ('env', msg["instance"]), 
+                                                  ('job', msg["job"]), 
+                                                  ('event', msg["event"]), 
+                                                  ('message_text', msg["message"]) ]))
+
+
+    def get_source_key(self, source):
+        ''' Returns:
+                key (string) of the hostname <source> in the message ids: 8 hex
+                digits of its crc32. short (the ids are stored with every history
+                entry) and stable across restarts and changes of the cfg file '''
+
+        if source not in self.source_keys:
+            self.source_keys[source] = '%08x' % (zlib.crc32(source) & 0xffffffff)
+
+        return self.source_keys[source]
+
+
+    def get_decoder(self):
+        ''' returns:
+                decoder (obj) for <controller_wire_format> '''
+
+        if self.cfg.controller_wire_format == 'binary':
+            return binary_decoder()
+
+        return message_decoder()
+
+
+    def get_transport(self, host):
+        ''' returns:
+                transport (obj) of <host>, see transport.py '''
+
+        if host['hostname'] not in self.transports:
+            self.transports[host['hostname']] = get_transport(self.cfg, self.logger, host, self)
+
+        return self.transports[host['hostname']]
+
+
+    def get_job_filter(self):
+        ''' returns:
+                the jobs of the cfg file as "message-queue.py --filter" input
+                (JSON array of [instance, job] pairs) or None if
+                <controller_filter_pushdown> is off '''
+
+        if not self.cfg.controller_filter_pushdown:
+            return None
+
+        if self.job_filter is None:
+            self.job_filter = json.dumps(sorted([ list(key) for key in self.job_index ]), separators=(',', ':'))
+
+        return self.job_filter
+
+
+    def is_budget_spent(self, rows, received_bytes, start_time):
+        ''' returns:
+                True if the per cycle drain budget of a host is spent '''
+
+        return rows >= self.cfg.controller_drain_max_rows or \
+               received_bytes >= self.cfg.controller_drain_max_bytes or \
+               time.time() - start_time >= self.cfg.controller_drain_max_sec
+
+
+    def fetch_messages(self, hosts):
+        ''' Takes:
+                hosts (array) of host (dict) as defined in cfg file
+            Desc:
+                runs the fetches of all ssh <hosts> in the fetch loop. stdout is
+                decoded while it arrives, the raw batch is never buffered.
+                hosts with an in-process transport are read directly.
+
+                pages through the queues until they are empty or the per cycle
+                budget of a host (controller_drain_max_rows/_bytes/_sec) is
+                spent. the remaining queue length is kept in <queue_remaining>.
+            Returns:
+                messages (dicts) per host as array of arrays, errors (array) '''
+
+        start_time = time.time()
+        page_size = self.cfg.item['global_config'][0]['job_history_entry_count']
+
+        source_data = [ [] for host in hosts ]
+        received_bytes = [ 0 ] * len(hosts)
+        errors = []
+        budget_spent = []
+
+        pending = []
+        transports = [ self.get_transport(host) for host in hosts ]
+        acks = [ self.pending_acks.setdefault(host['hostname'], []) for host in hosts ]
+
+        for index, host in enumerate(hosts):
+            if transports[index].subprocess:
+                pending.append(index)
+                continue
+
+            error = self.fetch_messages_in_process(host, source_data[index], start_time)
+            if error:
+                errors.append(error)
+
+        # no new pages on shutdown, see fetch_loop
+        while pending and not self.cfg.exit_flag:
+
+            decoders = dict([ (index, self.get_decoder()) for index in pending ])
+            page_rows = dict([ (index, 0) for index in pending ])
+
+            def on_stdout(index, data):
+                received_bytes[index] += len(data)
+                for msg in decoders[index].feed(data):
+                    if '_clock' in msg:
+                        self.clock_offset.add_sample(hosts[index]['hostname'], msg['_clock'], sent, time.time())
+                        continue
+                    # filtered fetch: the messages skipped up to the cursor are acknowledged with this cycle
+                    if '_cursor' in msg:
+                        transports[index].fetched(msg['_cursor'])
+                        acks[index].append(msg['_cursor'])
+                        continue
+                    source_data[index].append(self.get_message_as_dict(msg, hosts[index]['hostname']))
+                    transports[index].fetched(msg['_id'])
+                    acks[index].append(msg['_id'])
+                    page_rows[index] += 1
+
+            commands = []
+            for index in pending:
+                cmd = transports[index].get_fetch_command(page_size)
+                commands.append((index,) + (cmd if isinstance(cmd, tuple) else (cmd,)))
+
+            sent = time.time()
+            results = self.fetch_loop.run(commands, on_stdout)
+            next_pending = []
+
+            for index in pending:
+
+                host = hosts[index]
+                result = results.get(index, {})
+
+                try:
+                    decoders[index].close()
+
+                except ValueError as err:
+                    # a cancelled fetch ends within a message, keep what was complete
+                    if result.get('timed_out'):
+                        self.logger.warning('%s: incomplete data after timeout. %s' % (host['hostname'], err))
+                    else:
+                        errors.append('%s: %s' % (host['hostname'], err))
+                        self.host_health.record_failure(host['hostname'], str(err))
+                        self.queue_remaining[host['hostname']] = -1
+                        continue
+
+                if result.get('timed_out'):
+                    self.host_health.record_failure(host['hostname'], 'fetch timed out after %s sec' % self.cfg.controller_fetch_timeout)
+                    self.queue_remaining[host['hostname']] = -1
+                    continue
+
+                if result.get('rc') != 0:
+                    self.host_health.record_failure(host['hostname'], 'RC: %s %s' % (result.get('rc'), result.get('stderr', '')))
+                    self.queue_remaining[host['hostname']] = -1
+                    continue
+
+                self.host_health.record_success(host['hostname'])
+
+                if page_rows[index] < page_size:
+                    self.queue_remaining[host['hostname']] = 0
+                    continue
+
+                if self.is_budget_spent(len(source_data[index]), received_bytes[index], start_time):
+                    budget_spent.append(index)
+                    continue
+
+                next_pending.append(index)
+
+            pending = next_pending
+
+        if budget_spent:
+            self.get_queue_lengths([ hosts[index] for index in budget_spent ])
+
+        return source_data, errors
+
+
+    def fetch_messages_in_process(self, host, messages, start_time):
+        ''' Takes:
+                host (dict) as defined in cfg file, with an in-process transport
+                messages (array) the messages of <host> are appended to
+                start_time (float) epoche the drain budget started
+            Desc:
+                pages through the queue of <host> like fetch_messages. the queue
+                ids are kept in <pending_acks> until the end of the cycle
+            Returns:
+                error (string), None on success '''
+
+        page_size = self.cfg.item['global_config'][0]['job_history_entry_count']
+        transport = self.get_transport(host)
+        acks = self.pending_acks.setdefault(host['hostname'], [])
+
+        while True:
+
+            try:
+                page = transport.fetch(page_size)
+            except Exception as err:
+                self.host_health.record_failure(host['hostname'], str(err))
+                self.queue_remaining[host['hostname']] = -1
+                return '%s: %s' % (host['hostname'], err)
+
+            for msg in page:
+                messages.append(self.get_message_as_dict(msg, host['hostname']))
+                acks.append(msg['_id'])
+
+            if len(page) < page_size:
+                break
+
+            if self.is_budget_spent(len(messages), 0, start_time):
+                self.get_queue_length(host)
+                self.host_health.record_success(host['hostname'])
+                return None
+
+        self.host_health.record_success(host['hostname'])
+        self.queue_remaining[host['hostname']] = 0
+
+        return None
+
+
+    def get_queue_length(self, host):
+        ''' Desc:
+                updates <queue_remaining> of an in-process <host> and reports it.
+                fetched but unacknowledged messages are still counted '''
+
+        try:
+            self.queue_remaining[host['hostname']] = self.get_transport(host).length()
+        except Exception as err:
+            self.logger.warning('%s: queue length unknown. %s' % (host['hostname'], err))
+            self.queue_remaining[host['hostname']] = -1
+            return
+
+        self.logger.warning('drain budget spent for %s - %d messages in queue' % (
+            host['hostname'], self.queue_remaining[host['hostname']]))
+
+
+    def get_queue_lengths(self, hosts):
+        ''' Desc:
+                updates <queue_remaining> for all <hosts> and reports them '''
+
+        commands = [ (index, self.get_transport(host).get_length_command()) for index, host in enumerate(hosts) ]
+
+        results = self.fetch_loop.run(commands)
+
+        for index, host in enumerate(hosts):
+
+            try:
+                self.queue_remaining[host['hostname']] = int(results[index]['stdout'])
+            except (KeyError, ValueError):
+                self.queue_remaining[host['hostname']] = -1
+                continue
+
+            self.logger.warning('drain budget spent for %s - %d messages remaining in queue' % (
+                host['hostname'], self.queue_remaining[host['hostname']]))
+
+
+    def take_pending_acks(self):
+        ''' Returns:
+                acks (dict) key: hostname, value: queue ids fetched since the last call '''
+
+        acks = self.pending_acks
+        self.pending_acks = dict()
+
+        return acks
+
+
+    def ack_messages(self, acks):
+        ''' Takes:
+                acks (dict) as returned by take_pending_acks
+            Desc:
+                confirms the messages of a cycle to their source hosts,
+                once they are in the job histories '''
+
+        if self.queue_agents:
+            self.queue_agents.ack(acks)
+            return
+
+        for hostname, ids in acks.items():
+
+            if not ids:
+                continue
+
+            try:
+                self.transports[hostname].ack(ids)
+            except Exception as err:
+                # closing the transport delivers the messages again, the dedup window drops them
+                self.logger.error('acknowledging %d messages to %s failed. %s' % (len(ids), hostname, err))
+                self.transports[hostname].close()
+
+
+    def get_data_from_source_host(self, host):
+        ''' Takes:
+                host (dict) as defined in cfg file
+            Returns:
+                messages (dicts) from <host> as array '''
 
-        return dict([ ('id', ''.join(random.choice('0123456789abcdef') for n in xrange(16)) ), 
-                      ('epoche_timestamp', float(msg["timestamp"]) ), 
-                      ('env', msg["instance"]), 
-                      ('job', msg["job"]), 
-                      ('event', msg["event"]), 
-                      ('message_text', msg["message"]) ])
+        source_data, errors = self.fetch_messages([ host ])
+
+        if errors:
+            raise Exception(errors[0])
+
+        return source_data[0]
 
 
     def get_data_from_source_hosts(self):
         ''' Returns:
                 messages (dicts) from all hosts as array
             Desc:
+                fetches from all source hosts due according to the poll
+                scheduler, using the configured fetch engine (controller_fetch_engine).
+                hosts with an open circuit breaker are skipped.
+
                 messages (dict):
-                    { id: (string), epoche_timestamp: (float), env: (string), job: (string), event: (string), message_text: (string) }
+                    { id: (string), epoche_timestamp: (float), env: (string), job: (string), event: (string), message_text: (string),
+                      source: (string), source_id: (int) }
             '''
 
-        source_data = []
+        if self.cfg.controller_fetch_engine == 'agent':
+            source_data = []
+            for hostname, msg in self.queue_agents.collect():
+                source_data.append(self.get_message_as_dict(msg, hostname))
+                self.pending_acks.setdefault(hostname, []).append(msg['_id'])
+            return source_data
 
-        for host in self.cfg.item['source_hosts']:
-            
-            sql_data_str = self.get_sql_data_over_ssh(user=host['user'], 
-                                                      key=host['key'], 
-                                                      host=host['hostname'], 
-                                                      q=host['message_queue'],
-                                                      q_handler=host['message_queue_handler'])['stdout']
-            
-            if sql_data_str:
-            
-                sql_data = eval(sql_data_str)
+        hosts = []
+
+        for host in self.poll_scheduler.get_due_hosts(self.cfg.item['source_hosts']):
+
+            if self.host_health.allow(host['hostname']):
+                hosts.append(host)
+            else:
+                # not due again before its backoff has passed
+                self.poll_scheduler.postpone(host['hostname'], self.host_health.get_open_until(host['hostname']))
+
+        if self.cfg.controller_fetch_engine == 'event_loop':
+            host_data, errors = self.get_data_from_source_hosts_event_loop(hosts)
+        else:
+            host_data, errors = self.get_data_from_source_hosts_pooled(hosts)
+
+        source_data = []
 
-                for msg in sql_data:
-                                
-                    source_data.append(self.get_message_as_dict(msg))
+        for host, messages in zip(hosts, host_data):
+            self.poll_scheduler.update(host['hostname'], len(messages), self.queue_remaining.get(host['hostname'], 0))
+            source_data.extend(messages)
 
-                # self.delete_sql_data_over_ssh(src_user=host['user'], 
-                #                               src_key=host['key'], 
-                #                               src_host=host['hostname'], 
-                #                               src_db=host['file'])
+        # failing hosts are handled by their circuit breakers, the others keep going
+        for error in errors:
+            self.logger.error('data load from source host failed. %s' % error)
 
         return source_data
 
 
-    def fetch_new_messages(self, job, message_stack):
+    def get_data_from_source_hosts_event_loop(self, hosts):
+        ''' Takes:
+                hosts (array) of host (dict) as defined in cfg file
+            Returns:
+                messages (dicts) per host as array of arrays, errors (array)
+            Desc:
+                runs the fetches of all <hosts> from a single thread
+                using fetch_loop. hosts exceeding <controller_fetch_timeout_in_sec>
+                are cancelled for this cycle. '''
+
+        return self.fetch_messages(hosts)
+
+
+    def get_data_from_source_hosts_pooled(self, hosts):
+        ''' Takes:
+                hosts (array) of host (dict) as defined in cfg file
+            Returns:
+                messages (dicts) per host as array of arrays, errors (array)
+            Desc:
+                fetches from all <hosts> at once using a bounded pool
+                of <controller_data_load_workers> threads. '''
+
+        results = [ [] for host in hosts ]
+        errors = []
+
+        host_queue = Queue.Queue()
+        for index, host in enumerate(hosts):
+            host_queue.put((index, host))
+
+        def worker():
+            while True:
+                try:
+                    index, host = host_queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    host_data, host_errors = self.fetch_messages([ host ])
+                    results[index] = host_data[0]
+                    errors.extend(host_errors)
+                except Exception as err:
+                    errors.append('%s: %s' % (host['hostname'], err))
+
+        workers = []
+        for n in xrange(max(1, min(self.cfg.controller_data_load_workers, len(hosts)))):
+            t = threading.Thread(target=worker, name='%s-loader-%d' % (self.cfg.me, n))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+
+        for t in workers:
+            t.join()
+
+        return results, errors
+
+
+    def route_messages(self, message_stack):
         ''' takes:
-                job (dict) as defined in cfg file
-                message_stack (array, containing messages as array)
+                message_stack (array, containing messages as dict)
             desc:
-                sorts out messages relevant to <job>
-                message format: [str(<id>), float(<epoche_timestamp>), str(<environment>), str(<job>), str(<event>), str(<message_text>)]
+                groups the messages by (env, job) in one pass. messages for jobs
+                not defined in the cfg file are counted in <unknown_messages>
+                and reported.
             returns:
-                new messages (array) '''
+                message index (dict): (env, job) -> messages (array) '''
 
-        new_messages = []
+        message_index = dict()
+        unknown = dict()
 
         for message in message_stack:
-            
-            if job['env'] != message['env'] or job['name'] != message['job']:
+
+            key = (message['env'], message['job'])
+
+            if key in self.job_index:
+                message_index.setdefault(key, []).append(message)
+            else:
+                unknown[key] = unknown.get(key, 0) + 1
+
+        for key, count in unknown.items():
+            self.unknown_messages[key] = self.unknown_messages.get(key, 0) + count
+
+        if unknown:
+            self.logger.info('%d messages for jobs not in cfg file: %s' % (
+                sum(unknown.values()),
+                ', '.join([ '%s__%s (%d)' % (job, env, count) for (env, job), count in sorted(unknown.items()) ])))
+
+        return message_index
+
+
+    def fetch_new_messages(self, job, message_index):
+        ''' takes:
+                job (dict) as defined in cfg file
+                message_index (dict) as returned by route_messages
+            returns:
+                new messages (array) relevant to <job> '''
+
+        return message_index.get((job['env'], job['name']), [])
+
+
+    def wait_for_next_cycle(self):
+        ''' Desc:
+                sleeps until the next source host is due, at most <controller_interval>:
+                the rulers detect timeouts once per cycle, even if no host is due.
+                agents push their messages, so in agent mode the next cycle starts
+                as soon as a message arrives '''
+
+        if self.queue_agents:
+            self.queue_agents.wait(self.cfg.controller_interval)
+        else:
+            time.sleep(min(self.cfg.controller_interval,
+                           self.poll_scheduler.get_time_to_next_poll(self.cfg.item['source_hosts'])))
+
+
+    def fetch_cycle(self):
+        ''' Desc:
+                first stage of a cycle, fetches the messages of all due source hosts
+            Returns:
+                cycle (dict): message_stack (array), acks (dict), start_time, fetch_duration (float) '''
+
+        start_time = time.time()
+
+        message_stack = self.get_data_from_source_hosts()
+
+        return dict([ ('message_stack', message_stack),
+                      ('acks', self.take_pending_acks()),
+                      ('start_time', start_time),
+                      ('fetch_duration', time.time() - start_time) ])
+
+
+    def process_cycle(self, jobs, cycle, flush=False):
+        ''' Takes:
+                jobs (array) of job (dict) as defined in cfg file
+                cycle (dict) as returned by fetch_cycle
+                (optional) flush (bool) empty the reorder buffers
+            Desc:
+                second stage of a cycle, feeds the messages of <cycle> through
+                the reorder buffers to the job histories and rulers and
+                acknowledges them afterwards '''
+
+        start_time = time.time()
+
+        message_index = self.route_messages(self.dedup_window.filter(cycle['message_stack']))
+
+        for job in jobs:
+
+            job['reorder'].add(self.fetch_new_messages(job, message_index))
+            new_messages = job['reorder'].release(flush=flush)
+
+            self.logger.debug('%s__%s (%s):' % (job['name'], job['env'], job['cyclic_or_daily']))
+            self.logger.debug('-------------------------------' )
+
+            if self.cfg.log_level == 'debug':
+                
+                import traceback
+                
+                try:
+                    job['history'].interpret_new_messages(new_messages)
+                    job['ruler'].compute_status(job['history'].get_status())
+                
+                except Exception:
+                    traceback.print_exc()
+                    sys.exit(1)
+
+            else:
+                job['history'].interpret_new_messages(new_messages)
+                job['ruler'].compute_status(job['history'].get_status())
+
+        # a history failing to be written is retried here, with every cycle
+        written = not [ job for job in jobs if not job['history'].commit() ]
+
+        # one transaction per cycle
+        if self.cfg.history_backend == 'sqlite':
+            written = get_database(self.cfg, self.logger).commit() and written
+
+        process_duration = time.time() - start_time
+
+        # all released messages of this cycle are in the job histories now
+        self.ack_messages(self.hold_back_acks(jobs, cycle['acks'], written))
+
+        # time from fetching to acknowledging, the delay a message can have
+        self.cfg.controller_run_duration = time.time() - cycle['start_time']
+
+        self.logger.debug('%s::run::controller_run_duration                = %s sec (fetch: %.3f, process: %.3f, ack: %.3f)' % (
+            __name__, self.cfg.controller_run_duration, cycle['fetch_duration'], process_duration,
+            time.time() - start_time - process_duration))
+
+
+    def hold_back_acks(self, jobs, acks, written=True):
+        ''' Takes:
+                jobs (array) of job (dict) as defined in cfg file
+                acks (dict) as returned by take_pending_acks
+                (optional) written (bool) False if a job history failed to be written
+            Desc:
+                messages still in a reorder buffer are not in the job history yet.
+                per source host only ids below the oldest held message are
+                acknowledged, the others are deferred to a later cycle.
+                nothing is acknowledged while a job history fails to be written.
+            Returns:
+                acks (dict) ready to be acknowledged '''
+
+        for hostname, ids in acks.items():
+            self.deferred_acks.setdefault(hostname, []).extend(ids)
+
+        if not written:
+            self.logger.error('job histories not written - holding back the acknowledgements of %d messages' % (
+                sum([ len(ids) for ids in self.deferred_acks.values() ])))
+            return dict()
+
+        # key: hostname, value: lowest queue id still held
+        held = dict()
+
+        for job in jobs:
+            for message in job['reorder'].get_held_messages():
+                if message['source']:
+                    held[message['source']] = min(held.get(message['source'], message['source_id']), message['source_id'])
+
+        ready = dict()
+
+        for hostname, ids in self.deferred_acks.items():
+
+            if hostname not in held:
+                ready[hostname] = ids
+                del self.deferred_acks[hostname]
                 continue
-            
-            new_messages.append(message)
 
-        return new_messages
+            ready[hostname] = [ i for i in ids if i < held[hostname] ]
+            self.deferred_acks[hostname] = [ i for i in ids if i >= held[hostname] ]
+
+        return ready
+
+
+    def flush_reorder_buffers(self, jobs):
+        ''' Desc:
+                writes the messages held in the reorder buffers before exiting '''
+
+        if not [ job for job in jobs if job['reorder'].get_held_messages() ]:
+            return
+
+        self.process_cycle(jobs, dict([ ('message_stack', []),
+                                        ('acks', dict()),
+                                        ('start_time', time.time()),
+                                        ('fetch_duration', 0.0) ]), flush=True)
+
+
+    def run_fetcher(self, cycles, taken):
+        ''' Takes:
+                cycles (Queue) of size 1, receives the fetched cycles
+                taken (Event) set by the processing thread when it takes a cycle
+            Desc:
+                fetch thread of the pipelined mode. fetches the next cycle while
+                the previous one is processed, but never more than one ahead '''
+
+        while not self.cfg.exit_flag:
+
+            try:
+                cycle = self.fetch_cycle()
+            except Exception as err:
+                cycle = dict([ ('error', err) ])
+
+            cycles.put(cycle)
+
+            if 'error' in cycle:
+                return
+
+            while not taken.wait(1):
+                if self.cfg.exit_flag:
+                    return
+            taken.clear()
+
+            self.wait_for_next_cycle()
 
 
     def run(self):
@@ -235,7 +919,15 @@ class Controller():
             returning from this function will terminate the process '''
 
         self.logger.info('========= %s started =========' % self.cfg.me)
+
+        self.setup()
         
+        if self.cfg.controller_ssh_multiplexing:
+            self.ssh_masters = ssh_master_pool(self.cfg, self.logger)
+
+        if self.cfg.controller_fetch_engine == 'agent':
+            self.queue_agents = queue_agent_pool(self.cfg, self.logger, self.get_ssh_command)
+
         # initialize the jobs
         jobs = []
 
@@ -245,56 +937,80 @@ class Controller():
 
             job['ruler'] = job_ruler.checkmk(self.cfg, self.logger, job)
 
+            job['reorder'] = reorder_buffer(self.cfg, self.logger, job)
+
             jobs.append(job)
 
+            self.job_index.add((job['env'], job['name']))
+
+        # pipelined: cycle N+1 is fetched while cycle N is processed
+        if self.cfg.controller_pipeline:
+            cycles = Queue.Queue(maxsize=1)
+            taken = threading.Event()
+            fetcher = threading.Thread(target=self.run_fetcher, args=(cycles, taken), name='%s-fetcher' % self.cfg.me)
+            fetcher.daemon = True
+            fetcher.start()
+
 
         while True:
             
-            start_time = time.time()
-
             signal.signal(signal.SIGTERM, self.sig_handler)
+            signal.signal(signal.SIGHUP, self.sighup_handler)
             
             if self.cfg.exit_flag:
 
-                self.cleanup()
-                return
-            
-            try:
-                message_stack = self.get_data_from_source_hosts()
-            except Exception as err:
-                # msg = 'corrupt message stack. clear message db on source hosts.'
-                self.logger.error(err)
-                print '[ERROR] %s exiting.' % err
-                sys.exit(1)
-
-
-            self.logger.debug('%s::run::controller_run_duration                = %s sec' % (__name__, self.cfg.controller_run_duration))
-
-            for job in jobs:
+                if self.cfg.controller_pipeline:
+                    # let a running fetch finish before its connections are closed
+                    fetcher.join(self.cfg.controller_fetch_timeout)
 
-                new_messages = self.fetch_new_messages(job, message_stack)                
-
-                self.logger.debug('%s__%s (%s):' % (job['name'], job['env'], job['cyclic_or_daily']))
-                self.logger.debug('-------------------------------' )
-
-                if self.cfg.log_level == 'debug':
-                    
-                    import traceback
-                    
+                    # a cycle fetched ahead is not fetched again (protocol "remove"
+                    # deleted its messages on the source hosts already)
                     try:
-                        job['history'].interpret_new_messages(new_messages)
-                        job['ruler'].compute_status(job['history'].get_status())
-                    
-                    except Exception:
-                        traceback.print_exc()
-                        sys.exit(1)
-
-                else:
-                    job['history'].interpret_new_messages(new_messages)
-                    job['ruler'].compute_status(job['history'].get_status())
+                        cycle = cycles.get_nowait()
+                    except Queue.Empty:
+                        pass
+                    else:
+                        if 'error' not in cycle:
+                            self.process_cycle(jobs, cycle)
 
-                
+                self.flush_reorder_buffers(jobs)
 
-            self.cfg.controller_run_duration = time.time() - start_time
+                for job in jobs:
+                    job['history'].close()
 
-            time.sleep(self.cfg.controller_interval)
+                self.cleanup()
+                return
+            
+            if self.cfg.controller_pipeline:
+                try:
+                    cycle = cycles.get(timeout=1)
+                except Queue.Empty:
+                    continue
+
+                taken.set()
+
+                if 'error' in cycle:
+                    self.logger.error(cycle['error'])
+                    print '[ERROR] %s exiting.' % cycle['error']
+                    sys.exit(1)
+
+            else:
+                try:
+                    cycle = self.fetch_cycle()
+                except Exception as err:
+                    # msg = 'corrupt message stack. clear message db on source hosts.'
+                    self.logger.error(err)
+                    print '[ERROR] %s exiting.' % err
+                    sys.exit(1)
+
+            if self.history_invalidated:
+                self.history_invalidated = False
+                self.logger.info('SIGHUP - reading job histories from files')
+
+                for job in jobs:
+                    job['history'].invalidate()
+
+            self.process_cycle(jobs, cycle)
+
+            if not self.cfg.controller_pipeline:
+                self.wait_for_next_cycle()
@@ -0,0 +1,212 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    decoder
+Description:
+    incremental decoders for the output of message-queue.py.
+
+    message_decoder accepts a JSON array of messages as well as newline
+    delimited JSON (one message per line). binary_decoder reads the compact
+    framed batches of "message-queue.py -o binary". data can be fed in
+    chunks of any size, every message is returned as soon as it is complete.
+
+    the clock record of "message-queue.py --clock" is returned as
+    { "_clock": (float) }, the cursor record of "message-queue.py --filter"
+    as { "_cursor": (int) } by both decoders.
+'''
+
+import json
+import struct
+
+
+class message_decoder():
+
+    # characters allowed between two messages
+    separators = ' \t\r\n[],'
+
+    def __init__(self):
+
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+
+
+    def feed(self, data):
+        ''' Takes:
+                data (string) next chunk of the stream
+            Returns:
+                messages (dicts) completed by <data> as array '''
+
+        self.buffer += data
+
+        messages = []
+        pos = 0
+        end = len(self.buffer)
+
+        while True:
+
+            while pos < end and self.buffer[pos] in self.separators:
+                pos += 1
+
+            if pos == end:
+                break
+
+            try:
+                msg, pos = self.json_decoder.raw_decode(self.buffer, pos)
+            except ValueError:
+                # incomplete message, wait for the next chunk
+                break
+
+            messages.append(msg)
+
+        self.buffer = self.buffer[pos:]
+
+        return messages
+
+
+    def close(self):
+        ''' Desc:
+                ends the stream
+            Raises:
+                ValueError if the stream ended within a message '''
+
+        rest = self.buffer.strip(self.separators)
+        self.buffer = ''
+
+        if rest:
+            raise ValueError('incomplete or invalid message data: %s' % rest[:100])
+
+
+class binary_decoder():
+    ''' batch layout (see encode_binary in message-queue.py):
+          clock frame:  magic "JTC1", epoche (double), optional before a batch
+          cursor frame: magic "JTK1", id (uint64), optional after a batch
+          header:       magic "JTB1", item count (uint32)
+          string table: count (uint16), per string: length (uint16), utf-8 bytes
+          per item:     id (uint64), timestamp (double), instance, job, event
+                        (uint16 string table index), message length (uint32),
+                        utf-8 bytes '''
+
+    magic = 'JTB1'
+    header = struct.Struct('!4sI')
+    clock = struct.Struct('!4sd')
+    cursor = struct.Struct('!4sQ')
+
+    # control frames between batches, magic -> (key, struct)
+    control_frames = dict([ ('JTC1', ('_clock', clock)),
+                            ('JTK1', ('_cursor', cursor)) ])
+    short = struct.Struct('!H')
+    item = struct.Struct('!QdHHHI')
+
+    def __init__(self):
+
+        self.buffer = ''
+        self.items_left = 0
+        self.strings_left = None
+        self.strings = []
+
+
+    def feed(self, data):
+        ''' Takes:
+                data (string) next chunk of the stream
+            Returns:
+                messages (dicts) completed by <data> as array
+            Raises:
+                ValueError on a corrupt stream '''
+
+        self.buffer += data
+
+        messages = []
+        buf = self.buffer
+        pos = 0
+        end = len(buf)
+
+        while True:
+
+            # control frame
+            if self.strings_left is None and buf[pos:pos + 4] in self.control_frames:
+                key, frame = self.control_frames[buf[pos:pos + 4]]
+                if end - pos < frame.size:
+                    break
+                messages.append(dict([ (key, frame.unpack_from(buf, pos)[1]) ]))
+                pos += frame.size
+                continue
+
+            # batch header
+            if self.items_left == 0 and self.strings_left is None:
+                if end - pos < self.header.size:
+                    break
+                magic, self.items_left = self.header.unpack_from(buf, pos)
+                if magic != self.magic:
+                    raise ValueError('invalid batch header: %r' % buf[pos:pos + self.header.size])
+                pos += self.header.size
+                self.strings_left = -1
+                self.strings = []
+
+            # string table
+            if self.strings_left == -1:
+                if end - pos < self.short.size:
+                    break
+                self.strings_left = self.short.unpack_from(buf, pos)[0]
+                pos += self.short.size
+
+            while self.strings_left > 0:
+                if end - pos < self.short.size:
+                    break
+                length = self.short.unpack_from(buf, pos)[0]
+                if end - pos < self.short.size + length:
+                    break
+                pos += self.short.size
+                self.strings.append(buf[pos:pos + length])
+                pos += length
+                self.strings_left -= 1
+
+            if self.strings_left > 0:
+                break
+
+            # items
+            while self.items_left > 0:
+                if end - pos < self.item.size:
+                    break
+                _id, timestamp, instance, job, event, length = self.item.unpack_from(buf, pos)
+                if end - pos < self.item.size + length:
+                    break
+                pos += self.item.size
+
+                try:
+                    messages.append(dict([ ('_id', _id),
+                                           ('timestamp', timestamp),
+                                           ('instance', self.strings[instance]),
+                                           ('job', self.strings[job]),
+                                           ('event', self.strings[event]),
+                                           ('message', buf[pos:pos + length]) ]))
+                except IndexError:
+                    raise ValueError('invalid string table reference in batch')
+
+                pos += length
+                self.items_left -= 1
+
+            if self.items_left > 0:
+                break
+
+            # batch complete, the next one may follow
+            self.strings_left = None
+
+        self.buffer = buf[pos:]
+
+        return messages
+
+
+    def close(self):
+        ''' Desc:
+                ends the stream
+            Raises:
+                ValueError if the stream ended within a batch '''
+
+        rest = len(self.buffer)
+        incomplete = self.items_left > 0 or self.strings_left is not None
+
+        self.buffer = ''
+        self.items_left = 0
+        self.strings_left = None
+
+        if rest or incomplete:
+            raise ValueError('incomplete binary batch (%d bytes left)' % rest)
@@ -0,0 +1,112 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    dedup_window
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    drops messages seen before, before they reach the job histories
+
+    remembers the keys of the messages of the last <controller_dedup_window_sec>
+    seconds, at most <controller_dedup_window_entries> keys (oldest are evicted).
+
+    a message is a duplicate if
+        - its identity (source host, queue id) was seen before (re-delivery)
+        - the same event of the same job with the same text was seen within
+          <controller_dedup_content_tolerance_sec> (reported by two source hosts).
+          off by default, it also drops legitimate repetitions
+'''
+
+import time
+from collections import OrderedDict
+
+
+class dedup_window():
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+
+        self.max_entries = self.cfg.controller_dedup_window_entries
+        self.max_age = self.cfg.controller_dedup_window_sec
+        self.tolerance = self.cfg.controller_dedup_content_tolerance
+
+        # key -> epoche (float) the key was added, oldest first
+        self.seen = OrderedDict()
+
+        self.checked = 0
+        self.identity_hits = 0
+        self.content_hits = 0
+
+
+    def get_content_keys(self, message):
+        ''' returns:
+                content key of <message> and the keys of the neighbouring time buckets '''
+
+        bucket = int(message['epoche_timestamp'] // self.tolerance)
+
+        return [ ('content', message['env'], message['job'], message['event'], message['message_text'], b)
+                 for b in (bucket, bucket - 1, bucket + 1) ]
+
+
+    def add(self, key, now):
+
+        self.seen.pop(key, None)
+        self.seen[key] = now
+
+
+    def expire(self, now):
+
+        while self.seen:
+            key, added = next(self.seen.iteritems())
+            if len(self.seen) <= self.max_entries and added >= now - self.max_age:
+                break
+            del self.seen[key]
+
+
+    def filter(self, message_stack):
+        ''' Takes:
+                message_stack (array, containing messages as dict)
+            Returns:
+                message_stack (array) without duplicates '''
+
+        now = time.time()
+        self.expire(now)
+
+        new_messages = []
+        identity_hits = 0
+        content_hits = 0
+
+        for message in message_stack:
+
+            self.checked += 1
+
+            if message['id'] and message['id'] in self.seen:
+                identity_hits += 1
+                continue
+
+            if message['id']:
+                self.add(message['id'], now)
+
+            if self.tolerance > 0:
+                content_keys = self.get_content_keys(message)
+
+                if [ key for key in content_keys if key in self.seen ]:
+                    content_hits += 1
+                    continue
+
+                self.add(content_keys[0], now)
+
+            new_messages.append(message)
+
+        self.expire(now)
+
+        self.identity_hits += identity_hits
+        self.content_hits += content_hits
+
+        if identity_hits or content_hits:
+            self.logger.info('dedup_window - dropped %d re-delivered and %d doubled messages (total: %d / %d of %d, window: %d keys)' % (
+                identity_hits, content_hits, self.identity_hits, self.content_hits, self.checked, len(self.seen)))
+
+        return new_messages
@@ -0,0 +1,247 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    fetch_loop
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    single threaded event loop running many shell commands at once.
+    the output pipes of all commands are multiplexed with poll(), so the
+    number of fetches in flight is not bound to the number of threads.
+
+    stdout can be handed over chunk by chunk as it arrives instead of being
+    buffered. stdin data is written as the command reads it, a large input
+    does not block the loop. every command has its own deadline, commands
+    exceeding it are killed.
+
+    once the exit flag is set no further commands are started, the running
+    ones finish up to their deadline: "message-queue.py remove" deleted its
+    messages already, they would be lost. with <controller_queue_protocol>
+    "cursor" nothing is lost, the running commands are cancelled right away.
+'''
+
+import os
+import time
+import errno
+import fcntl
+import select
+from subprocess import Popen, PIPE
+
+
+class fetch_loop():
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.devnull = open(os.devnull, 'r')
+
+
+    def start(self, key, cmd, data=None):
+        ''' takes:
+                (optional) data (string) written to stdin of the command
+            returns:
+                fetch (dict) or None if the command could not be started '''
+
+        try:
+            p = Popen(cmd, shell=True, stdin=self.devnull if data is None else PIPE,
+                      stdout=PIPE, stderr=PIPE, close_fds=True)
+
+            # written by run() whenever the pipe has room, see write_stdin
+            if data is not None:
+                fcntl.fcntl(p.stdin, fcntl.F_SETFL, fcntl.fcntl(p.stdin, fcntl.F_GETFL) | os.O_NONBLOCK)
+        except Exception as err:
+            self.logger.error('fetch_loop - running %s failed. %s' % (cmd, err))
+            return None
+
+        return dict([ ('key', key),
+                      ('cmd', cmd),
+                      ('process', p),
+                      ('deadline', time.time() + self.cfg.controller_fetch_timeout),
+                      ('stdout', []),
+                      ('stderr', []),
+                      ('stdin', data),
+                      ('stdin_offset', 0),
+                      ('stdin_fd', None if data is None else p.stdin.fileno()),
+                      ('open_fds', 2) ])
+
+
+    def write_stdin(self, fetch):
+        ''' Desc:
+                writes as much of the stdin data of <fetch> as the pipe takes
+            Returns:
+                True once all of it is written or the command closed its stdin '''
+
+        try:
+            written = os.write(fetch['stdin_fd'], fetch['stdin'][fetch['stdin_offset']:fetch['stdin_offset'] + 65536])
+        except OSError as err:
+            if err.errno == errno.EAGAIN:
+                return False
+
+            # EPIPE: the command exited without reading all of it
+            self.logger.warning('fetch_loop - writing stdin of %s failed. %s' % (fetch['cmd'], err))
+            return True
+
+        fetch['stdin_offset'] += written
+
+        return fetch['stdin_offset'] >= len(fetch['stdin'])
+
+
+    def close_stdin(self, fetch, poller, in_flight):
+
+        if fetch['stdin_fd'] is None:
+            return
+
+        poller.unregister(fetch['stdin_fd'])
+        del in_flight[fetch['stdin_fd']]
+        fetch['stdin_fd'] = None
+        fetch['process'].stdin.close()
+
+
+    def finish(self, fetch, results, timed_out=False):
+
+        p = fetch['process']
+
+        if timed_out:
+            try:
+                p.kill()
+            except OSError:
+                pass
+
+        for stream in (p.stdin, p.stdout, p.stderr):
+            if stream and not stream.closed:
+                stream.close()
+
+        rc = p.wait()
+
+        results[fetch['key']] = dict([ ('stdout', ''.join(fetch['stdout']).rstrip()),
+                                       ('stderr', ''.join(fetch['stderr']).rstrip()),
+                                       ('rc', rc),
+                                       ('timed_out', timed_out) ])
+
+        if timed_out:
+            self.logger.error('fetch_loop - command timed out after %s sec: %s' % (self.cfg.controller_fetch_timeout, fetch['cmd']))
+
+        elif rc != 0:
+            self.logger.error('fetch_loop - failed command: %s' % fetch['cmd'])
+            self.logger.error('fetch_loop - error stack (RC: %d) %s' % (rc, results[fetch['key']]['stderr']))
+
+
+    def run(self, commands, on_stdout=None):
+        ''' Takes:
+                commands (array) of (key, cmd) or (key, cmd, stdin data) tuples
+                (optional) on_stdout (func) called as on_stdout(key, data)
+                           for every chunk of stdout
+            Desc:
+                runs all <commands> with at most <controller_max_fetches_in_flight>
+                of them in flight at the same time
+            Returns:
+                results (dict): key -> dict (stdout, stderr, rc, timed_out)
+                stdout is empty if <on_stdout> is given '''
+
+        results = dict()
+        pending = list(reversed(commands))
+        in_flight = dict()   # fd -> fetch
+        running = 0
+        poller = select.poll()
+
+        while pending or in_flight:
+
+            if self.cfg.exit_flag:
+
+                # unacknowledged messages stay in the queues, cancel everything
+                if self.cfg.controller_queue_protocol == 'cursor':
+                    for fetch in in_flight.values():
+                        if fetch['key'] not in results:
+                            self.finish(fetch, results, timed_out=True)
+                    return results
+
+                del pending[:]
+
+            while pending and running < self.cfg.controller_max_fetches_in_flight:
+
+                command = pending.pop()
+                key = command[0]
+                fetch = self.start(*command)
+
+                if fetch is None:
+                    results[key] = dict([ ('stdout', ''), ('stderr', ''), ('rc', -1), ('timed_out', False) ])
+                    continue
+
+                running += 1
+
+                for stream in (fetch['process'].stdout, fetch['process'].stderr):
+                    in_flight[stream.fileno()] = fetch
+                    poller.register(stream.fileno(), select.POLLIN | select.POLLPRI)
+
+                if fetch['stdin_fd'] is not None:
+                    in_flight[fetch['stdin_fd']] = fetch
+                    poller.register(fetch['stdin_fd'], select.POLLOUT)
+
+            if not in_flight:
+                continue
+
+            now = time.time()
+            next_deadline = min([ fetch['deadline'] for fetch in in_flight.values() ])
+
+            # the exit flag is checked at least once a second
+            try:
+                events = poller.poll(min(1000, max(0, int((next_deadline - now) * 1000)) + 1))
+            except select.error:
+                # interrupted by a signal
+                continue
+
+            for fd, event in events:
+
+                fetch = in_flight.get(fd)
+                if fetch is None:
+                    continue
+
+                if fd == fetch['stdin_fd']:
+                    # POLLERR/POLLHUP: the command closed its stdin
+                    if not event & select.POLLOUT or self.write_stdin(fetch):
+                        self.close_stdin(fetch, poller, in_flight)
+                    continue
+
+                data = os.read(fd, 65536)
+
+                if data:
+                    if fd != fetch['process'].stdout.fileno():
+                        fetch['stderr'].append(data)
+                    elif on_stdout:
+                        on_stdout(fetch['key'], data)
+                    else:
+                        fetch['stdout'].append(data)
+                    continue
+
+                # EOF
+                poller.unregister(fd)
+                del in_flight[fd]
+                fetch['open_fds'] -= 1
+
+                if fetch['open_fds'] == 0:
+                    self.close_stdin(fetch, poller, in_flight)
+                    self.finish(fetch, results)
+                    running -= 1
+
+            # kill commands beyond their deadline
+            now = time.time()
+            for fd, fetch in in_flight.items():
+
+                # or already dropped with the stdin of its command
+                if fetch['deadline'] > now or fd not in in_flight:
+                    continue
+
+                if fd == fetch['stdin_fd']:
+                    self.close_stdin(fetch, poller, in_flight)
+                    continue
+
+                poller.unregister(fd)
+                del in_flight[fd]
+
+                if fetch['key'] not in results:
+                    self.close_stdin(fetch, poller, in_flight)
+                    self.finish(fetch, results, timed_out=True)
+                    running -= 1
+
+        return results
@@ -4,34 +4,68 @@ Module:
 
 Takes:
     filename (string)
+    (optional) sort_key (string) entries are ordered by, default: epoche_until
+    (optional) readonly (bool) a missing file is not created
 
 Description:
     creates/handles a file with given dict entries
 
     .file       filename (string)
+
+    the file is append-only: a new entry is one line appended to the end.
+    read_content() returns the entries sorted by <sort_key> (newest first),
+    limited to <job_history_entry_count>.
+
+    the file is compacted (sorted, trimmed to <job_history_entry_count>,
+    written to a temporary file renamed over the old one) as soon as
+    <history_compaction_records> entries or <history_compaction_bytes>
+    were appended since the last compaction.
+
+    record format: see record_codec
 '''
 
 import os
-import random
+import time
+import itertools
 from operator import itemgetter
 from collections import OrderedDict
 
+# job_tracker
+import record_codec
+
+# ids are unique within the process, no need for random numbers
+_id_counter = itertools.count()
+
+
+def get_new_id():
+
+    return '%013x%03x' % (int(time.time() * 1000000), _id_counter.next() & 0xfff)
+
+
 class filer():
 
-    def __init__(self, cfg, logger, filename):
+    def __init__(self, cfg, logger, filename, sort_key='epoche_until', readonly=False):
 
         self.cfg = cfg
         self.logger = logger
         self.file = filename
+        self.sort_key = sort_key
+
+        # entries/bytes appended since the last compaction. an existing
+        # file is compacted with the first write
+        self.appended_records = self.cfg.history_compaction_records
+        self.appended_bytes = 0
 
-        if not os.path.exists(self.file):
+        if not os.path.exists(self.file) and not readonly:
             self.init_file()
+            self.appended_records = 0
 
 
     def init_file(self):
         
         try:
-            open(self.file, 'a').close()
+            with open(self.file, 'a') as f_stream:
+                f_stream.write(record_codec.encode_header())
         
         except Exception as err:
             self.logger.warning('unable to init %s. %s' % (self.file, err))
@@ -39,7 +73,7 @@ class filer():
 
     def get_new_id(self):
 
-        return ''.join(random.choice('0123456789abcdef') for n in xrange(16))
+        return get_new_id()
 
 
     def get_last_statement(self):
@@ -52,43 +86,127 @@ class filer():
             return dict()
 
 
-    def read_content(self):
+    def read_content(self, since=None, until=None):
+        ''' Takes:
+                (optional) since, until (float) range of <sort_key>
+            Returns:
+                entries (dicts) as array, sorted by <sort_key> newest first,
+                at most <job_history_entry_count> '''
         
         content = []
 
         try:
             with open(self.file, 'r') as f_stream:
-                for line in f_stream.readlines():
-                    line = dict(eval(line.rstrip()))
-                    content.append(line)
+                content = record_codec.decode_records(f_stream.readlines(), self.logger)
         
         except Exception as err:
             self.logger.warning('unable to read %s. %s' % (self.file, err))
 
-        return content
+        if since is not None:
+            content = [ line for line in content if line[self.sort_key] >= since ]
 
+        if until is not None:
+            content = [ line for line in content if line[self.sort_key] < until ]
 
-    def write_statement(self, statement, sort_key):
-        
-        line_counter = 1
-        
-        content_old = self.read_content()
-        content_old.append(statement)
+        # stable: of entries with the same key the first written comes first
+        content.sort(key=itemgetter(self.sort_key), reverse=True)
+
+        return content[:self.cfg.item['global_config'][0]['job_history_entry_count']]
 
-        content_new = sorted(content_old, key=itemgetter(sort_key), reverse=True)
+
+    def write_statement(self, statement, content=None):
+
+        return self.write_statements([ statement ], content)
+
+
+    def write_statements(self, statements, content=None):
+        ''' Takes:
+                statements (array) of dicts, appended with one write
+                (optional) content (array) as read_content() would return it
+                           after <statements> were written, saves reading the
+                           file for a compaction
+            Returns:
+                True if <statements> were written '''
+
+        data = ''.join([ record_codec.encode_record(statement) for statement in statements ])
 
         try:
-            with open(self.file, 'w') as f_stream:
-                
-                for line in content_new:
-                    
-                    if line_counter <= self.cfg.item['global_config'][0]['job_history_entry_count']:
-                        f_stream.write('%s\n' % line)
-                        line_counter += 1
-                    
-                    else:
-                        break
-                    
+            with open(self.file, 'a') as f_stream:
+                f_stream.write(data)
+
         except Exception as err:
             self.logger.warning('unable to write %s. %s' % (self.file, err))
+            return False
+
+        self.appended_records += len(statements)
+        self.appended_bytes += len(data)
+
+        if self.appended_records >= self.cfg.history_compaction_records or \
+           self.appended_bytes >= self.cfg.history_compaction_bytes:
+            self.compact(content)
+
+        return True
+
+
+    def compact(self, content=None):
+        ''' Desc:
+                rewrites the file sorted and trimmed to <job_history_entry_count>.
+                the new content is written to a temporary file first and renamed
+                over the old one, a crash leaves either the old or the new file '''
+
+        if content is None:
+            content = self.read_content()
+        tmp_file = '%s.tmp' % self.file
+
+        try:
+            with open(tmp_file, 'w') as f_stream:
+                f_stream.write(record_codec.encode_header())
+
+                # oldest first, new entries are appended in order
+                for line in sorted(content, key=itemgetter(self.sort_key)):
+                    f_stream.write(record_codec.encode_record(line))
+
+                f_stream.flush()
+                os.fsync(f_stream.fileno())
+
+            os.rename(tmp_file, self.file)
+
+        except Exception as err:
+            self.logger.warning('unable to compact %s. %s' % (self.file, err))
+            return
+
+        self.logger.debug('filer - compacted %s: %d entries' % (self.file, len(content)))
+
+        self.appended_records = 0
+        self.appended_bytes = 0
+
+
+    def migrate(self):
+        ''' Desc:
+                converts a file of an older record format to the current one '''
+
+        try:
+            with open(self.file, 'r') as f_stream:
+                first_line = f_stream.readline()
+
+            version = record_codec.get_version([ first_line ] if first_line else [])
+
+        except Exception as err:
+            self.logger.warning('unable to read %s. %s' % (self.file, err))
+            return
+
+        if version == record_codec.VERSION:
+            return
+
+        if version > record_codec.VERSION:
+            self.logger.warning('filer - %s has an unknown record format version %s' % (self.file, version))
+            return
+
+        self.logger.info('filer - converting %s from record format version %s to %s' % (self.file, version, record_codec.VERSION))
+
+        self.compact()
+
+
+    def close(self):
 
+        pass
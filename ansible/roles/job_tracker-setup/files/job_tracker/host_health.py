@@ -0,0 +1,155 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    host_health
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    circuit breaker per source host
+
+    closed      host is polled normally
+    open        host failed <controller_breaker_failure_threshold> times in a row
+                and is skipped until its backoff has passed
+    half_open   backoff passed, the next poll is a probe. success closes the
+                breaker, failure opens it again with doubled backoff
+
+    the state of every host is written to a checkmk status file
+    (<run_dir>/source_host__<hostname>.state)
+'''
+
+import time
+import threading
+
+
+class host_health():
+
+    state_closed    = 'CLOSED'
+    state_open      = 'OPEN'
+    state_half_open = 'HALF_OPEN'
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.lock = threading.Lock()
+
+        # key: hostname, value: breaker (dict)
+        self.breakers = dict()
+
+
+    def get_breaker(self, hostname):
+
+        if hostname not in self.breakers:
+            self.breakers[hostname] = dict([ ('state', self.state_closed),
+                                             ('failures', 0),
+                                             ('backoff', 0.0),
+                                             ('open_until', 0.0),
+                                             ('last_error', '') ])
+
+        return self.breakers[hostname]
+
+
+    def allow(self, hostname):
+        ''' Returns:
+                True if <hostname> may be polled now '''
+
+        with self.lock:
+
+            breaker = self.get_breaker(hostname)
+
+            if breaker['state'] != self.state_open:
+                return True
+
+            if time.time() < breaker['open_until']:
+                return False
+
+            breaker['state'] = self.state_half_open
+            self.logger.info('host_health - probing %s after %.0f sec backoff' % (hostname, breaker['backoff']))
+
+        self.write_status_file(hostname)
+        return True
+
+
+    def get_open_until(self, hostname):
+        ''' Returns:
+                epoche (float) the backoff of <hostname> ends, 0.0 if its
+                breaker is not open '''
+
+        with self.lock:
+
+            breaker = self.get_breaker(hostname)
+
+            if breaker['state'] != self.state_open:
+                return 0.0
+
+            return breaker['open_until']
+
+
+    def record_success(self, hostname):
+
+        with self.lock:
+
+            breaker = self.get_breaker(hostname)
+            changed = breaker['state'] != self.state_closed
+
+            breaker['state'] = self.state_closed
+            breaker['failures'] = 0
+            breaker['backoff'] = 0.0
+            breaker['last_error'] = ''
+
+        if changed:
+            self.logger.info('host_health - %s recovered' % hostname)
+            self.write_status_file(hostname)
+
+
+    def record_failure(self, hostname, error=''):
+
+        with self.lock:
+
+            breaker = self.get_breaker(hostname)
+            breaker['failures'] += 1
+            breaker['last_error'] = ' '.join(error.split())
+
+            if breaker['state'] != self.state_half_open and \
+               breaker['failures'] < self.cfg.controller_breaker_failure_threshold:
+                return
+
+            if breaker['backoff'] == 0.0:
+                breaker['backoff'] = self.cfg.controller_breaker_backoff_min
+            else:
+                breaker['backoff'] = min(self.cfg.controller_breaker_backoff_max, breaker['backoff'] * 2)
+
+            breaker['state'] = self.state_open
+            breaker['open_until'] = time.time() + breaker['backoff']
+
+        self.logger.warning('host_health - %s skipped for %.0f sec after %d failures. %s' % (
+            hostname, breaker['backoff'], breaker['failures'], error))
+        self.write_status_file(hostname)
+
+
+    def write_status_file(self, hostname):
+        ''' Desc:
+                writes the breaker state of <hostname> as checkmk local check '''
+
+        breaker = self.breakers[hostname]
+
+        if breaker['state'] == self.state_closed:
+            status = 0
+            message = 'source host ok'
+        elif breaker['state'] == self.state_half_open:
+            status = 1
+            message = 'source host probed after %d failures' % breaker['failures']
+        else:
+            status = 2
+            message = 'source host unreachable (%d failures, next probe %s) %s' % (
+                breaker['failures'],
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(breaker['open_until'])),
+                breaker['last_error'])
+
+        try:
+            with open('%s/source_host__%s.state' % (self.cfg.run_dir, hostname), 'w') as f_stream:
+                f_stream.write('%s %ssource_host_%s - %s %s\n' % (
+                    status, self.cfg.monitoring_servicename_prefix, hostname, hostname, message))
+
+        except Exception as err:
+            self.logger.warning('unable to write host status file for %s. %s' % (hostname, err))
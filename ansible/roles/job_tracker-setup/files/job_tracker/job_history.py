@@ -6,12 +6,56 @@ Takes:
 Description:
     creates/extends job_history (obj)
 
-    .file       job event history file
+    .file       job event history file, see get_history_file
+
+    the parsed history is kept in memory, read from the file once and
+    written through to it. invalidate() drops it after the file was
+    changed externally (SIGHUP).
+
+    the messages of a cycle are applied to the history in memory one by
+    one (duplicate check, epoche_from of the last statement) and written
+    to the file at once by commit().
 '''
 
 import os, sys
 import time
 from filer import filer
+from sqlite_filer import sqlite_filer, get_database
+from ring_filer import ring_filer
+
+
+def get_history_file(cfg, logger, name, env, readonly=False):
+    ''' Takes:
+            (optional) readonly (bool) for readers besides the controller
+            (jt-analyzer): the history is read as it is, nothing is
+            created, converted, imported or resized
+        Returns:
+            history file (obj) of job <name> in <env> of the <history_backend>
+                file    filer, one file per job in <run_dir>. converted
+                        to the current record format once
+                sqlite  sqlite_filer, all jobs in <history_db>
+                ring    ring_filer, one fixed-size file per job in <run_dir>
+                the entries of an existing history file are imported once
+                into an empty sqlite/ring history '''
+
+    filename = '%s/%s__%s.job_history' % (cfg.run_dir, name, env)
+
+    if cfg.history_backend == 'sqlite':
+        history_file = sqlite_filer(cfg, logger, get_database(cfg, logger, readonly), name, env)
+        if not readonly:
+            history_file.import_file(filename)
+        return history_file
+
+    if cfg.history_backend == 'ring':
+        history_file = ring_filer(cfg, logger, '%s/%s__%s.job_ring' % (cfg.run_dir, name, env), 'epoche_until', readonly)
+        if not readonly:
+            history_file.import_file(filename)
+        return history_file
+
+    history_file = filer(cfg, logger, filename, 'epoche_until', readonly)
+    if not readonly:
+        history_file.migrate()
+    return history_file
 
 
 class job_history():
@@ -23,9 +67,84 @@ class job_history():
         self.logger = logger
         self.job = job
 
-        self.filename = '%s/%s__%s.job_history' % (cfg.run_dir, job['name'], job['env'])
-        
-        self.file = filer(cfg, logger, self.filename)
+        self.file = get_history_file(cfg, logger, job['name'], job['env'])
+        self.filename = self.file.file
+
+        # execution statements newest first, see get_history
+        self.history = None
+        # execution statements not written to the file yet, see commit
+        self.pending = []
+
+
+    def get_history(self):
+        ''' Returns:
+                execution statements (dicts) as array, newest first '''
+
+        if self.history is None:
+            self.history = self.file.read_content()
+
+        return self.history
+
+
+    def get_last_statement(self):
+
+        history = self.get_history()
+
+        if history:
+            return history[0]
+        else:
+            return dict()
+
+
+    def invalidate(self):
+        ''' Desc:
+                drops the history in memory, it is read from the file again on
+                next use '''
+
+        self.history = None
+
+
+    def close(self):
+
+        self.commit()
+        self.file.close()
+
+
+    def write_statement(self, exec_statement):
+        ''' Desc:
+                adds <exec_statement> to the history in memory (same order and
+                limit as the file), written to the file by commit() '''
+
+        history = self.get_history()
+
+        # after the statements with the same epoche_until, as read_content sorts
+        index = 0
+        while index < len(history) and history[index]['epoche_until'] >= exec_statement['epoche_until']:
+            index += 1
+
+        history.insert(index, exec_statement)
+        del history[self.cfg.item['global_config'][0]['job_history_entry_count']:]
+
+        self.pending.append(exec_statement)
+
+
+    def commit(self):
+        ''' Desc:
+                writes the statements added since the last commit to the file
+                in one go. statements failing to be written are kept for the
+                next commit
+            Returns:
+                True if no statements are left to write '''
+
+        if not self.pending:
+            return True
+
+        if not self.file.write_statements(self.pending, self.get_history()):
+            return False
+
+        self.pending = []
+
+        return True
 
 
     def get_status(self, t=float(-1.0)):
@@ -41,10 +160,10 @@ class job_history():
                     since:  epoche (float)
                     result: message (string) '''
 
-        event_history = self.file.read_content()
+        event_history = self.get_history()
 
         if t < 0 or not event_history:
-            last_exec = self.file.get_last_statement()
+            last_exec = self.get_last_statement()
             return self.evaluate_status(last_exec)
 
         target_time = time.time() - t
@@ -101,7 +220,7 @@ class job_history():
         if message_id == '':
             message_id = self.file.get_new_id()
 
-        last_exec = self.file.get_last_statement()
+        last_exec = self.get_last_statement()
 
         if event == self.cfg.job_start_keyword:
             epoche_from = timestamp
@@ -123,13 +242,13 @@ class job_history():
         
         self.check_for_duplicate_entries(this_exec)
         
-        self.file.write_statement(this_exec, 'epoche_until')
+        self.write_statement(this_exec)
 
 
     def check_for_duplicate_entries(self, exec_statement):
 
         this_status = self.evaluate_status(exec_statement)
-        last_status = self.evaluate_status(self.file.get_last_statement())
+        last_status = self.evaluate_status(self.get_last_statement())
 
         if not last_status:
             return False
@@ -166,5 +285,8 @@ class job_history():
 
             self.add_event_to_history(message['event'], message['epoche_timestamp'], message['message_text'], message['id'])
 
+        # one write per job and cycle
+        self.commit()
+
         return
 
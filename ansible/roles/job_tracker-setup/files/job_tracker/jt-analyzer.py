@@ -7,6 +7,9 @@ Examples:
 
   # Analyze logs for example_job
   %(prog)s -j example_job
+
+  # Entries of the last 24 hours
+  %(prog)s -j example_job -H 24
 '''
 
 import argparse
@@ -15,7 +18,7 @@ import sys
 import time
 import logging
 from config import Config
-from filer import filer
+from job_history import get_history_file
 
 
 def convert_epoche_to_timestamp(epoche):
@@ -38,6 +41,7 @@ if __name__ == '__main__':
 	parser.add_argument("-c", "--config", type=str, metavar="config", help="job_tracker config file", default="job_tracker.cfg")
 	parser.add_argument("-j", "--job", type=str, metavar="job", help="Job to analyze", required=True)
 	parser.add_argument("-e", "--env", type=str, metavar="env", choices=['P', 'I'], default='I', help="Environment")
+	parser.add_argument("-H", "--hours", type=float, metavar="hours", help="Entries of the last <hours> only")
 
 	# parse the args and call the appropriate command function
 	args = parser.parse_args()
@@ -45,13 +49,17 @@ if __name__ == '__main__':
 	cfg = setup_config()
 	cfg.load_config(args.config)
 	logger = logging.getLogger("/tmp/jt-analyzer.log")
-	file_name = '%s/%s__%s.job_history' % (cfg.run_dir, args.job, args.env)
-	file_handler = filer(cfg, logger, file_name)
+	# the controller may be running, leave the history as it is
+	file_handler = get_history_file(cfg, logger, args.job, args.env, readonly=True)
 
-	print "\nGetting log entries from %s\n" % file_name
+	print "\nGetting log entries from %s\n" % file_handler.file
 	print "FROM                - UNTIL    : RESULT\n--------------------------------------------------------------"
 
-	job_history = file_handler.read_content()
+	since = None
+	if args.hours is not None:
+		since = time.time() - args.hours * 3600
+
+	job_history = file_handler.read_content(since=since)
 
 	for item in job_history:
 
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+DESC=''' job_tracker record codec benchmark
+Compares the parse throughput of the job history record formats:
+  v1 eval            python dict repr per line, eval() (job_tracker before record format version 2)
+  v1 literal_eval    python dict repr per line, ast.literal_eval() (migration of old files)
+  v2 json per line   one json.loads() per line
+  v2 record_codec    record_codec.decode_records() (current)
+and the encoding of the entries.
+'''
+EPILOG='''
+Examples:
+
+  # 1000 entries (one history file at job_history_entry_count 1000), best of 5 runs
+  %(prog)s
+
+  # 100000 entries, 3 runs
+  %(prog)s -n 100000 -r 3
+'''
+
+import argparse
+import textwrap
+import sys
+import ast
+import json
+import time
+import random
+import record_codec
+
+
+def make_entries(count):
+
+	random.seed(0)
+	entries = []
+	epoche = 1466000000.0
+
+	for index in range(count):
+		epoche_from = epoche
+		epoche += random.uniform(1, 600)
+		entries.append(dict([ ('execution_id', u'h%d:%d:%d' % (index % 7, index, int(epoche * 1000))),
+		                      ('epoche_from', epoche_from),
+		                      ('epoche_until', epoche),
+		                      ('result', u'%s - load of table %d finished' % (random.choice(['STARTED', 'SUCCESS', 'ERROR']), index)) ]))
+
+	return entries
+
+
+def best_of(runs, func, *args):
+
+	timings = []
+
+	for run in range(runs):
+		start = time.time()
+		func(*args)
+		timings.append(time.time() - start)
+
+	return min(timings)
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(
+		prog="jt-codec-benchmark",
+		formatter_class=argparse.RawDescriptionHelpFormatter,
+		description=DESC,
+		epilog=textwrap.dedent(EPILOG)
+	)
+	parser.add_argument("-n", "--entries", type=int, metavar="entries", default=1000, help="Number of history entries")
+	parser.add_argument("-r", "--runs", type=int, metavar="runs", default=5, help="Runs per codec, the fastest counts")
+
+	args = parser.parse_args()
+
+	entries = make_entries(args.entries)
+
+	v1_lines = [ '%s\n' % entry for entry in entries ]
+	v2_lines = [ record_codec.encode_header() ] + [ record_codec.encode_record(entry) for entry in entries ]
+
+	decoders = [
+		('v1 eval', lambda: [ dict(eval(line.rstrip())) for line in v1_lines ]),
+		('v1 literal_eval', lambda: [ dict(ast.literal_eval(line.rstrip())) for line in v1_lines ]),
+		('v2 json per line', lambda: [ json.loads(line) for line in v2_lines[1:] ]),
+		('v2 record_codec', lambda: record_codec.decode_records(v2_lines)),
+	]
+
+	encoders = [
+		('v1 repr', lambda: [ '%s\n' % entry for entry in entries ]),
+		('v2 record_codec', lambda: [ record_codec.encode_record(entry) for entry in entries ]),
+	]
+
+	if record_codec.decode_records(v2_lines) != entries or record_codec.decode_records(v1_lines) != entries:
+		print "record_codec does not return the original entries"
+		sys.exit(1)
+
+	print "\n%d entries, %d bytes (v1), %d bytes (v2), best of %d runs\n" % (
+		args.entries, sum(map(len, v1_lines)), sum(map(len, v2_lines)), args.runs)
+	print "%-20s %12s %16s\n--------------------------------------------------" % ("DECODE", "SEC", "ENTRIES/SEC")
+
+	baseline = None
+
+	for name, func in decoders:
+		duration = best_of(args.runs, func)
+		baseline = baseline or duration
+		print "%-20s %12.4f %16.0f  (%.1fx)" % (name, duration, args.entries / duration, baseline / duration)
+
+	print "\n%-20s %12s %16s\n--------------------------------------------------" % ("ENCODE", "SEC", "ENTRIES/SEC")
+
+	for name, func in encoders:
+		duration = best_of(args.runs, func)
+		print "%-20s %12.4f %16.0f" % (name, duration, args.entries / duration)
+
+	print
+
+sys.exit(0)
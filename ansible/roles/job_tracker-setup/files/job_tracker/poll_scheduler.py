@@ -0,0 +1,98 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    poll_scheduler
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    keeps a poll interval per source host within
+    [controller_poll_interval_min_in_sec, controller_poll_interval_max_in_sec]
+
+    hosts delivering messages (or with messages left in their queue) are
+    polled more often, idle hosts less often.
+'''
+
+import time
+
+
+class poll_scheduler():
+
+    # hosts due within this time (sec) are polled in the current cycle
+    tolerance = 0.1
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+
+        self.min_interval = self.cfg.controller_poll_interval_min
+        self.max_interval = self.cfg.controller_poll_interval_max
+
+        # key: hostname, value: current poll interval (float)
+        self.intervals = dict()
+        # key: hostname, value: epoche (float) of the next poll
+        self.next_poll = dict()
+
+
+    def get_interval(self, hostname):
+
+        return self.intervals.get(hostname, self.cfg.controller_interval)
+
+
+    def get_due_hosts(self, hosts):
+        ''' Returns:
+                hosts (array) to poll now '''
+
+        now = time.time() + self.tolerance
+
+        return [ host for host in hosts if self.next_poll.get(host['hostname'], 0.0) <= now ]
+
+
+    def update(self, hostname, batch_size, queue_remaining=0):
+        ''' Takes:
+                hostname (string)
+                batch_size (int) messages received from <hostname> in this poll
+                (optional) queue_remaining (int) messages left in the queue
+            Desc:
+                halves the interval of a busy host, stretches it by half for an idle one '''
+
+        interval = self.get_interval(hostname)
+
+        if queue_remaining > 0:
+            interval = self.min_interval
+        elif batch_size > 0:
+            interval = interval / 2.0
+        else:
+            interval = interval * 1.5
+
+        interval = max(self.min_interval, min(self.max_interval, interval))
+
+        if interval != self.intervals.get(hostname):
+            self.logger.debug('poll_scheduler - poll interval of %s: %.1f sec (batch: %d, remaining: %d)' % (
+                hostname, interval, batch_size, queue_remaining))
+
+        self.intervals[hostname] = interval
+        self.next_poll[hostname] = time.time() + interval
+
+
+    def postpone(self, hostname, until):
+        ''' Takes:
+                hostname (string)
+                until (float) epoche <hostname> is due again at the earliest
+            Desc:
+                keeps a host not polled in a cycle (e.g. its circuit breaker is
+                open) from being due right away again '''
+
+        self.next_poll[hostname] = max(self.next_poll.get(hostname, 0.0), until)
+
+
+    def get_time_to_next_poll(self, hosts):
+        ''' Returns:
+                seconds (float) until the next host is due '''
+
+        next_polls = [ self.next_poll.get(host['hostname'], 0.0) for host in hosts ]
+
+        if not next_polls:
+            return self.cfg.controller_interval
+
+        return max(0.0, min(next_polls) - time.time())
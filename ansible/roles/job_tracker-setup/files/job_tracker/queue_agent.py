@@ -0,0 +1,186 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    queue_agent
+Takes:
+    config (obj)
+    logger (obj)
+    get_ssh_command (func) as provided by the controller
+Description:
+    keeps one resident "message-queue.py agent" per source host running over
+    a long-lived ssh pipe. the agents push new messages as newline delimited
+    JSON, received messages are acknowledged back over the same pipe.
+
+    dead agents are restarted on the next collect.
+'''
+
+import os
+import time
+import select
+from subprocess import Popen, PIPE
+
+# job_tracker
+from decoder import message_decoder
+
+
+class queue_agent_pool():
+
+    def __init__(self, cfg, logger, get_ssh_command):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.get_ssh_command = get_ssh_command
+
+        # key: hostname, value: agent (dict)
+        self.agents = dict()
+
+
+    def start(self, host):
+        ''' returns:
+                agent (dict) or None if the agent could not be started '''
+
+        cmd = '%s -f %s agent -t EPOCHE -i %s' % (host['message_queue_handler'], host['message_queue'],
+                                                  self.cfg.item['global_config'][0]['job_history_entry_count'])
+
+        ssh_cmd = self.get_ssh_command(host['user'], host['key'], host['hostname'])
+        ssh_cmd += ' \"%s\"' % cmd
+
+        try:
+            stderr = open('%s/%s.agent.err' % (self.cfg.run_dir, host['hostname']), 'a')
+            p = Popen(ssh_cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=stderr, close_fds=True)
+            stderr.close()
+        except Exception as err:
+            self.logger.error('queue_agent - starting %s failed. %s' % (ssh_cmd, err))
+            return None
+
+        self.logger.info('queue_agent - agent on %s started' % host['hostname'])
+
+        return dict([ ('host', host),
+                      ('process', p),
+                      ('decoder', message_decoder()) ])
+
+
+    def stop(self, agent):
+
+        p = agent['process']
+
+        try:
+            p.stdin.close()
+        except IOError:
+            pass
+
+        if p.poll() is None:
+            try:
+                p.terminate()
+            except OSError:
+                pass
+
+        p.wait()
+        p.stdout.close()
+
+
+    def ensure_agents(self):
+        ''' (re)starts agents for all source hosts '''
+
+        for host in self.cfg.item['source_hosts']:
+
+            agent = self.agents.get(host['hostname'])
+
+            if agent and agent['process'].poll() is None:
+                continue
+
+            if agent:
+                self.logger.warning('queue_agent - agent on %s exited (RC: %s). restarting.' % (
+                    host['hostname'], agent['process'].returncode))
+                self.stop(agent)
+                del self.agents[host['hostname']]
+
+            agent = self.start(host)
+            if agent:
+                self.agents[host['hostname']] = agent
+
+
+    def wait(self, timeout):
+        ''' Desc:
+                blocks until any agent has data to read or <timeout> (float) has passed
+            Returns:
+                True if data is available '''
+
+        fds = [ agent['process'].stdout.fileno() for agent in self.agents.values() ]
+
+        if not fds:
+            time.sleep(timeout)
+            return False
+
+        try:
+            return bool(select.select(fds, [], [], timeout)[0])
+        except select.error:
+            # interrupted by a signal
+            return False
+
+
+    def read(self, agent):
+        ''' reads everything available from <agent> without blocking
+            returns:
+                complete raw messages (dicts) as array '''
+
+        fd = agent['process'].stdout.fileno()
+        messages = []
+
+        while select.select([fd], [], [], 0)[0]:
+
+            data = os.read(fd, 65536)
+            if not data:
+                break
+
+            messages.extend(agent['decoder'].feed(data))
+
+        return messages
+
+
+    def collect(self):
+        ''' Returns:
+                (hostname, raw message (dict)) tuples from all agents as array, in host order '''
+
+        self.ensure_agents()
+
+        source_data = []
+
+        for host in self.cfg.item['source_hosts']:
+
+            agent = self.agents.get(host['hostname'])
+            if not agent:
+                continue
+
+            for msg in self.read(agent):
+
+                source_data.append((host['hostname'], msg))
+
+        return source_data
+
+
+    def ack(self, acks):
+        ''' Takes:
+                acks (dict) key: hostname, value: ids (array) of processed messages
+            Desc:
+                the agents delete the acknowledged messages from their queues '''
+
+        for hostname, ids in acks.items():
+
+            agent = self.agents.get(hostname)
+            if not agent or not ids:
+                continue
+
+            try:
+                agent['process'].stdin.write('ACK %s\n' % ','.join([ str(i) for i in ids ]))
+                agent['process'].stdin.flush()
+            except IOError as err:
+                # the restarted agent will send the unacknowledged messages again
+                self.logger.warning('queue_agent - acknowledgement to %s failed. %s' % (hostname, err))
+
+
+    def stop_all(self):
+
+        for agent in self.agents.values():
+            self.stop(agent)
+
+        self.agents.clear()
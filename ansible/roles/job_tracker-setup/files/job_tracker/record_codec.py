@@ -0,0 +1,127 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    record_codec
+Description:
+    on-disk format of the job history files.
+
+    version 2 (current): a header line followed by one JSON object per line
+        {"_format":"job_history","_version":2}
+        {"epoche_from":1466000000.0,"epoche_until":1466000100.0,"execution_id":"...","result":"SUCCESS - ..."}
+
+    version 1: one python dict repr per line, no header. read with
+    ast.literal_eval (literals only, nothing is executed) and converted to
+    version 2 by filer.migrate().
+'''
+
+import ast
+import json
+
+FORMAT = 'job_history'
+VERSION = 2
+
+_header = '{"_format":"%s","_version":%d}\n' % (FORMAT, VERSION)
+# no sort_keys, it takes the slow path of the encoder
+_encoder = json.JSONEncoder(separators=(',', ':'))
+_decoder = json.JSONDecoder()
+
+
+def encode_header():
+
+    return _header
+
+
+def encode_record(record):
+    ''' Returns:
+            line (string) of <record> (dict) including the newline '''
+
+    return _encoder.encode(record) + '\n'
+
+
+def encode_strings(value):
+    ''' Desc:
+            converts the unicode strings of parsed JSON <value> (within dicts
+            and arrays as well) to utf-8 strings. the cfg file, messages and
+            status files use plain strings, mixing both fails on the first
+            non-ascii character
+        Returns:
+            <value> with plain strings '''
+
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    if isinstance(value, list):
+        return [ encode_strings(item) for item in value ]
+
+    if isinstance(value, dict):
+        return dict([ (encode_strings(key), encode_strings(item)) for key, item in value.items() ])
+
+    return value
+
+
+def get_version(lines):
+    ''' Takes:
+            lines (array) of a history file
+        Returns:
+            version (int) of the file, an empty file is current '''
+
+    if not lines:
+        return VERSION
+
+    if not lines[0].startswith('{"_format"'):
+        return 1
+
+    header = _decoder.decode(lines[0])
+
+    if header.get('_format') != FORMAT:
+        raise ValueError('no job history file: %s' % lines[0].strip())
+
+    return header['_version']
+
+
+def decode_records(lines, logger=None):
+    ''' Takes:
+            lines (array) of a history file (version 1 or 2)
+            (optional) logger (obj) corrupt lines are skipped and logged
+        Returns:
+            records (dicts) as array in file order
+        Raises:
+            ValueError on an unsupported version '''
+
+    version = get_version(lines)
+
+    if version == 1:
+        decode = lambda line: dict(ast.literal_eval(line))
+
+    elif version == VERSION:
+        lines = lines[1:]
+
+        data = '[%s]' % ','.join([ line.rstrip() for line in lines if line.strip() ])
+
+        # one call for the whole file, much faster than a call per line
+        try:
+            records = _decoder.decode(data)
+        except ValueError:
+            # e.g. a line cut off by a crash, decode line by line below
+            decode = _decoder.decode
+        else:
+            # the decoder returns unicode, ascii-only values included
+            return map(encode_strings, records)
+
+    else:
+        raise ValueError('unsupported job history version %s' % version)
+
+    records = []
+
+    for line in lines:
+
+        if not line.strip():
+            continue
+
+        try:
+            records.append(encode_strings(decode(line.rstrip())))
+
+        except (ValueError, SyntaxError) as err:
+            if logger:
+                logger.warning('skipping corrupt job history entry %r. %s' % (line[:100], err))
+
+    return records
@@ -0,0 +1,84 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    reorder_buffer
+Takes:
+    config (obj)
+    logger (obj)
+    job (dict) as defined in cfg file
+Description:
+    holds the messages of one job until the watermark (now - grace) passed
+    their timestamp and releases them sorted by epoche_timestamp.
+
+    messages from different source hosts arrive in host order. without the
+    buffer a late STARTED would be written after the events of its own run.
+
+    grace: <reorder_grace_in_sec> of the job, default
+           <controller_reorder_grace_in_sec>. 0 passes messages through.
+'''
+
+import time
+import heapq
+
+
+class reorder_buffer():
+
+    def __init__(self, cfg, logger, job):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.job = job
+
+        self.grace = float(job.get('reorder_grace_in_sec', self.cfg.controller_reorder_grace))
+
+        # (epoche_timestamp, arrival, message), oldest first
+        self.heap = []
+        self.arrivals = 0
+
+        # epoche_timestamp of the last released message
+        self.released_until = 0.0
+
+
+    def add(self, messages):
+
+        for message in messages:
+            heapq.heappush(self.heap, (message['epoche_timestamp'], self.arrivals, message))
+            self.arrivals += 1
+
+
+    def release(self, now=None, flush=False):
+        ''' Takes:
+                (optional) now (float) epoche, default: time.time()
+                (optional) flush (bool) release all messages
+            Returns:
+                messages (array) older than the watermark, sorted by epoche_timestamp.
+                without grace all messages, also those with a timestamp ahead
+                of the local clock '''
+
+        if now is None:
+            now = time.time()
+
+        watermark = now - self.grace
+        flush = flush or self.grace <= 0
+
+        messages = []
+
+        while self.heap and (flush or self.heap[0][0] <= watermark):
+            messages.append(heapq.heappop(self.heap)[2])
+
+        if messages:
+
+            if messages[0]['epoche_timestamp'] < self.released_until:
+                self.logger.warning('%s__%s: message from %s arrived %.1f sec after the reorder grace period' % (
+                    self.job['name'], self.job['env'], messages[0]['source'],
+                    self.released_until - messages[0]['epoche_timestamp']))
+
+            self.released_until = max(self.released_until, messages[-1]['epoche_timestamp'])
+
+        return messages
+
+
+    def get_held_messages(self):
+        ''' Returns:
+                messages (array) not released yet '''
+
+        return [ entry[2] for entry in self.heap ]
@@ -0,0 +1,420 @@
+''' Tracks jobs according to a given pattern (time & event based)
+Module:
+    ring_filer
+
+Takes:
+    filename (string)
+    (optional) sort_key (string) only "epoche_until" is supported
+    (optional) readonly (bool) the ring is mapped read-only in the layout
+               it has, nothing is created or resized
+
+Description:
+    job history backend "ring": a fixed-size binary file per job, accessed
+    through mmap. same interface as filer.
+
+        header  magic "JTR1", version, slot count (<job_history_entry_count>),
+                text width, next sequence number, newest slot
+        slots   per entry: epoche_from, epoche_until (double), sequence
+                number (0: empty slot), offset into the text region,
+                execution_id length, result length, event code
+        text    per slot <history_ring_text_bytes>: execution_id, result
+                (utf-8, longer ones are cut off)
+
+    writing an entry fills one slot in place. once all slots are used the
+    slot of the entry sorting last (oldest epoche_until, of equal ones the
+    last written) is reused, an entry sorting after all others is dropped.
+    the ring holds the same entries the history file would hold.
+
+    the newest entry is read from its slot directly (get_last_statement).
+    the mapping is flushed to disk with every <history_compaction_records>th
+    entry and on close.
+'''
+
+import os
+import mmap
+import heapq
+import struct
+import threading
+
+# job_tracker
+from filer import filer, get_new_id
+
+
+class ring_filer():
+
+    magic = 'JTR1'
+    version = 1
+    header = struct.Struct('<4sHHIIQI')
+    slot = struct.Struct('<ddQIHHB3x')
+
+    no_slot = 0xffffffff
+
+    def __init__(self, cfg, logger, filename, sort_key='epoche_until', readonly=False):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.file = filename
+        self.readonly = readonly
+        self.lock = threading.Lock()
+
+        if sort_key != 'epoche_until':
+            raise ValueError('ring_filer supports sort_key epoche_until only')
+
+        self.slot_count = int(self.cfg.item['global_config'][0]['job_history_entry_count'])
+        self.text_width = int(self.cfg.history_ring_text_bytes)
+
+        # event codes of the slots, 0: other event
+        self.events = [ None, self.cfg.job_start_keyword, self.cfg.job_error_keyword, self.cfg.job_end_keyword ]
+
+        self.appended_records = 0
+        self.map = None
+
+        self.open_file()
+
+
+    def get_size(self):
+
+        return self.header.size + self.slot_count * (self.slot.size + self.text_width)
+
+
+    def open_file(self):
+        ''' Desc:
+                maps the ring file, creates it or rebuilds it if its layout does
+                not match <job_history_entry_count>/<history_ring_text_bytes> '''
+
+        content = None
+
+        if self.readonly:
+            ring = self.read_layout() if os.path.isfile(self.file) else None
+
+            if ring is None:
+                self.logger.warning('unable to read %s. no job history ring' % self.file)
+                return
+
+            self.slot_count, self.text_width = ring
+            self.map_file()
+            return
+
+        if os.path.isfile(self.file):
+            ring = self.read_layout()
+
+            if ring is None:
+                self.logger.warning('%s is no job history ring, creating a new one' % self.file)
+
+            elif ring != (self.slot_count, self.text_width):
+                # keep the entries of the old layout
+                self.logger.info('ring_filer - resizing %s from %s slots x %s bytes to %s x %s' % (
+                    self.file, ring[0], ring[1], self.slot_count, self.text_width))
+                content = ring_filer.read_file(self.cfg, self.logger, self.file)
+
+            else:
+                self.map_file()
+                return
+
+        try:
+            with open(self.file, 'wb') as f_stream:
+                f_stream.truncate(self.get_size())
+        except Exception as err:
+            self.logger.warning('unable to init %s. %s' % (self.file, err))
+            return
+
+        self.map_file()
+
+        if self.map is None:
+            return
+
+        self.write_header(seq=1, newest=self.no_slot)
+
+        for statement in sorted(content or [], key=lambda statement: statement['epoche_until']):
+            self.write_statement(statement)
+
+
+    def read_layout(self):
+        ''' Returns:
+                (slot count, text width) of the ring file or None '''
+
+        try:
+            with open(self.file, 'rb') as f_stream:
+                data = f_stream.read(self.header.size)
+
+            magic, version, reserved, slot_count, text_width, seq, newest = self.header.unpack(data)
+
+        except Exception:
+            return None
+
+        if magic != self.magic or version != self.version:
+            return None
+
+        if os.path.getsize(self.file) != self.header.size + slot_count * (self.slot.size + text_width):
+            return None
+
+        return (slot_count, text_width)
+
+
+    def map_file(self):
+
+        try:
+            if self.readonly:
+                with open(self.file, 'rb') as f_stream:
+                    self.map = mmap.mmap(f_stream.fileno(), self.get_size(), access=mmap.ACCESS_READ)
+            else:
+                with open(self.file, 'r+b') as f_stream:
+                    self.map = mmap.mmap(f_stream.fileno(), self.get_size())
+
+        except Exception as err:
+            self.logger.warning('unable to map %s. %s' % (self.file, err))
+            self.map = None
+            return
+
+        # (epoche_until, -seq, slot) of the used slots, the first sorts last
+        self.heap = []
+
+        for index in range(self.slot_count):
+            epoche_from, epoche_until, seq, offset, id_length, text_length, event = self.read_slot(index)
+
+            if seq:
+                self.heap.append((epoche_until, -seq, index))
+
+        heapq.heapify(self.heap)
+
+        self.free_slots = sorted(set(range(self.slot_count)) - set([ entry[2] for entry in self.heap ]), reverse=True)
+
+
+    def read_header(self):
+        ''' Returns:
+                (next sequence number, newest slot) '''
+
+        magic, version, reserved, slot_count, text_width, seq, newest = self.header.unpack_from(self.map, 0)
+
+        return seq, newest
+
+
+    def write_header(self, seq, newest):
+
+        self.header.pack_into(self.map, 0, self.magic, self.version, 0, self.slot_count, self.text_width, seq, newest)
+
+
+    def get_slot_offset(self, index):
+
+        return self.header.size + index * self.slot.size
+
+
+    def read_slot(self, index):
+
+        return self.slot.unpack_from(self.map, self.get_slot_offset(index))
+
+
+    def read_statement(self, index):
+        ''' Returns:
+                execution statement (dict) of slot <index> '''
+
+        epoche_from, epoche_until, seq, offset, id_length, text_length, event = self.read_slot(index)
+
+        text = self.map[offset:offset + id_length + text_length]
+
+        return dict([ ('execution_id', text[:id_length]),
+                      ('epoche_from', epoche_from),
+                      ('epoche_until', epoche_until),
+                      ('result', text[id_length:]) ])
+
+
+    def get_event_code(self, result):
+
+        for code in range(1, len(self.events)):
+            if result.startswith('%s - ' % self.events[code]):
+                return code
+
+        return 0
+
+
+    def get_new_id(self):
+
+        return get_new_id()
+
+
+    def get_last_statement(self):
+
+        with self.lock:
+
+            if self.map is None:
+                return dict()
+
+            seq, newest = self.read_header()
+
+            if newest == self.no_slot:
+                return dict()
+
+            return self.read_statement(newest)
+
+
+    def read_content(self, since=None, until=None):
+        ''' Takes:
+                (optional) since, until (float) epoche_until range
+            Returns:
+                entries (dicts) as array, newest first '''
+
+        with self.lock:
+
+            if self.map is None:
+                return []
+
+            # newest first, of equal epoche_until the first written first
+            slots = sorted(self.heap, key=lambda entry: (-entry[0], -entry[1]))
+
+            return [ self.read_statement(index) for epoche_until, seq, index in slots
+                     if (since is None or epoche_until >= since) and (until is None or epoche_until < until) ]
+
+
+    def write_statement(self, statement, content=None):
+        ''' Desc:
+                writes <statement> into a free slot or the slot of the entry
+                sorting last
+            Returns:
+                True if <statement> was written (or sorts after all entries) '''
+
+        with self.lock:
+
+            if self.map is None:
+                self.logger.warning('unable to write %s. not mapped' % self.file)
+                return False
+
+            seq, newest = self.read_header()
+            order = (statement['epoche_until'], -seq)
+
+            if self.free_slots:
+                index = self.free_slots.pop()
+
+            elif order < self.heap[0][:2]:
+                # sorts after all entries, beyond <job_history_entry_count>
+                self.write_header(seq + 1, newest)
+                return True
+
+            else:
+                index = heapq.heappop(self.heap)[2]
+
+            heapq.heappush(self.heap, order + (index,))
+
+            execution_id = self.encode_text(statement['execution_id'])
+            result = self.encode_text(statement['result'], self.text_width - len(execution_id))
+            offset = self.header.size + self.slot_count * self.slot.size + index * self.text_width
+
+            self.map[offset:offset + len(execution_id) + len(result)] = execution_id + result
+            self.slot.pack_into(self.map, self.get_slot_offset(index),
+                                statement['epoche_from'], statement['epoche_until'], seq, offset,
+                                len(execution_id), len(result), self.get_event_code(result))
+
+            # of equal epoche_until the first written stays the newest
+            if newest in (self.no_slot, index) or statement['epoche_until'] > self.read_slot(newest)[1]:
+                newest = index
+
+            self.write_header(seq + 1, newest)
+
+        self.appended_records += 1
+
+        if self.appended_records >= self.cfg.history_compaction_records:
+            self.compact()
+
+        return True
+
+
+    def write_statements(self, statements, content=None):
+        ''' Desc:
+                one slot per statement, see write_statement
+            Returns:
+                True if all <statements> were written '''
+
+        return all([ self.write_statement(statement) for statement in statements ])
+
+
+    def encode_text(self, text, width=None):
+        ''' Returns:
+                text (string) utf-8, cut to <width> bytes (default: the text width)
+                without splitting a character '''
+
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+
+        width = self.text_width if width is None else width
+
+        if len(text) <= width:
+            return text
+
+        return text[:width].decode('utf-8', 'ignore').encode('utf-8')
+
+
+    def compact(self, content=None):
+        ''' Desc:
+                the ring has a fixed size, flushes it to disk '''
+
+        with self.lock:
+
+            if self.map is None or self.readonly:
+                return
+
+            try:
+                self.map.flush()
+            except Exception as err:
+                self.logger.warning('unable to flush %s. %s' % (self.file, err))
+                return
+
+        self.appended_records = 0
+
+
+    def close(self):
+
+        self.compact()
+
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+
+
+    def import_file(self, filename):
+        ''' Desc:
+                copies the entries of the history file <filename> (backend
+                "file") if the ring is empty '''
+
+        if not os.path.isfile(filename) or self.get_last_statement():
+            return
+
+        content = filer(self.cfg, self.logger, filename).read_content()
+
+        for statement in sorted(content, key=lambda statement: statement['epoche_until']):
+            self.write_statement(statement)
+
+        self.compact()
+
+        self.logger.info('imported %d entries of %s to %s' % (len(content), filename, self.file))
+
+
+    @staticmethod
+    def read_file(cfg, logger, filename):
+        ''' Returns:
+                entries (dicts) of the ring file <filename> of any layout,
+                oldest first '''
+
+        try:
+            with open(filename, 'rb') as f_stream:
+                data = f_stream.read()
+
+            magic, version, reserved, slot_count, text_width, seq, newest = ring_filer.header.unpack_from(data, 0)
+
+        except Exception as err:
+            logger.warning('unable to read %s. %s' % (filename, err))
+            return []
+
+        entries = []
+
+        for index in range(slot_count):
+            epoche_from, epoche_until, seq, offset, id_length, text_length, event = \
+                ring_filer.slot.unpack_from(data, ring_filer.header.size + index * ring_filer.slot.size)
+
+            if seq:
+                text = data[offset:offset + id_length + text_length]
+                entries.append((epoche_until, seq, dict([ ('execution_id', text[:id_length]),
+                                                          ('epoche_from', epoche_from),
+                                                          ('epoche_until', epoche_until),
+                                                          ('result', text[id_length:]) ])))
+
+        return [ entry[2] for entry in sorted(entries) ]
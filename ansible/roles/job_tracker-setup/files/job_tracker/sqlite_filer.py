@@ -0,0 +1,277 @@
+''' Tracks jobs according to a given pattern (time & event based)
+Module:
+    sqlite_filer
+
+Takes:
+    database (obj) history_database, see get_database
+    job (string)
+    env (string)
+
+Description:
+    job history backend "sqlite": the execution statements of all jobs in
+    one SQLite database (WAL journal) instead of one file per job. same
+    interface as filer.
+
+    statements are inserted without a commit, the controller commits once
+    per cycle (history_database.commit). entries beyond
+    <job_history_entry_count> are deleted with every
+    <history_compaction_records>th insert of a job.
+
+    the index on (job, env, epoche_until) serves the newest entries of a
+    job as well as time ranges (read_content(since, until)).
+'''
+
+import os
+import threading
+import sqlite3
+from operator import itemgetter
+
+# job_tracker
+from filer import filer, get_new_id
+
+
+# open databases, key: path
+_databases = dict()
+_databases_lock = threading.Lock()
+
+
+def get_database(cfg, logger, readonly=False):
+    ''' Takes:
+            (optional) readonly (bool) a connection of its own, reading only
+        Returns:
+            history_database (obj) of <history_db>, opened on first use '''
+
+    if readonly:
+        return history_database(cfg, logger, cfg.history_db, readonly)
+
+    with _databases_lock:
+
+        if cfg.history_db not in _databases:
+            _databases[cfg.history_db] = history_database(cfg, logger, cfg.history_db)
+
+        return _databases[cfg.history_db]
+
+
+class history_database():
+
+    def __init__(self, cfg, logger, filename, readonly=False):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.file = filename
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.con = None
+
+        if readonly:
+            # no schema changes, no journal mode switch, a missing database is not created
+            if os.path.isfile(self.file):
+                self.connect()
+            return
+
+        self.connect()
+        cur = self.con.cursor()
+
+        # readers (jt-analyzer) do not block the writer
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS history(
+                         id           INTEGER PRIMARY KEY,
+                         job          TEXT,
+                         env          TEXT,
+                         execution_id TEXT,
+                         epoche_from  REAL,
+                         epoche_until REAL,
+                         result       TEXT
+                    )""")
+        cur.execute("""CREATE INDEX IF NOT EXISTS history_by_job
+                         ON history(job, env, epoche_until)""")
+        self.con.commit()
+
+
+    def connect(self):
+
+        self.con = sqlite3.connect(self.file, check_same_thread=False)
+
+        # the statements are utf-8 strings (as the controller passes them),
+        # the default (unicode) refuses them as soon as they are not ascii
+        self.con.text_factory = str
+
+
+    def execute(self, stmt, args=()):
+        ''' Returns:
+                rows (array) of <stmt> '''
+
+        with self.lock:
+            if self.con is None:
+                raise sqlite3.OperationalError('%s not found' % self.file)
+
+            return self.con.execute(stmt, args).fetchall()
+
+
+    def executemany(self, stmt, rows):
+
+        with self.lock:
+            self.con.executemany(stmt, rows)
+
+
+    def commit(self):
+        ''' Returns:
+                True if the inserts since the last commit are committed '''
+
+        if self.readonly:
+            return True
+
+        with self.lock:
+            try:
+                self.con.commit()
+            except sqlite3.Error as err:
+                self.logger.warning('unable to commit %s. %s' % (self.file, err))
+                return False
+
+        return True
+
+
+    def close(self):
+
+        self.commit()
+
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+
+
+class sqlite_filer():
+
+    columns = ('execution_id', 'epoche_from', 'epoche_until', 'result')
+
+    def __init__(self, cfg, logger, database, job, env):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.db = database
+        self.job = job
+        self.env = env
+        self.file = '%s (%s__%s)' % (database.file, job, env)
+
+        # retention deletes are due with the first insert
+        self.appended_records = self.cfg.history_compaction_records
+
+
+    def get_new_id(self):
+
+        return get_new_id()
+
+
+    def get_last_statement(self):
+
+        content = self.read_content(limit=1)
+
+        if len(content) > 0:
+            return content[0]
+        else:
+            return dict()
+
+
+    def read_content(self, since=None, until=None, limit=None):
+        ''' Takes:
+                (optional) since, until (float) epoche_until range
+                (optional) limit (int) default: <job_history_entry_count>
+            Returns:
+                entries (dicts) as array, newest first '''
+
+        if limit is None:
+            limit = self.cfg.item['global_config'][0]['job_history_entry_count']
+
+        stmt = "SELECT %s FROM history WHERE job = ? AND env = ?" % ', '.join(self.columns)
+        args = [ self.job, self.env ]
+
+        if since is not None:
+            stmt += " AND epoche_until >= ?"
+            args.append(since)
+
+        if until is not None:
+            stmt += " AND epoche_until < ?"
+            args.append(until)
+
+        # of entries with the same epoche_until the first written comes first
+        stmt += " ORDER BY epoche_until DESC, id ASC LIMIT ?"
+        args.append(limit)
+
+        try:
+            rows = self.db.execute(stmt, args)
+        except sqlite3.Error as err:
+            self.logger.warning('unable to read %s. %s' % (self.file, err))
+            return []
+
+        return [ dict(zip(self.columns, row)) for row in rows ]
+
+
+    def write_statement(self, statement, content=None):
+
+        return self.write_statements([ statement ], content)
+
+
+    def write_statements(self, statements, content=None):
+        ''' Desc:
+                inserts <statements>, committed with the next history_database.commit
+            Returns:
+                True if <statements> were inserted '''
+
+        try:
+            self.db.executemany("INSERT INTO history(job, env, %s) VALUES (?, ?, ?, ?, ?, ?)" % ', '.join(self.columns),
+                                [ [ self.job, self.env ] + [ statement[column] for column in self.columns ] for statement in statements ])
+
+        except sqlite3.Error as err:
+            self.logger.warning('unable to write %s. %s' % (self.file, err))
+            return False
+
+        self.appended_records += len(statements)
+
+        if self.appended_records >= self.cfg.history_compaction_records:
+            self.compact()
+
+        return True
+
+
+    def compact(self, content=None):
+        ''' Desc:
+                deletes the entries beyond <job_history_entry_count> '''
+
+        try:
+            self.db.execute("""DELETE FROM history WHERE id IN (
+                                   SELECT id FROM history WHERE job = ? AND env = ?
+                                   ORDER BY epoche_until DESC, id ASC LIMIT -1 OFFSET ?)""",
+                            (self.job, self.env, self.cfg.item['global_config'][0]['job_history_entry_count']))
+
+        except sqlite3.Error as err:
+            self.logger.warning('unable to compact %s. %s' % (self.file, err))
+            return
+
+        self.appended_records = 0
+
+
+    def close(self):
+        ''' Desc:
+                the database is closed by the controller '''
+
+        pass
+
+
+    def import_file(self, filename):
+        ''' Desc:
+                copies the entries of the history file <filename> (backend
+                "file") if there are none for this job yet '''
+
+        if not os.path.isfile(filename) or self.get_last_statement():
+            return
+
+        content = filer(self.cfg, self.logger, filename).read_content()
+
+        # oldest first, keeps the order of entries with the same epoche_until
+        self.write_statements(sorted(content, key=itemgetter('epoche_until')))
+
+        self.db.commit()
+
+        self.logger.info('imported %d entries of %s to %s' % (len(content), filename, self.db.file))
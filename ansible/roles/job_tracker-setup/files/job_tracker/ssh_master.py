@@ -0,0 +1,166 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    ssh_master
+Takes:
+    config (obj)
+    logger (obj)
+Description:
+    keeps one long-lived ssh master connection (ControlMaster socket) per
+    source host. ssh commands using the socket of a running master only open
+    a new channel instead of doing a full connect, key exchange and auth.
+
+    masters are checked and started in background threads, commands are
+    built without the master (direct connection) while it is not up.
+'''
+
+import os
+import time
+import threading
+from subprocess import Popen, PIPE
+
+
+class ssh_master_pool():
+
+    def __init__(self, cfg, logger):
+
+        self.cfg = cfg
+        self.logger = logger
+
+        self.socket_dir = '%s/ssh' % self.cfg.run_dir
+        self.check_interval = self.cfg.controller_ssh_master_check_interval
+
+        # key: user@host, value: epoche (float) of the last health check
+        self.last_check = dict()
+        # key: user@host, value: True if the master was alive at the last health check
+        self.alive = dict()
+        # user@host of the running health checks
+        self.refreshing = set()
+        self.pool_lock = threading.Lock()
+
+        if not os.path.exists(self.socket_dir):
+            try:
+                os.makedirs(self.socket_dir, 0700)
+            except Exception as err:
+                self.logger.warning('unable to create ssh master socket dir %s. %s' % (self.socket_dir, err))
+
+
+    def get_control_path(self, user, host):
+
+        return '%s/%s@%s' % (self.socket_dir, user, host)
+
+
+    def run_ssh(self, args):
+        ''' runs ssh with <args> (array) without a shell
+            stdout/stderr are discarded, a backgrounded master would
+            otherwise keep the pipes open
+            returns:
+                rc (int) '''
+
+        devnull = open(os.devnull, 'r+')
+
+        try:
+            return Popen(['ssh'] + args, stdin=devnull, stdout=devnull, stderr=devnull).wait()
+        except Exception as err:
+            self.logger.error('ssh_master - running ssh %s failed. %s' % (' '.join(args), err))
+            return -1
+        finally:
+            devnull.close()
+
+
+    def check(self, user, host):
+        ''' returns:
+                True if the master for <user>@<host> is alive '''
+
+        return self.run_ssh(['-O', 'check', '-o', 'ControlPath=%s' % self.get_control_path(user, host),
+                             '%s@%s' % (user, host)]) == 0
+
+
+    def start(self, user, key, host):
+        ''' starts a backgrounded master connection for <user>@<host>
+            returns:
+                True on success '''
+
+        control_path = self.get_control_path(user, host)
+
+        # a socket left behind by a dead master blocks the new one
+        if os.path.exists(control_path):
+            try:
+                os.remove(control_path)
+            except Exception as err:
+                self.logger.warning('unable to remove stale ssh master socket %s. %s' % (control_path, err))
+
+        args = []
+
+        if not key == '':
+            args += ['-i', key]
+
+        args += ['-M', '-N', '-f', '-x',
+                 '-o', 'ControlMaster=yes',
+                 '-o', 'ControlPath=%s' % control_path,
+                 '-o', 'ServerAliveInterval=%d' % max(1, int(self.check_interval)),
+                 '-o', 'ConnectTimeout=%s' % self.cfg.item['global_config'][0]['controller_data_load_timeout'],
+                 '-o', 'BatchMode=yes',
+                 '-o', 'StrictHostKeyChecking=no',
+                 '%s@%s' % (user, host)]
+
+        rc = self.run_ssh(args)
+
+        if rc != 0:
+            self.logger.warning('ssh_master - unable to start master connection to %s@%s (RC: %d)' % (user, host, rc))
+            return False
+
+        self.logger.info('ssh_master - master connection to %s@%s started' % (user, host))
+        return True
+
+
+    def ensure(self, user, key, host):
+        ''' Desc:
+                never blocks: health checks the master for <user>@<host> at
+                most every <controller_ssh_master_check_interval_in_sec> and
+                (re)starts it, both in a background thread (see refresh)
+            Returns:
+                True if the master was alive at its last check '''
+
+        name = '%s@%s' % (user, host)
+
+        with self.pool_lock:
+
+            if name not in self.refreshing and time.time() - self.last_check.get(name, 0.0) >= self.check_interval:
+                self.last_check[name] = time.time()
+                self.refreshing.add(name)
+
+                thread = threading.Thread(target=self.refresh, args=(user, key, host), name='ssh_master %s' % name)
+                thread.daemon = True
+                thread.start()
+
+            return self.alive.get(name, False)
+
+
+    def refresh(self, user, key, host):
+        ''' Desc:
+                checks the master for <user>@<host> and (re)starts it. an
+                unreachable host takes up to <controller_data_load_timeout>,
+                its commands are built without the master in the meantime '''
+
+        name = '%s@%s' % (user, host)
+
+        try:
+            alive = self.check(user, host) or self.start(user, key, host)
+        except Exception as err:
+            self.logger.error('ssh_master - refreshing master connection to %s failed. %s' % (name, err))
+            alive = False
+
+        with self.pool_lock:
+            self.alive[name] = alive
+            self.refreshing.discard(name)
+
+
+    def stop_all(self):
+
+        with self.pool_lock:
+            names = [ name for name, alive in self.alive.items() if alive ]
+            self.alive.clear()
+
+        for name in names:
+            user, host = name.split('@', 1)
+            self.run_ssh(['-O', 'exit', '-o', 'ControlPath=%s' % self.get_control_path(user, host), name])
@@ -0,0 +1,489 @@
+'''Tracks jobs according to a given pattern (time & event based)
+Module:
+    transport
+Takes:
+    config (obj)
+    logger (obj)
+    host (dict) as defined in cfg file
+Description:
+    access to the message queue of a source host, selected per host by
+    "transport" in the cfg file
+
+        ssh             message-queue.py on the source host over ssh
+        local-sqlite    the queue file on this host, read in-process using
+                        the functions of message-queue.py over a pooled
+                        connection
+        unix-socket     a queue served by "message-queue.py serve" on <socket>
+
+    all transports provide
+        fetch(max_items)    new raw messages (dicts) as array
+        ack(ids)            confirms processed messages (by queue id)
+        length()            number of messages in the queue
+        close()             ends the session, unacknowledged messages are
+                            delivered again
+
+    without "transport" a host uses ssh.
+
+    ssh runs one subprocess per call. to drive many of them at once the
+    controller uses get_fetch_command()/get_length_command() with fetch_loop.
+
+    with controller_filter_pushdown ssh fetches send the jobs of the cfg file
+    along ("message-queue.py --filter -"), messages of other jobs are skipped
+    on the source host.
+'''
+
+import os
+import abc
+import imp
+import time
+import socket
+import threading
+
+# job_tracker
+from decoder import message_decoder
+
+
+def get_transport(cfg, logger, host, cntr):
+    ''' Returns:
+            transport (obj) as configured for <host> '''
+
+    # in-process transports only if configured, a local queue may be
+    # meant to be read over ssh (e.g. as another user)
+    name = host.get('transport', 'ssh')
+
+    if name == 'local-sqlite':
+        return local_sqlite_transport(cfg, logger, host)
+
+    if name == 'unix-socket':
+        return unix_socket_transport(cfg, logger, host)
+
+    return ssh_transport(cfg, logger, host, cntr)
+
+
+class transport():
+
+    __metaclass__ = abc.ABCMeta
+
+    # True if fetches run as subprocesses (see get_fetch_command)
+    subprocess = False
+
+    def __init__(self, cfg, logger, host):
+
+        self.cfg = cfg
+        self.logger = logger
+        self.host = host
+
+        # fetch and ack may run in different threads (controller_pipeline)
+        self.lock = threading.RLock()
+
+
+    @abc.abstractmethod
+    def fetch(self, max_items):
+
+        pass
+
+
+    def ack(self, ids):
+
+        pass
+
+
+    @abc.abstractmethod
+    def length(self):
+
+        pass
+
+
+    def close(self):
+
+        pass
+
+
+class ssh_transport(transport):
+    ''' controller_queue_protocol
+            remove  "message-queue.py remove" deletes the messages while
+                    fetching them, there is nothing to acknowledge
+            cursor  "message-queue.py fetch" leaves them in the queue. the
+                    acknowledgement is sent with the next fetch (--ack-upto)
+                    or on close '''
+
+    subprocess = True
+
+    def __init__(self, cfg, logger, host, cntr):
+
+        transport.__init__(self, cfg, logger, host)
+        self.cntr = cntr
+
+        # ids of the last fetched and the last acknowledged message
+        self.last_fetched = 0
+        self.acked = 0
+
+
+    def get_command(self, q_cmd=''):
+
+        return self.cntr.get_sql_command_over_ssh(user=self.host['user'],
+                                                  key=self.host['key'],
+                                                  host=self.host['hostname'],
+                                                  q=self.host['message_queue'],
+                                                  q_handler=self.host['message_queue_handler'],
+                                                  q_cmd=q_cmd)
+
+
+    def get_fetch_command(self, max_items):
+        ''' Returns:
+                command (string) or (command, stdin data) with a job filter '''
+
+        if self.cfg.controller_queue_protocol == 'remove':
+            q_cmd = 'remove -t EPOCHE -i %s%s' % (max_items, self.cntr.get_output_option())
+
+        else:
+            q_cmd = 'fetch -t EPOCHE -i %s%s --after %d' % (max_items, self.cntr.get_output_option(), self.last_fetched)
+
+            if self.acked:
+                q_cmd += ' --ack-upto %d' % self.acked
+
+        # clock record for the clock offset estimation
+        if self.cfg.controller_clock_sync:
+            q_cmd += ' --clock'
+
+        job_filter = self.cntr.get_job_filter()
+
+        if job_filter is None:
+            return self.get_command(q_cmd)
+
+        return (self.get_command(q_cmd + ' --filter -'), job_filter)
+
+
+    def fetched(self, queue_id):
+        ''' Desc:
+                called with the id of every message received and with the cursor
+                record of a filtered fetch, the next fetch continues after it '''
+
+        self.last_fetched = max(self.last_fetched, queue_id)
+
+
+    def get_length_command(self):
+
+        return self.get_command('length')
+
+
+    def run(self, cmd, decoder=None):
+
+        def on_stdout(key, data):
+            for msg in decoder.feed(data):
+                if '_clock' in msg:
+                    self.cntr.clock_offset.add_sample(self.host['hostname'], msg['_clock'], sent, time.time())
+                elif '_cursor' in msg:
+                    self.fetched(msg['_cursor'])
+                else:
+                    messages.append(msg)
+
+        if not isinstance(cmd, tuple):
+            cmd = (cmd,)
+
+        messages = []
+        sent = time.time()
+        result = self.cntr.fetch_loop.run([ (self.host['hostname'],) + cmd ], on_stdout if decoder else None)[self.host['hostname']]
+
+        if result['timed_out']:
+            raise Exception('timed out after %s sec' % self.cfg.controller_fetch_timeout)
+
+        if result['rc'] != 0:
+            raise Exception('RC: %s %s' % (result['rc'], result['stderr']))
+
+        if decoder:
+            decoder.close()
+            return messages
+
+        return result['stdout']
+
+
+    def fetch(self, max_items):
+
+        messages = self.run(self.get_fetch_command(max_items), self.cntr.get_decoder())
+
+        for msg in messages:
+            self.fetched(msg['_id'])
+
+        return messages
+
+
+    def ack(self, ids):
+
+        if ids:
+            self.acked = max(self.acked, max(ids))
+
+
+    def length(self):
+
+        return int(self.run(self.get_length_command()))
+
+
+    def close(self):
+        ''' Desc:
+                sends the acknowledgement pending for the next fetch, that
+                fetch does not come on shutdown. runs outside of the fetch loop,
+                which cancels everything once the exit flag is set '''
+
+        with self.lock:
+
+            if self.cfg.controller_queue_protocol == 'cursor' and self.acked:
+                result = self.cntr.run_shell(self.get_command('ack --upto %d' % self.acked))
+
+                if result['rc'] != 0:
+                    self.logger.warning('%s: acknowledgement up to %d not sent, the messages are fetched again' % (
+                        self.host['hostname'], self.acked))
+
+            # the next fetch starts at the cursor of the queue
+            self.last_fetched = 0
+
+
+# modules loaded from the message_queue_handler of local queues, key: path
+_queue_modules = dict()
+_queue_modules_lock = threading.Lock()
+
+# open connections to local queues, key: queue path, value: [ connection, lock ]
+_connections = dict()
+_connections_lock = threading.Lock()
+
+
+def get_queue_module_path(handler):
+    ''' Takes:
+            handler (string) message_queue_handler as in the cfg file,
+            e.g. "/path/message-queue.py" or "python /path/message-queue.py"
+        Returns:
+            path (string) of message-queue.py '''
+
+    path = [ arg for arg in handler.split() if arg.endswith('.py') ]
+
+    return path[-1] if path else handler
+
+
+def load_queue_module(handler):
+    ''' Returns:
+            message-queue.py of <handler> loaded as module '''
+
+    path = get_queue_module_path(handler)
+
+    with _queue_modules_lock:
+
+        if path not in _queue_modules:
+            module = imp.load_source('message_queue_%d' % len(_queue_modules), path)
+            module.set_timeformat('EPOCHE')
+            _queue_modules[path] = module
+
+        return _queue_modules[path]
+
+
+class local_sqlite_transport(transport):
+    ''' reads the queue file directly with the SQL of message-queue.py.
+        the connection stays open and is shared by all hosts using the same
+        queue file. acknowledged messages are deleted, or with the cursor
+        protocol moved behind the cursor '''
+
+    def __init__(self, cfg, logger, host):
+
+        transport.__init__(self, cfg, logger, host)
+
+        self.queue = load_queue_module(host['message_queue_handler'])
+        self.path = host['message_queue']
+        self.last_fetched = 0
+        self.unacked = set()
+
+
+    def get_connection(self):
+        ''' Returns:
+                [ connection, lock ] of the queue, opened on first use '''
+
+        with _connections_lock:
+
+            if self.path not in _connections:
+
+                if not os.path.isfile(self.path):
+                    raise Exception('queue %s not found' % self.path)
+
+                # fetches of the thread pool run in changing threads, the lock serializes them
+                _connections[self.path] = [ self.queue.sqlite.connect(self.path, check_same_thread=False),
+                                            threading.Lock() ]
+
+            return _connections[self.path]
+
+
+    def execute(self, func, *args):
+        ''' runs <func>(con, cur, *args) on the pooled connection. a failed
+            connection is dropped and opened again on the next call '''
+
+        con, lock = self.get_connection()
+
+        with lock:
+            try:
+                return func(con, con.cursor(), *args)
+            except Exception:
+                self.drop_connection()
+                raise
+
+
+    def drop_connection(self):
+
+        with _connections_lock:
+            con, lock = _connections.pop(self.path, (None, None))
+
+        if con:
+            try:
+                con.close()
+            except Exception:
+                pass
+
+
+    def fetch(self, max_items):
+
+        with self.lock:
+
+            messages = self.execute(lambda con, cur: self.queue.select_new_items(cur, self.last_fetched, max_items))
+
+            if messages:
+                self.last_fetched = messages[-1]['_id']
+                self.unacked.update([ msg['_id'] for msg in messages ])
+
+            return messages
+
+
+    def ack(self, ids):
+
+        with self.lock:
+
+            if self.cfg.controller_queue_protocol == 'cursor':
+                self.execute(self.queue.ack_upto, max(ids))
+            else:
+                self.execute(self.queue.delete_items, ids)
+
+            self.unacked.difference_update(ids)
+
+            # ids are reused once the queue ran empty, start over as soon
+            # as everything fetched is acknowledged
+            if not self.unacked:
+                self.last_fetched = 0
+
+
+    def length(self):
+
+        return self.execute(lambda con, cur: self.queue.count_items(cur))
+
+
+    def close(self):
+
+        with self.lock:
+
+            # unacknowledged messages are fetched again
+            self.last_fetched = 0
+            self.unacked.clear()
+            self.drop_connection()
+
+
+class unix_socket_transport(transport):
+    ''' talks to "message-queue.py serve". messages are deleted once
+        acknowledged, unacknowledged ones are sent again after a reconnect '''
+
+    def __init__(self, cfg, logger, host):
+
+        transport.__init__(self, cfg, logger, host)
+
+        self.path = host['socket']
+        self.sock = None
+        self.stream = None
+
+
+    def connect(self):
+
+        if self.sock:
+            return
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.cfg.controller_fetch_timeout)
+
+        try:
+            self.sock.connect(self.path)
+        except socket.error:
+            self.close()
+            raise
+
+        self.stream = self.sock.makefile('rb')
+
+
+    def request(self, line):
+        ''' sends <line>, returns: the first line of the answer '''
+
+        self.connect()
+
+        try:
+            self.sock.sendall(line + '\n')
+            answer = self.stream.readline()
+        except (socket.error, IOError):
+            self.close()
+            raise
+
+        if not answer:
+            self.close()
+            raise Exception('connection to %s closed' % self.path)
+
+        return answer
+
+
+    def fetch(self, max_items):
+
+        decoder = message_decoder()
+        messages = []
+
+        with self.lock:
+
+            line = self.request('FETCH %d' % max_items)
+
+            while line.strip():
+                messages.extend(decoder.feed(line))
+
+                try:
+                    line = self.stream.readline()
+                except (socket.error, IOError):
+                    self.close()
+                    raise
+
+                if not line:
+                    self.close()
+                    raise Exception('connection to %s closed' % self.path)
+
+        decoder.close()
+
+        return messages
+
+
+    def ack(self, ids):
+
+        if not ids:
+            return
+
+        with self.lock:
+            answer = self.request('ACK %s' % ','.join([ str(i) for i in ids ]))
+
+        if not answer.startswith('OK'):
+            raise Exception('acknowledgement failed: %s' % answer.strip())
+
+
+    def length(self):
+
+        with self.lock:
+            return int(self.request('LENGTH'))
+
+
+    def close(self):
+
+        with self.lock:
+
+            for f in (self.stream, self.sock):
+                if f:
+                    try:
+                        f.close()
+                    except (socket.error, IOError):
+                        pass
+
+            self.sock = None
+            self.stream = None
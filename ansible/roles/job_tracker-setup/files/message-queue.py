@@ -30,11 +30,46 @@ Examples:
   # item will be oldest queue item
   %(prog)s -fmyqueue.db remove -i10
 
+  # Same as above, printing one item per line (newline delimited JSON)
+  %(prog)s -fmyqueue.db remove -i10 -o ndjson
+
+  # Same as above in the compact binary format read by job_tracker
+  %(prog)s -fmyqueue.db remove -i10 -t EPOCHE -o binary
+
+  # Stay resident and stream new items as newline delimited JSON (one item
+  # per line). Items are deleted once acknowledged on stdin: "ACK <id>,<id>,..."
+  %(prog)s -fmyqueue.db agent -t EPOCHE
+
+  # Print up to 100 items above the cursor without removing them, then
+  # acknowledge them. Acknowledged items are no longer listed and deleted in
+  # bulk once enough of them piled up
+  %(prog)s -fmyqueue.db fetch -i100 -t EPOCHE -o ndjson
+  %(prog)s -fmyqueue.db ack --upto 100
+
+  # Same as above in one call: acknowledge up to item 100, fetch the next items
+  %(prog)s -fmyqueue.db fetch -i100 -t EPOCHE -o ndjson --after 100 --ack-upto 100
+
+  # Same as above, preceded by the clock of this host: {"_clock": <epoche>}
+  %(prog)s -fmyqueue.db fetch -i100 -t EPOCHE -o ndjson --clock
+
+  # Fetch the items of two jobs only, the other items are skipped. Followed
+  # by the id up to which the queue was scanned: {"_cursor": <id>}
+  echo '[["P", "myjob"], ["I", "myjob"]]' | %(prog)s -fmyqueue.db fetch -t EPOCHE -o ndjson --filter -
+
+  # Serve the queue on a unix socket. Commands (one per line): "FETCH <n>"
+  # (newline delimited JSON, terminated by an empty line), "ACK <id>,<id>,..."
+  # and "LENGTH"
+  %(prog)s -fmyqueue.db serve -s /tmp/myqueue.sock -t EPOCHE
+
 """
 
 import os
 import sys
+import time
+import select
+import struct
 import textwrap
+import SocketServer
 try:
     import sqlite
 except:
@@ -55,7 +90,12 @@ import argparse
 _VERBOSITY         = 0
 _DEFAULT_DB_FILE   = 'msg-queue.sqlite'
 _DEFAULT_MAX_ITEMS = 10
+_DEFAULT_POLL_INTERVAL = 0.5
+_DEFAULT_PURGE_ROWS = 1000
 _SELECT_FULL_ROW   = ""
+_BINARY_MAGIC      = 'JTB1'
+_CLOCK_MAGIC       = 'JTC1'
+_CURSOR_MAGIC      = 'JTK1'
 
 
 def die(msg, exit_code=1):
@@ -95,6 +135,9 @@ def create_db(filename):
                     )""")
         cur.execute("""CREATE INDEX IF NOT EXISTS messages_by_date
                          ON messages(timestamp)""")
+        cur.execute("""CREATE INDEX IF NOT EXISTS messages_by_job
+                         ON messages(instance, job)""")
+        create_cursor_table(cur)
     except Exception, e:
         print e
 
@@ -149,16 +192,168 @@ def row_as_msg(row):
             'message': row[5]}
 
 
+def create_cursor_table(cur):
+    # single row: id of the last acknowledged item
+    cur.execute("""CREATE TABLE IF NOT EXISTS cursor(
+                     id    INTEGER PRIMARY KEY CHECK (id = 0),
+                     acked INTEGER
+                )""")
+
+
+def get_cursor(cur):
+    ''' returns the id of the last acknowledged item, 0 if none '''
+
+    try:
+        cur.execute("SELECT acked FROM cursor WHERE id = 0")
+    except sqlite.OperationalError:
+        # queue created before the cursor existed
+        return 0
+
+    row = cur.fetchone()
+
+    return row[0] if row else 0
+
+
+def ack_upto(con, cur, upto, purge_rows=_DEFAULT_PURGE_ROWS):
+    ''' moves the cursor to item <upto>, all items up to it are acknowledged.
+        they are deleted in bulk once <purge_rows> of them piled up. the last
+        acknowledged item is kept, so sqlite never hands out its id again.
+        returns the cursor '''
+
+    cursor = get_cursor(cur)
+
+    cur.execute("SELECT min(id), max(id) FROM messages")
+    oldest, newest = cur.fetchone()
+
+    # never beyond the newest item, new items must get higher ids
+    upto = min(upto, newest or 0)
+
+    if upto <= cursor:
+        return cursor
+
+    create_cursor_table(cur)
+    cur.execute("INSERT OR REPLACE INTO cursor(id, acked) VALUES (0, ?)", (upto,))
+
+    if upto - oldest >= purge_rows:
+        debug("Purging acknowledged items below %s", upto)
+        cur.execute("DELETE FROM messages WHERE id < ?", (upto,))
+
+    con.commit()
+
+    return upto
+
+
+def count_items(cur):
+    stmt = "SELECT count(id) FROM messages WHERE id > ?"
+    debug("Executing: %s", stmt)
+    cur.execute(stmt, (get_cursor(cur),))
+
+    return cur.fetchone()[0]
+
+
+def read_filter(filterfile):
+    ''' reads a job filter: JSON array of [instance, job] pairs.
+        filterfile "-" reads it from standard input '''
+
+    try:
+        if filterfile == '-':
+            data = sys.stdin.read()
+        else:
+            data = open(filterfile).read()
+
+        return [ (instance, job) for instance, job in json.loads(data) ]
+    except Exception:
+        die("Could not read filter from %s" % filterfile)
+
+
+def set_filter(con, cur, jobs):
+    ''' stores the (instance, job) pairs <jobs> in a temporary table of this
+        connection, select_new_items(..., filtered=True) joins it '''
+
+    # lookup of the pairs, created once for queues older than the index
+    cur.execute("""CREATE INDEX IF NOT EXISTS messages_by_job
+                     ON messages(instance, job)""")
+    cur.execute("""CREATE TEMP TABLE IF NOT EXISTS filter(
+                     instance TEXT,
+                     job      TEXT,
+                     PRIMARY KEY (instance, job)
+                )""")
+    cur.execute("DELETE FROM temp.filter")
+    cur.executemany("INSERT OR IGNORE INTO temp.filter(instance, job) VALUES (?, ?)", jobs)
+    con.commit()
+
+
+def select_new_items(cur, after_id, maxitems, filtered=False, upto=None):
+    ''' returns the (at most <maxitems>) items following item <after_id>,
+        acknowledged items are skipped. filtered: items of the jobs in
+        set_filter only. upto: items up to this id only '''
+
+    source = "FROM messages "
+    if filtered:
+        source = "FROM messages JOIN temp.filter USING (instance, job) "
+
+    condition = "WHERE id > ? "
+    args = [ max(after_id, get_cursor(cur)) ]
+    if upto is not None:
+        condition += "AND id <= ? "
+        args.append(upto)
+
+    # LIMIT instead of fetchmany, an unfinished statement would keep
+    # the queue locked for writers
+    stmt = _SELECT_FULL_ROW + source + condition + "ORDER BY id ASC LIMIT ?"
+    cur.execute(stmt, args + [ maxitems ])
+
+    return [ row_as_msg(row) for row in cur.fetchall() ]
+
+
+def get_newest_id(cur):
+    ''' returns the id of the newest item, 0 if the queue is empty '''
+
+    cur.execute("SELECT max(id) FROM messages")
+
+    return cur.fetchone()[0] or 0
+
+
+def select_filtered_items(cur, after_id, maxitems):
+    ''' returns the items of the jobs in set_filter following item
+        <after_id> (see select_new_items) and the id up to which the queue
+        was scanned. items up to it not returned did not match.
+
+        the scan is bounded by the newest id read before the select, an
+        item added meanwhile is beyond it and not taken as scanned '''
+
+    newest = get_newest_id(cur)
+    msgs = select_new_items(cur, after_id, maxitems, filtered=True, upto=newest)
+
+    if len(msgs) >= maxitems:
+        return msgs, msgs[-1]['_id']
+
+    return msgs, newest
+
+
+def delete_items(con, cur, ids):
+    if not ids:
+        return
+
+    # No injection possible, because all strings in "ids" represent numbers
+    cur.execute("DELETE FROM messages WHERE id IN (%s)" % ','.join([ str(int(i)) for i in ids ]))
+    con.commit()
+
+
+def parse_ids(idstr):
+    ''' parses "<id>,<id>,..." returns: list of ids (int), None if invalid '''
+
+    try:
+        return [ int(i) for i in idstr.split(',') if i.strip() ]
+    except ValueError:
+        return None
+
+
 def queue_length(dbfilename):
     qlen = 0
     con, cur = open_db(dbfilename)
     try:
-        stmt = "SELECT count(id) FROM messages"
-        debug("Executing: %s", stmt)
-        cur.execute(stmt)
-
-        rows = cur.fetchone()
-        qlen = rows[0]
+        qlen = count_items(cur)
 
         con.close()
     except sqlite.Error, e:
@@ -171,7 +366,8 @@ def set_timeformat(timeformat):
     global _SELECT_FULL_ROW
 
     if timeformat == 'EPOCHE':
-        format = "strftime('%s', timestamp)"
+        # seconds with millisecond fraction, timestamps are stored as julian day
+        format = "round((julianday(timestamp) - 2440587.5) * 86400.0, 3)"
 
     elif timeformat == 'LOCALTIME':
         format = "datetime(timestamp, 'localtime')"
@@ -181,39 +377,128 @@ def set_timeformat(timeformat):
 
     _SELECT_FULL_ROW = "SELECT id, %s as timestamp, instance, job, event, message " % format
 
-def list_queue(dbfilename, maxitems=_DEFAULT_MAX_ITEMS):
+def encode_binary(msgs):
+    ''' compact framed batch, all numbers in network byte order:
+          header:       magic "JTB1", item count (uint32)
+          string table: count (uint16), per string: length (uint16), utf-8 bytes
+          per item:     id (uint64), timestamp (double), instance, job, event
+                        (uint16 string table index), message length (uint32),
+                        utf-8 bytes '''
+
+    strings = []
+    string_index = {}
+
+    def to_bytes(value):
+        if value is None:
+            return ''
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return str(value)
+
+    def index_of(value):
+        value = to_bytes(value)
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    items = []
+    for msg in msgs:
+        text = to_bytes(msg['message'])
+        items.append(struct.pack('!QdHHHI', msg['_id'], float(msg['timestamp'] or 0),
+                                 index_of(msg['instance']), index_of(msg['job']),
+                                 index_of(msg['event']), len(text)) + text)
+
+    table = [ struct.pack('!H', len(strings)) ]
+    for value in strings:
+        table.append(struct.pack('!H', len(value)) + value)
+
+    return _BINARY_MAGIC + struct.pack('!I', len(msgs)) + ''.join(table) + ''.join(items)
+
+def print_clock(outputformat='json'):
+    ''' control record with the clock of this host, lets the reader estimate
+        the clock offset. binary: magic "JTC1", epoche (double).
+        sent right away, the reader compares it to the time it arrived '''
+
+    now = time.time()
+
+    if outputformat == 'binary':
+        sys.stdout.write(struct.pack('!4sd', _CLOCK_MAGIC, now))
+    else:
+        sys.stdout.write(json.dumps({'_clock': now}) + '\n')
+
+    sys.stdout.flush()
+
+def print_cursor(upto, outputformat='json'):
+    ''' control record after a filtered select, the items up to <upto> were
+        scanned. binary: magic "JTK1", id (uint64) '''
+
+    if outputformat == 'binary':
+        sys.stdout.write(struct.pack('!4sQ', _CURSOR_MAGIC, upto))
+    else:
+        sys.stdout.write(json.dumps({'_cursor': upto}) + '\n')
+
+def print_msgs(msgs, outputformat='json'):
+    if outputformat == 'binary':
+        sys.stdout.write(encode_binary(msgs))
+    elif outputformat == 'ndjson':
+        for msg in msgs:
+            sys.stdout.write(json.dumps(msg) + '\n')
+    else:
+        print json.dumps(msgs, indent=None)
+
+def list_queue(dbfilename, maxitems=_DEFAULT_MAX_ITEMS, outputformat='json', jobs=None):
     msgs = None
     con, cur = open_db(dbfilename)
     try:
-        stmt = _SELECT_FULL_ROW + "FROM messages"
-        debug("Executing: %s", stmt)
-        cur.execute(stmt)
+        if jobs is not None:
+            set_filter(con, cur, jobs)
+            msgs = select_new_items(cur, 0, maxitems, filtered=True)
+        else:
+            stmt = _SELECT_FULL_ROW + "FROM messages WHERE id > ?"
+            debug("Executing: %s", stmt)
+            cur.execute(stmt, (get_cursor(cur),))
 
-        rows = cur.fetchmany(maxitems)
-        msgs = [ row_as_msg(row) for row in rows ]
+            rows = cur.fetchmany(maxitems)
+            msgs = [ row_as_msg(row) for row in rows ]
 
         con.close()
     except sqlite.Error, e:
         die("DB problem: %s" % e)
 
-    print json.dumps(msgs, indent=None)
+    print_msgs(msgs, outputformat)
+
 
+def dequeue(dbfilename, maxitems=_DEFAULT_MAX_ITEMS, outputformat='json', clock=False, jobs=None):
+    ''' removes and prints the oldest <maxitems> items. with a job filter
+        <jobs> the matching items are printed, all items scanned are removed '''
 
-def dequeue(dbfilename, maxitems=_DEFAULT_MAX_ITEMS):
     msgs = None
+    scanned = None
     con, cur = open_db(dbfilename)
+    if clock:
+        print_clock(outputformat)
     try:
-        stmt = _SELECT_FULL_ROW + "FROM messages ORDER BY timestamp ASC"
-        cur.execute(stmt)
+        if jobs is not None:
+            set_filter(con, cur, jobs)
 
-        rows = cur.fetchmany(maxitems)
-        msgs = [ row_as_msg(row) for row in rows ]
+            cursor = get_cursor(cur)
+            msgs, scanned = select_filtered_items(cur, cursor, maxitems)
 
-        ids = [ str(msg['_id']) for msg in msgs ]
+            cur.execute("DELETE FROM messages WHERE id > ? AND id <= ?", (cursor, scanned))
 
-        # No injection possible, because all strings in "ids" represent numbers
-        del_stmt = "DELETE FROM messages WHERE id IN (%s)" % ','.join(ids)
-        cur.execute(del_stmt)
+        else:
+            stmt = _SELECT_FULL_ROW + "FROM messages WHERE id > ? ORDER BY timestamp ASC"
+            cur.execute(stmt, (get_cursor(cur),))
+
+            rows = cur.fetchmany(maxitems)
+            msgs = [ row_as_msg(row) for row in rows ]
+
+            ids = [ str(msg['_id']) for msg in msgs ]
+
+            # No injection possible, because all strings in "ids" represent numbers
+            del_stmt = "DELETE FROM messages WHERE id IN (%s)" % ','.join(ids)
+            cur.execute(del_stmt)
 
         con.commit()
         con.close()
@@ -222,7 +507,202 @@ def dequeue(dbfilename, maxitems=_DEFAULT_MAX_ITEMS):
         die("DB problem: %s" % e)
 
     if msgs:
-        print json.dumps(msgs)
+        print_msgs(msgs, outputformat)
+
+    if scanned is not None:
+        print_cursor(scanned, outputformat)
+
+
+def fetch(dbfilename, after_id=0, maxitems=_DEFAULT_MAX_ITEMS, outputformat='json', upto=None, clock=False, jobs=None):
+    ''' prints the items following item <after_id> without removing them.
+        acknowledges up to item <upto> first, if given. with a job filter
+        <jobs> only the matching items are printed, followed by the id up to
+        which the queue was scanned '''
+
+    msgs = None
+    scanned = None
+    con, cur = open_db(dbfilename)
+    if clock:
+        print_clock(outputformat)
+    try:
+        if upto is not None:
+            ack_upto(con, cur, upto)
+
+        if jobs is not None:
+            set_filter(con, cur, jobs)
+            msgs, scanned = select_filtered_items(cur, after_id, maxitems)
+        else:
+            msgs = select_new_items(cur, after_id, maxitems)
+
+        con.close()
+    except sqlite.Error, e:
+        die("DB problem: %s" % e)
+
+    print_msgs(msgs, outputformat)
+
+    if scanned is not None:
+        print_cursor(scanned, outputformat)
+
+
+def acknowledge(dbfilename, upto, purge_rows=_DEFAULT_PURGE_ROWS):
+    con, cur = open_db(dbfilename)
+    try:
+        ack_upto(con, cur, upto, purge_rows)
+
+        con.close()
+    except sqlite.Error, e:
+        die("DB problem: %s" % e)
+
+
+def delete_acknowledged(con, cur, line):
+    ''' deletes the items listed in an acknowledgement line "ACK <id>,<id>,..."
+        returns: the deleted ids '''
+
+    if not line.startswith('ACK '):
+        debug("Ignoring: %s", line)
+        return []
+
+    ids = parse_ids(line[4:])
+    if ids is None:
+        debug("Invalid acknowledgement: %s", line)
+        return []
+
+    delete_items(con, cur, ids)
+
+    return ids
+
+
+def serve_agent(dbfilename, maxitems=_DEFAULT_MAX_ITEMS, poll_interval=_DEFAULT_POLL_INTERVAL):
+    ''' stays resident and keeps the queue open. new items are written to
+        stdout as newline delimited JSON, each item is sent once. items are
+        deleted as soon as they are acknowledged on stdin. exits on EOF. '''
+
+    con, cur = open_db(dbfilename)
+    stdin_fd = sys.stdin.fileno()
+    last_sent = 0
+    unacked = set()
+    buf = ''
+
+    try:
+        while True:
+            readable = select.select([stdin_fd], [], [], poll_interval)[0]
+
+            if readable:
+                data = os.read(stdin_fd, 65536)
+                if not data:
+                    break
+
+                buf += data
+                while '\n' in buf:
+                    line, buf = buf.split('\n', 1)
+                    unacked.difference_update(delete_acknowledged(con, cur, line.strip()))
+
+                # ids are reused once the queue ran empty, start over
+                # as soon as everything sent is acknowledged
+                if not unacked:
+                    last_sent = 0
+
+            msgs = select_new_items(cur, last_sent, maxitems)
+
+            for msg in msgs:
+                sys.stdout.write(json.dumps(msg) + '\n')
+                last_sent = msg['_id']
+                unacked.add(msg['_id'])
+
+            if msgs:
+                sys.stdout.flush()
+
+    except sqlite.Error, e:
+        die("DB problem: %s" % e)
+    except IOError:
+        # the reading side went away
+        pass
+
+    con.close()
+
+
+class SocketRequestHandler(SocketServer.StreamRequestHandler):
+    ''' one connection of "serve". each item is sent once per connection,
+        unacknowledged items are sent again on the next connection. '''
+
+    def handle(self):
+        con, cur = open_db(self.server.dbfilename)
+        last_sent = 0
+        unacked = set()
+
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+
+                command = line.strip().split(' ', 1)
+
+                if command[0] == 'FETCH':
+                    try:
+                        maxitems = int(command[1])
+                    except (IndexError, ValueError):
+                        maxitems = _DEFAULT_MAX_ITEMS
+
+                    msgs = select_new_items(cur, last_sent, maxitems)
+                    for msg in msgs:
+                        self.wfile.write(json.dumps(msg) + '\n')
+                        last_sent = msg['_id']
+                        unacked.add(msg['_id'])
+                    self.wfile.write('\n')
+
+                elif command[0] == 'ACK':
+                    ids = parse_ids(command[1] if len(command) > 1 else '')
+                    if ids is None:
+                        self.wfile.write('ERROR invalid ids\n')
+                    else:
+                        delete_items(con, cur, ids)
+                        unacked.difference_update(ids)
+                        # ids are reused once the queue ran empty, start
+                        # over as soon as everything sent is acknowledged
+                        if not unacked:
+                            last_sent = 0
+                        self.wfile.write('OK\n')
+
+                elif command[0] == 'LENGTH':
+                    self.wfile.write('%d\n' % count_items(cur))
+
+                else:
+                    self.wfile.write('ERROR unknown command\n')
+
+                self.wfile.flush()
+
+        except sqlite.Error, e:
+            sys.stderr.write("DB problem: %s\n" % e)
+        except IOError:
+            pass
+
+        con.close()
+
+
+class ThreadingUnixStreamServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_socket(dbfilename, socketpath):
+    ''' serves the queue on the unix socket <socketpath> until killed '''
+
+    if os.path.exists(socketpath):
+        os.remove(socketpath)
+
+    # create the queue before the first connection
+    open_db(dbfilename)[0].close()
+
+    server = ThreadingUnixStreamServer(socketpath, SocketRequestHandler)
+    server.dbfilename = dbfilename
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    os.remove(socketpath)
 
 
 def parse_json(jsonstr):
@@ -261,19 +741,51 @@ def command_add(args):
     dbfilename = args.file
     enqueue(dbfilename, instance, job, event, message)
 
+def check_output_format(args):
+    # the binary format carries timestamps as numbers
+    if args.output == 'binary' and args.timeformat != 'EPOCHE':
+        die("Output format binary requires timeformat EPOCHE")
+
+def get_filter_arg(args):
+    if args.filter is None:
+        return None
+    return read_filter(args.filter)
+
 def command_list(args):
     dbfilename = args.file
+    check_output_format(args)
     set_timeformat(args.timeformat)
-    list_queue(dbfilename, args.max_items)
+    list_queue(dbfilename, args.max_items, args.output, get_filter_arg(args))
 
 def command_length(args):
     dbfilename = args.file
     queue_length(dbfilename)
 
 def command_remove(args):
+    dbfilename = args.file
+    check_output_format(args)
+    set_timeformat(args.timeformat)
+    dequeue(dbfilename, args.max_items, args.output, args.clock, get_filter_arg(args))
+
+def command_fetch(args):
+    dbfilename = args.file
+    check_output_format(args)
+    set_timeformat(args.timeformat)
+    fetch(dbfilename, args.after, args.max_items, args.output, args.ack_upto, args.clock, get_filter_arg(args))
+
+def command_ack(args):
+    dbfilename = args.file
+    acknowledge(dbfilename, args.upto, args.purge_rows)
+
+def command_serve(args):
+    dbfilename = args.file
+    set_timeformat(args.timeformat)
+    serve_socket(dbfilename, args.socket)
+
+def command_agent(args):
     dbfilename = args.file
     set_timeformat(args.timeformat)
-    dequeue(dbfilename, args.max_items)
+    serve_agent(dbfilename, args.max_items, args.poll_interval)
 
 
 # ========================================================================
@@ -327,6 +839,14 @@ if __name__ == '__main__':
     parser_list.add_argument(
         '-t', '--timeformat', choices=['UTC', 'EPOCHE', 'LOCALTIME'], default='UTC',
         help='Timestamp format')
+    parser_list.add_argument(
+        '-o', '--output', choices=['json', 'ndjson', 'binary'], default='json',
+        help='Output format, ndjson prints one item per line, binary is a compact framed batch')
+
+    parser_list.add_argument(
+        "--filter", type=str, metavar="[-|FILE]",
+        help="""Items of these jobs only: JSON array of [instance, job] pairs, "-"
+        reads it from standard input. Example: [["P", "myjob"], ["I", "myjob"]]""")
 
     parser_length = subparsers.add_parser(
         "length", help="Print queue length")
@@ -341,6 +861,77 @@ if __name__ == '__main__':
     parser_remove.add_argument(
         '-t', '--timeformat', choices=['UTC', 'EPOCHE', 'LOCALTIME'], default='UTC',
         help='Timestamp format')
+    parser_remove.add_argument(
+        '-o', '--output', choices=['json', 'ndjson', 'binary'], default='json',
+        help='Output format, ndjson prints one item per line, binary is a compact framed batch')
+    parser_remove.add_argument(
+        "--clock", action="store_true",
+        help='Print the clock of this host first ({"_clock": <epoche>}, binary: "JTC1" frame)')
+
+    parser_remove.add_argument(
+        "--filter", type=str, metavar="[-|FILE]",
+        help="""Items of these jobs only: JSON array of [instance, job] pairs, "-"
+        reads it from standard input. Example: [["P", "myjob"], ["I", "myjob"]]""")
+
+    parser_fetch = subparsers.add_parser(
+        "fetch", help="Print items above the cursor without removing them")
+    parser_fetch.set_defaults(func=command_fetch)
+    parser_fetch.add_argument(
+        "-i", "--max-items", type=int, default=_DEFAULT_MAX_ITEMS,
+        help="Maximum number of items to print")
+    parser_fetch.add_argument(
+        '-t', '--timeformat', choices=['UTC', 'EPOCHE', 'LOCALTIME'], default='UTC',
+        help='Timestamp format')
+    parser_fetch.add_argument(
+        '-o', '--output', choices=['json', 'ndjson', 'binary'], default='json',
+        help='Output format, ndjson prints one item per line, binary is a compact framed batch')
+    parser_fetch.add_argument(
+        "--after", type=int, default=0, metavar="ID",
+        help="Print items following item ID only (the cursor applies anyway)")
+    parser_fetch.add_argument(
+        "--ack-upto", type=int, metavar="ID",
+        help="Acknowledge all items up to item ID before fetching")
+    parser_fetch.add_argument(
+        "--clock", action="store_true",
+        help='Print the clock of this host first ({"_clock": <epoche>}, binary: "JTC1" frame)')
+
+    parser_fetch.add_argument(
+        "--filter", type=str, metavar="[-|FILE]",
+        help="""Items of these jobs only: JSON array of [instance, job] pairs, "-"
+        reads it from standard input. Example: [["P", "myjob"], ["I", "myjob"]]""")
+
+    parser_ack = subparsers.add_parser(
+        "ack", help="Acknowledge all items up to an item (moves the cursor)")
+    parser_ack.set_defaults(func=command_ack)
+    parser_ack.add_argument(
+        "--upto", type=int, metavar="ID", required=True,
+        help="Id of the last item to acknowledge")
+    parser_ack.add_argument(
+        "--purge-rows", type=int, default=_DEFAULT_PURGE_ROWS,
+        help="Delete acknowledged items once this many piled up. Default: %s" % _DEFAULT_PURGE_ROWS)
+
+    parser_agent = subparsers.add_parser(
+        "agent", help="Stream items to stdout, delete them when acknowledged on stdin")
+    parser_agent.set_defaults(func=command_agent)
+    parser_agent.add_argument(
+        "-i", "--max-items", type=int, default=_DEFAULT_MAX_ITEMS,
+        help="Maximum number of items to send at once")
+    parser_agent.add_argument(
+        '-t', '--timeformat', choices=['UTC', 'EPOCHE', 'LOCALTIME'], default='UTC',
+        help='Timestamp format')
+    parser_agent.add_argument(
+        "-p", "--poll-interval", type=float, default=_DEFAULT_POLL_INTERVAL,
+        help="Seconds between queue checks. Default: %s" % _DEFAULT_POLL_INTERVAL)
+
+    parser_serve = subparsers.add_parser(
+        "serve", help="Serve the queue on a unix socket")
+    parser_serve.set_defaults(func=command_serve)
+    parser_serve.add_argument(
+        "-s", "--socket", type=str, metavar="SOCKET", required=True,
+        help="Path of the unix socket")
+    parser_serve.add_argument(
+        '-t', '--timeformat', choices=['UTC', 'EPOCHE', 'LOCALTIME'], default='UTC',
+        help='Timestamp format')
 
     # parse the args and call the appropriate command function
     args = parser.parse_args()
@@ -0,0 +1,145 @@
+''' Tests of job_tracker and message-queue.py
+Module:
+    support
+Description:
+    shared helpers of the tests. run all tests from the files directory:
+
+        python -m unittest discover -s tests
+
+    the job_tracker modules import each other by module name, the tests
+    import them the same way (job_tracker directory on sys.path).
+'''
+
+import os
+import sys
+import imp
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+
+FILES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_TRACKER_DIR = os.path.join(FILES_DIR, 'job_tracker')
+MESSAGE_QUEUE = os.path.join(FILES_DIR, 'message-queue.py')
+CONFIG_TEMPLATE = os.path.join(os.path.dirname(FILES_DIR), 'templates', 'local-job_tracker.cfg')
+
+if JOB_TRACKER_DIR not in sys.path:
+    sys.path.insert(0, JOB_TRACKER_DIR)
+
+from config import Config
+
+_message_queue = None
+
+
+def get_logger():
+    ''' Returns:
+            logger (obj) discarding everything below critical '''
+
+    logger = logging.getLogger('job_tracker_tests')
+
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.CRITICAL)
+
+    return logger
+
+
+def make_config(directory, global_config=None, source_hosts=None):
+    ''' Takes:
+            directory (string) for the cfg file and the run dir
+            (optional) global_config (dict) overrides of the template
+            (optional) source_hosts (array) replaces the template hosts
+        Returns:
+            config (obj) loaded from the template cfg file '''
+
+    with open(CONFIG_TEMPLATE, 'r') as f_stream:
+        item = json.load(f_stream)
+
+    item['global_config'][0]['log_file'] = os.path.join(directory, 'job_tracker.log')
+    item['global_config'][0].update(global_config or {})
+
+    if source_hosts is not None:
+        item['source_hosts'] = source_hosts
+
+    filename = os.path.join(directory, 'job_tracker.cfg')
+
+    with open(filename, 'w') as f_stream:
+        json.dump(item, f_stream)
+
+    cfg = Config('job_tracker')
+    cfg.load_config(filename)
+    cfg.run_dir = directory
+
+    return cfg
+
+
+def load_message_queue():
+    ''' Returns:
+            message-queue.py loaded as module '''
+
+    global _message_queue
+
+    if _message_queue is None:
+        _message_queue = imp.load_source('message_queue', MESSAGE_QUEUE)
+
+    return _message_queue
+
+
+def make_queue(filename, messages=()):
+    ''' Takes:
+            filename (string) of the queue, created if needed
+            (optional) messages (array) of (instance, job, event, message) tuples
+        Returns:
+            filename (string) '''
+
+    queue = load_message_queue()
+    queue.create_db(filename)
+
+    for message in messages:
+        queue.enqueue(filename, *message)
+
+    return filename
+
+
+def make_jobs(cntr):
+    ''' Takes:
+            cntr (obj) controller
+        Returns:
+            jobs (array) of <cntr>'s cfg file, initialized as Controller.run does '''
+
+    from job_history import job_history
+    from job_ruler import checkmk
+    from reorder_buffer import reorder_buffer
+
+    cntr.setup()
+
+    jobs = []
+
+    for job in cntr.cfg.item['jobs']:
+        job['history'] = job_history(cntr.cfg, cntr.logger, job)
+        job['ruler'] = checkmk(cntr.cfg, cntr.logger, job)
+        job['reorder'] = reorder_buffer(cntr.cfg, cntr.logger, job)
+        jobs.append(job)
+        cntr.job_index.add((job['env'], job['name']))
+
+    return jobs
+
+
+class temp_dir_case(unittest.TestCase):
+    ''' test case with a temporary directory <self.dir>, removed afterwards '''
+
+    def setUp(self):
+
+        self.dir = tempfile.mkdtemp(prefix='job_tracker_test_')
+        self.logger = get_logger()
+
+
+    def tearDown(self):
+
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+    def make_config(self, global_config=None, source_hosts=None):
+
+        return make_config(self.dir, global_config, source_hosts)
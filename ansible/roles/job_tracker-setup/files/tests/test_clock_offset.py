@@ -0,0 +1,39 @@
+import support
+from clock_offset import clock_offset
+
+
+class clock_offset_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(clock_offset_test, self).setUp()
+        self.offset = clock_offset(self.make_config(dict(controller_interval_in_sec=10)), self.logger)
+
+
+    def test_sample_against_the_midpoint(self):
+
+        # clock 30 sec ahead, read halfway through a 2 sec round trip
+        self.offset.add_sample('h1', 1031.0, 1000.0, 1002.0)
+
+        self.assertAlmostEqual(self.offset.get_offset('h1'), 30.0)
+        self.assertAlmostEqual(self.offset.normalize('h1', 1031.0), 1001.0)
+        self.assertIn('h1', self.offset.drifting)
+
+
+    def test_slow_round_trips_count_less(self):
+
+        self.offset.add_sample('h1', 1000.5, 1000.0, 1001.0)
+        self.assertAlmostEqual(self.offset.get_offset('h1'), 0.0)
+
+        # round trip 10 times the best one: weight smoothing / 10
+        self.offset.add_sample('h1', 2010.0, 2000.0, 2010.0)
+        self.assertAlmostEqual(self.offset.get_offset('h1'), 5.0 * clock_offset.smoothing / 10)
+
+        self.offset.add_sample('h1', 3005.5, 3000.0, 3001.0)
+        self.assertAlmostEqual(self.offset.get_offset('h1'), 0.1 + clock_offset.smoothing * (5.0 - 0.1))
+
+
+    def test_unknown_host(self):
+
+        self.assertEqual(self.offset.get_offset('h2'), 0.0)
+        self.assertEqual(self.offset.normalize('h2', 1000.0), 1000.0)
@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import zlib
+import Queue
+import threading
+
+import support
+from controller import Controller
+from decoder import message_decoder
+
+
+class controller_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(controller_test, self).setUp()
+
+        self.queue = support.make_queue(os.path.join(self.dir, 'queue.sqlite'))
+        self.cfg = self.make_config(source_hosts=[ dict([ ('hostname', 'h1'),
+                                                          ('user', 'u'),
+                                                          ('key', ''),
+                                                          ('message_queue', self.queue),
+                                                          ('message_queue_handler', support.MESSAGE_QUEUE),
+                                                          ('transport', 'local-sqlite') ]) ])
+        self.cntr = Controller(self.cfg, self.logger)
+        self.jobs = support.make_jobs(self.cntr)
+
+
+    def tearDown(self):
+
+        for transport in self.cntr.transports.values():
+            transport.close()
+
+        super(controller_test, self).tearDown()
+
+
+    def run_cycle(self):
+
+        # every host due
+        self.cntr.poll_scheduler.next_poll.clear()
+        self.cntr.process_cycle(self.jobs, self.cntr.fetch_cycle())
+
+
+    def get_job(self, name):
+
+        return [ job for job in self.jobs if job['name'] == name ][0]
+
+
+    def test_message_text_fields_are_utf8_strings(self):
+
+        data = json.dumps([ dict([ ('_id', 1), ('timestamp', 1466000000.0), ('instance', u'P'), ('job', u'JOB02'),
+                                   ('event', u'STARTED'), ('message', u'Grüße ✓') ]) ])
+
+        message = self.cntr.get_message_as_dict(message_decoder().feed(data)[0], u'h1')
+
+        for key in ('id', 'source', 'env', 'job', 'event', 'message_text'):
+            self.assertIsInstance(message[key], str, key)
+
+        self.assertEqual(message['message_text'], 'Grüße ✓')
+
+
+    def test_cycle_with_non_ascii_message(self):
+
+        support.make_queue(self.queue, [ (u'P', u'JOB02', u'STARTED', u'Übertragung läuft ✓') ])
+
+        self.run_cycle()
+
+        history = self.get_job('JOB02')['history'].get_history()
+
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]['result'], 'STARTED - Übertragung läuft ✓')
+
+        # in the history, so acknowledged
+        self.assertEqual(self.cntr.get_transport(self.cfg.item['source_hosts'][0]).length(), 0)
+
+        # and read back the same way
+        self.get_job('JOB02')['history'].invalidate()
+        self.assertEqual(self.get_job('JOB02')['history'].get_history(), history)
+
+
+    def test_open_breaker_postpones_the_host(self):
+
+        self.cfg.item['source_hosts'][0]['message_queue'] = os.path.join(self.dir, 'missing.sqlite')
+        self.cntr.poll_scheduler.min_interval = self.cntr.poll_scheduler.max_interval = 0.0
+
+        for n in range(self.cfg.controller_breaker_failure_threshold):
+            self.cntr.fetch_cycle()
+
+        self.assertFalse(self.cntr.host_health.allow('h1'))
+
+        # the skipped host is not due before its backoff has passed
+        self.cntr.fetch_cycle()
+
+        self.assertAlmostEqual(self.cntr.poll_scheduler.get_time_to_next_poll(self.cfg.item['source_hosts']),
+                               self.cfg.controller_breaker_backoff_min, delta=1)
+
+
+    def test_acks_are_held_while_the_history_is_not_written(self):
+
+        history = self.get_job('JOB02')['history']
+        write_statements = history.file.write_statements
+        history.file.write_statements = lambda statements, content=None: False
+
+        support.make_queue(self.queue, [ ('P', 'JOB02', 'STARTED', 'first') ])
+        self.run_cycle()
+
+        # not acknowledged, still in the queue
+        self.assertEqual(self.cntr.get_transport(self.cfg.item['source_hosts'][0]).length(), 1)
+
+        history.file.write_statements = write_statements
+        support.make_queue(self.queue, [ ('P', 'JOB02', 'SUCCESS', 'second') ])
+        self.run_cycle()
+
+        self.assertEqual(self.cntr.get_transport(self.cfg.item['source_hosts'][0]).length(), 0)
+
+        history.invalidate()
+        self.assertEqual([ statement['result'] for statement in history.get_history() ], [ 'SUCCESS - second', 'STARTED - first' ])
+
+
+    def test_rulers_run_every_interval_while_no_host_is_due(self):
+
+        self.cfg.controller_interval = 0.2
+        self.cntr.poll_scheduler.postpone('h1', time.time() + 60)
+
+        start = time.time()
+        self.cntr.wait_for_next_cycle()
+
+        self.assertLess(time.time() - start, 1)
+
+        # a cycle without due hosts still evaluates the jobs
+        computed = []
+        ruler = self.get_job('JOB02')['ruler']
+        compute_status = ruler.compute_status
+
+        def count_computes(status):
+            computed.append(status)
+            return compute_status(status)
+
+        ruler.compute_status = count_computes
+        self.cntr.process_cycle(self.jobs, self.cntr.fetch_cycle())
+
+        self.assertEqual(len(computed), 1)
+
+
+    def test_messages_are_routed_to_their_jobs(self):
+
+        messages = [ dict(env='P', job='JOB02', n=1), dict(env='I', job='JOB01', n=2), dict(env='P', job='JOB02', n=3),
+                     dict(env='P', job='OTHER', n=4), dict(env='I', job='JOB02', n=5), dict(env='P', job='OTHER', n=6) ]
+
+        message_index = self.cntr.route_messages(messages)
+
+        self.assertEqual([ message['n'] for message in self.cntr.fetch_new_messages(self.get_job('JOB02'), message_index) ], [ 1, 3 ])
+        self.assertEqual([ message['n'] for message in self.cntr.fetch_new_messages(self.get_job('JOB01'), message_index) ], [ 2 ])
+
+        # messages of jobs not in the cfg file are counted
+        self.assertEqual(self.cntr.unknown_messages, dict([ (('P', 'OTHER'), 2), (('I', 'JOB02'), 1) ]))
+
+        self.cntr.route_messages(messages[3:4])
+        self.assertEqual(self.cntr.unknown_messages[('P', 'OTHER')], 3)
+
+
+    def test_message_identity_is_source_and_queue_id(self):
+
+        msg = dict([ ('_id', 5), ('timestamp', 1466000000.1234), ('instance', 'P'), ('job', 'JOB02'),
+                     ('event', 'STARTED'), ('message', 'load') ])
+
+        message = self.cntr.get_message_as_dict(msg, 'h1')
+
+        self.assertEqual(message['id'], '%08x:5:1466000000123' % (zlib.crc32('h1') & 0xffffffff))
+
+        # the length does not depend on the hostname
+        self.assertEqual(len(self.cntr.get_message_as_dict(msg, 'app1-local.a-rather-long-domain.example.com')['id']), len(message['id']))
+        self.assertEqual((message['source'], message['source_id']), ('h1', 5))
+
+        # the same row gives the same identity
+        self.assertEqual(self.cntr.get_message_as_dict(dict(msg), 'h1')['id'], message['id'])
+
+        # the same id on another host or reused after the queue ran empty does not
+        self.assertNotEqual(self.cntr.get_message_as_dict(msg, 'h2')['id'], message['id'])
+        self.assertNotEqual(self.cntr.get_message_as_dict(dict(msg, timestamp=1466000100.0), 'h1')['id'], message['id'])
+
+
+    def test_redelivered_message_is_written_once(self):
+
+        support.make_queue(self.queue, [ ('P', 'JOB02', 'STARTED', 'load') ])
+        self.run_cycle()
+
+        # e.g. the acknowledgement got lost, the row is delivered again
+        cycle = self.cntr.fetch_cycle()
+        self.assertEqual(cycle['message_stack'], [])
+
+        history = self.get_job('JOB02')['history'].get_history()
+        message = self.cntr.get_message_as_dict(dict([ ('_id', 1), ('timestamp', history[0]['epoche_from']),
+                                                        ('instance', 'P'), ('job', 'JOB02'),
+                                                        ('event', 'STARTED'), ('message', 'load') ]), 'h1')
+
+        self.cntr.process_cycle(self.jobs, dict(cycle, message_stack=[ message ]))
+
+        self.assertEqual(self.get_job('JOB02')['history'].get_history(), history)
+        self.assertEqual(history[0]['execution_id'], message['id'])
+
+
+    def test_pipelined_fetcher_stays_one_cycle_ahead(self):
+
+        fetched = []
+
+        def fetch_cycle():
+            fetched.append(len(fetched))
+            return dict(n=fetched[-1])
+
+        self.cntr.fetch_cycle = fetch_cycle
+        self.cntr.wait_for_next_cycle = lambda: None
+
+        cycles = Queue.Queue(maxsize=1)
+        taken = threading.Event()
+        fetcher = threading.Thread(target=self.cntr.run_fetcher, args=(cycles, taken))
+        fetcher.daemon = True
+        fetcher.start()
+
+        try:
+            self.assertEqual(cycles.get(timeout=5), dict(n=0))
+            time.sleep(0.2)
+
+            # the next cycle is fetched only once the previous one is taken
+            self.assertEqual(fetched, [ 0 ])
+
+            taken.set()
+            self.assertEqual(cycles.get(timeout=5), dict(n=1))
+
+        finally:
+            self.cfg.exit_flag = True
+            taken.set()
+            fetcher.join(5)
+
+        self.assertFalse(fetcher.is_alive())
+
+
+    def test_cycle_fetched_ahead_is_processed_on_exit(self):
+
+        fetched = []
+        processed = []
+
+        def fetch_cycle():
+            fetched.append(len(fetched))
+            return dict(n=fetched[-1])
+
+        def process_cycle(jobs, cycle, flush=False):
+            processed.append(cycle['n'])
+
+            # SIGTERM once the next cycle is fetched
+            deadline = time.time() + 5
+            while len(fetched) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.cfg.exit_flag = True
+
+        self.cfg.controller_pipeline = True
+        self.cntr.fetch_cycle = fetch_cycle
+        self.cntr.process_cycle = process_cycle
+        self.cntr.wait_for_next_cycle = lambda: None
+
+        self.cntr.run()
+
+        self.assertEqual(fetched, [ 0, 1 ])
+        self.assertEqual(processed, [ 0, 1 ])
+
+
+    def test_pipelined_fetcher_passes_errors_on(self):
+
+        def fetch_cycle():
+            raise Exception('corrupt message stack')
+
+        self.cntr.fetch_cycle = fetch_cycle
+
+        cycles = Queue.Queue(maxsize=1)
+        self.cntr.run_fetcher(cycles, threading.Event())
+
+        self.assertEqual(str(cycles.get_nowait()['error']), 'corrupt message stack')
+
+
+    def test_one_history_write_per_job_and_cycle(self):
+
+        history = self.get_job('JOB02')['history']
+        writes = []
+        write_statements = history.file.write_statements
+
+        def count_writes(statements, content=None):
+            writes.append(len(statements))
+            return write_statements(statements, content)
+
+        history.file.write_statements = count_writes
+
+        support.make_queue(self.queue, [ ('P', 'JOB02', event, 'load') for event in ('STARTED', 'SUCCESS', 'STARTED') ])
+        self.run_cycle()
+
+        self.assertEqual(writes, [ 3 ])
+
+
+    def test_sqlite_history_is_committed_per_cycle(self):
+
+        from sqlite_filer import get_database, history_database
+
+        self.cfg.history_backend = 'sqlite'
+        self.cfg.history_db = os.path.join(self.dir, 'job_history.sqlite')
+        jobs = self.jobs = support.make_jobs(self.cntr)
+
+        try:
+            support.make_queue(self.queue, [ (u'P', u'JOB02', u'STARTED', u'Übertragung ✓'), ('P', 'JOB02', 'SUCCESS', 'done') ])
+            self.run_cycle()
+
+            # visible to other connections once the cycle is done
+            reader = history_database(self.cfg, self.logger, self.cfg.history_db, readonly=True)
+            rows = reader.execute("SELECT result FROM history WHERE job = 'JOB02' ORDER BY id")
+            reader.close()
+
+            self.assertEqual(rows, [ ('STARTED - Übertragung ✓',), ('SUCCESS - done',) ])
+            self.assertEqual(self.cntr.get_transport(self.cfg.item['source_hosts'][0]).length(), 0)
+
+        finally:
+            for job in jobs:
+                job['history'].close()
+            get_database(self.cfg, self.logger).close()
+
+
+class controller_fetch_test(support.temp_dir_case):
+    ''' ssh hosts, the ssh commands run message-queue.py locally '''
+
+    def setUp(self):
+
+        super(controller_fetch_test, self).setUp()
+        self.cntrs = []
+
+
+    def tearDown(self):
+
+        for cntr in self.cntrs:
+            for transport in cntr.transports.values():
+                transport.close()
+
+        super(controller_fetch_test, self).tearDown()
+
+
+    def make_controller(self, hostnames, **global_config):
+
+        hosts = [ dict([ ('hostname', hostname),
+                         ('user', 'u'),
+                         ('key', ''),
+                         ('message_queue', support.make_queue(os.path.join(self.dir, '%s.sqlite' % hostname))),
+                         ('message_queue_handler', '%s %s' % (sys.executable, support.MESSAGE_QUEUE)) ])
+                  for hostname in hostnames ]
+
+        global_config.setdefault('controller_ssh_multiplexing', False)
+
+        cntr = Controller(self.make_config(global_config, hosts), self.logger)
+        cntr.get_ssh_command = lambda user, key, host: 'sh -c'
+        support.make_jobs(cntr)
+        self.cntrs.append(cntr)
+
+        return cntr
+
+
+    def add(self, cntr, hostname, count, job='JOB02'):
+
+        host = [ host for host in cntr.cfg.item['source_hosts'] if host['hostname'] == hostname ][0]
+
+        support.make_queue(host['message_queue'], [ ('P', job, 'STARTED', '%s %d' % (hostname, index)) for index in range(count) ])
+
+
+    def fetch(self, cntr):
+
+        cntr.poll_scheduler.next_poll.clear()
+
+        return cntr.fetch_cycle()
+
+
+    def test_pool_fetches_from_all_hosts(self):
+
+        cntr = self.make_controller([ 'h1', 'h2', 'h3' ], controller_data_load_workers=2)
+
+        for hostname in ('h1', 'h2', 'h3'):
+            self.add(cntr, hostname, 3)
+
+        messages = self.fetch(cntr)['message_stack']
+
+        self.assertEqual(sorted([ message['message_text'] for message in messages ]),
+                         sorted([ '%s %d' % (hostname, index) for hostname in ('h1', 'h2', 'h3') for index in range(3) ]))
+
+
+    def test_slow_hosts_are_fetched_concurrently(self):
+
+        hostnames = [ 'h1', 'h2', 'h3', 'h4' ]
+        cntr = self.make_controller(hostnames, controller_data_load_workers=4)
+
+        for host in cntr.cfg.item['source_hosts']:
+            host['message_queue_handler'] = 'sleep 0.5; ' + host['message_queue_handler']
+            self.add(cntr, host['hostname'], 1)
+
+        cycle = self.fetch(cntr)
+
+        self.assertEqual(len(cycle['message_stack']), 4)
+        self.assertLess(cycle['fetch_duration'], 1.5)
+
+
+    def test_default_fetch_runs_with_the_baseline_message_queue(self):
+
+        # message-queue.py of the source hosts is not deployed by the role. the
+        # original version accepts "remove -t -i" only, argparse exits with 2
+        script = os.path.join(self.dir, 'message-queue-baseline.sh')
+
+        with open(script, 'w') as f_stream:
+            f_stream.write('for arg in "$@"; do\n'
+                           '    case "$arg" in -o|--output|--clock|--filter|--after|--ack-upto|fetch|ack)\n'
+                           '        echo "unrecognized arguments: $arg" >&2; exit 2;;\n'
+                           '    esac\n'
+                           'done\n'
+                           'exec %s %s "$@"\n' % (sys.executable, support.MESSAGE_QUEUE))
+
+        cntr = self.make_controller([ 'h1' ], job_history_entry_count=10)
+        cntr.cfg.item['source_hosts'][0]['message_queue_handler'] = 'sh %s' % script
+        self.add(cntr, 'h1', 12)
+
+        self.assertEqual(cntr.get_transport(cntr.cfg.item['source_hosts'][0]).get_fetch_command(10),
+                         'sh -c "sh %s -f %s remove -t EPOCHE -i 10"' % (script, cntr.cfg.item['source_hosts'][0]['message_queue']))
+
+        messages = self.fetch(cntr)['message_stack']
+
+        self.assertEqual([ message['message_text'] for message in messages ], [ 'h1 %d' % index for index in range(12) ])
+        self.assertEqual(cntr.queue_remaining, dict(h1=0))
+
+
+    def test_failing_host_does_not_stop_the_others(self):
+
+        cntr = self.make_controller([ 'h1', 'h2' ])
+        self.add(cntr, 'h2', 2)
+        cntr.cfg.item['source_hosts'][0]['message_queue_handler'] = 'false'
+
+        messages = self.fetch(cntr)['message_stack']
+
+        self.assertEqual([ message['message_text'] for message in messages ], [ 'h2 0', 'h2 1' ])
+        self.assertEqual(cntr.queue_remaining, dict(h1=-1, h2=0))
+
+
+    def test_drain_pages_until_the_queue_is_empty(self):
+
+        cntr = self.make_controller([ 'h1' ], job_history_entry_count=10)
+        self.add(cntr, 'h1', 25)
+
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 25)
+        self.assertEqual(cntr.queue_remaining, dict(h1=0))
+
+
+    def test_drain_stops_when_the_budget_is_spent(self):
+
+        cntr = self.make_controller([ 'h1' ], job_history_entry_count=10, controller_drain_max_rows=10)
+        self.add(cntr, 'h1', 25)
+
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 10)
+        self.assertEqual(cntr.queue_remaining, dict(h1=15))
+
+        # the rest follows in the next cycles
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 10)
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 5)
+        self.assertEqual(cntr.queue_remaining, dict(h1=0))
+
+
+    def test_drain_budget_in_process(self):
+
+        cntr = self.make_controller([ 'h1' ], job_history_entry_count=10, controller_drain_max_rows=10)
+        cntr.cfg.item['source_hosts'][0]['transport'] = 'local-sqlite'
+        self.add(cntr, 'h1', 25)
+
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 10)
+        # not acknowledged yet, so still counted
+        self.assertEqual(cntr.queue_remaining, dict(h1=25))
+
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 10)
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 5)
+        self.assertEqual(cntr.queue_remaining, dict(h1=0))
+
+
+    def test_only_due_hosts_are_polled(self):
+
+        cntr = self.make_controller([ 'h1', 'h2' ], job_history_entry_count=10, controller_drain_max_rows=10,
+                                    controller_poll_interval_min_in_sec=0)
+        self.add(cntr, 'h1', 15)
+        self.add(cntr, 'h2', 1)
+
+        self.assertEqual(len(self.fetch(cntr)['message_stack']), 11)
+
+        # h1 has messages left and is due right away, h2 is not
+        self.add(cntr, 'h2', 1)
+        messages = cntr.fetch_cycle()['message_stack']
+
+        self.assertEqual(set([ message['source'] for message in messages ]), set([ 'h1' ]))
+        self.assertEqual(len(messages), 5)
+        self.assertGreater(cntr.poll_scheduler.get_interval('h2'), 0)
+
+
+class controller_stop_test(support.temp_dir_case):
+
+    def test_controller_from_an_unloaded_config(self):
+
+        from config import Config
+
+        # "job_tracker.py stop" does not load the cfg file
+        cntr = Controller(Config('job_tracker'), None)
+
+        self.assertEqual(cntr.pidfile_path, Config('job_tracker').pidfile_path)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+
+import support
+from decoder import message_decoder, binary_decoder
+
+
+MESSAGES = [ dict([ ('_id', index), ('timestamp', 1466000000.0 + index), ('instance', u'P'), ('job', u'JOB02'),
+                    ('event', u'STARTED'), ('message', u'Grüße [%d], {ok}' % index) ])
+             for index in range(1, 4) ]
+
+
+def feed_in_chunks(decoder, data, size):
+
+    messages = []
+
+    for pos in range(0, len(data), size):
+        messages.extend(decoder.feed(data[pos:pos + size]))
+
+    decoder.close()
+
+    return messages
+
+
+class message_decoder_test(support.temp_dir_case):
+
+    def test_json_array(self):
+
+        self.assertEqual(feed_in_chunks(message_decoder(), json.dumps(MESSAGES), 1 << 16), MESSAGES)
+
+
+    def test_ndjson_in_small_chunks(self):
+
+        data = ''.join([ json.dumps(msg) + '\n' for msg in MESSAGES ])
+
+        for size in (1, 7, 64):
+            self.assertEqual(feed_in_chunks(message_decoder(), data, size), MESSAGES)
+
+
+    def test_message_is_returned_when_complete(self):
+
+        decoder = message_decoder()
+        data = json.dumps(MESSAGES[0]) + '\n'
+
+        self.assertEqual(decoder.feed(data[:-5]), [])
+        self.assertEqual(decoder.feed(data[-5:] + json.dumps(MESSAGES[1])[:10]), [ MESSAGES[0] ])
+
+
+    def test_control_records(self):
+
+        data = '{"_clock": 1466000000.5}\n%s\n{"_cursor": 7}\n' % json.dumps(MESSAGES[0])
+
+        self.assertEqual(feed_in_chunks(message_decoder(), data, 3),
+                         [ dict(_clock=1466000000.5), MESSAGES[0], dict(_cursor=7) ])
+
+
+    def test_empty_output(self):
+
+        for data in ('', '[]', '[]\n', '\n'):
+            self.assertEqual(feed_in_chunks(message_decoder(), data, 1), [])
+
+
+    def test_incomplete_stream(self):
+
+        decoder = message_decoder()
+        decoder.feed(json.dumps(MESSAGES)[:-20])
+
+        self.assertRaises(ValueError, decoder.close)
+
+
+    def test_invalid_data_is_not_evaluated(self):
+
+        decoder = message_decoder()
+
+        self.assertEqual(decoder.feed('__import__("os").system("false")\n'), [])
+        self.assertRaises(ValueError, decoder.close)
+
+
+class binary_decoder_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(binary_decoder_test, self).setUp()
+        self.mq = support.load_message_queue()
+
+
+    def encode(self, msgs):
+
+        return self.mq.encode_binary(msgs)
+
+
+    def expected(self, msgs):
+
+        return [ dict([ (key, value.encode('utf-8') if isinstance(value, unicode) else value) for key, value in msg.items() ])
+                 for msg in msgs ]
+
+
+    def test_batches_in_small_chunks(self):
+
+        data = (binary_decoder.clock.pack('JTC1', 1466000000.5) + self.encode(MESSAGES[:2]) +
+                self.encode([]) + self.encode(MESSAGES[2:]) + binary_decoder.cursor.pack('JTK1', 9))
+
+        for size in (1, 5, 4096):
+            self.assertEqual(feed_in_chunks(binary_decoder(), data, size),
+                             [ dict(_clock=1466000000.5) ] + self.expected(MESSAGES) + [ dict(_cursor=9) ])
+
+
+    def test_shared_strings_are_sent_once(self):
+
+        data = self.encode(MESSAGES)
+
+        self.assertEqual(data.count('JOB02'), 1)
+        self.assertEqual(data.count('STARTED'), 1)
+        self.assertEqual(feed_in_chunks(binary_decoder(), data, 1), self.expected(MESSAGES))
+
+
+    def test_incomplete_batch(self):
+
+        decoder = binary_decoder()
+
+        self.assertEqual(decoder.feed(self.encode(MESSAGES)[:-1]), self.expected(MESSAGES[:2]))
+        self.assertRaises(ValueError, decoder.close)
+
+
+    def test_invalid_header(self):
+
+        self.assertRaises(ValueError, binary_decoder().feed, '[{"_id": 1}]' + '\0' * 8)
+
+
+    def test_invalid_string_reference(self):
+
+        data = 'JTB1' + struct.pack('!IH', 1, 0) + struct.pack('!QdHHHI', 1, 0.0, 0, 0, 0, 0)
+
+        self.assertRaises(ValueError, binary_decoder().feed, data)
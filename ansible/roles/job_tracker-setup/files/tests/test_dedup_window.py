@@ -0,0 +1,63 @@
+import support
+from dedup_window import dedup_window
+
+
+def make_message(source_id, timestamp, source='h1', event='STARTED', text='load'):
+
+    return dict([ ('id', '%s:%d:%d' % (source, source_id, int(round(timestamp * 1000)))),
+                  ('source', source),
+                  ('source_id', source_id),
+                  ('epoche_timestamp', timestamp),
+                  ('env', 'P'),
+                  ('job', 'JOB02'),
+                  ('event', event),
+                  ('message_text', text) ])
+
+
+class dedup_window_test(support.temp_dir_case):
+
+    def make_window(self, **global_config):
+
+        return dedup_window(self.make_config(global_config), self.logger)
+
+
+    def test_redelivery_is_dropped(self):
+
+        window = self.make_window()
+
+        first = [ make_message(1, 1000.0), make_message(2, 1001.0) ]
+
+        self.assertEqual(window.filter(first), first)
+        self.assertEqual(window.filter(first + [ make_message(3, 1002.0) ]), [ make_message(3, 1002.0) ])
+        self.assertEqual(window.identity_hits, 2)
+
+
+    def test_identical_events_are_kept_by_default(self):
+
+        window = self.make_window()
+
+        # a job reporting the same event twice within a second
+        messages = [ make_message(1, 1000.0), make_message(2, 1000.5), make_message(1, 1000.2, source='h2') ]
+
+        self.assertEqual(window.filter(messages), messages)
+
+
+    def test_content_tolerance(self):
+
+        window = self.make_window(controller_dedup_content_tolerance_sec=1.0)
+
+        messages = [ make_message(1, 1000.0), make_message(1, 1000.4, source='h2'),
+                     make_message(2, 1000.5, event='SUCCESS'), make_message(3, 1005.0) ]
+
+        self.assertEqual(window.filter(messages), [ messages[0] ] + messages[2:])
+        self.assertEqual(window.content_hits, 1)
+
+
+    def test_window_limits(self):
+
+        window = self.make_window(controller_dedup_window_entries=2)
+
+        window.filter([ make_message(n, 1000.0 + n) for n in range(5) ])
+
+        self.assertEqual(len(window.seen), 2)
+        self.assertEqual(window.filter([ make_message(0, 1000.0) ]), [ make_message(0, 1000.0) ])
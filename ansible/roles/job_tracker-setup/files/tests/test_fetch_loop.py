@@ -0,0 +1,99 @@
+import time
+import threading
+
+import support
+from fetch_loop import fetch_loop
+
+
+class fetch_loop_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(fetch_loop_test, self).setUp()
+        self.cfg = self.make_config()
+        self.cfg.controller_fetch_timeout = 10
+        self.loop = fetch_loop(self.cfg, self.logger)
+
+
+    def test_output_and_rc(self):
+
+        results = self.loop.run([ ('a', 'echo a'), ('b', 'echo b >&2; exit 3') ])
+
+        self.assertEqual(results['a'], dict(stdout='a', stderr='', rc=0, timed_out=False))
+        self.assertEqual(results['b'], dict(stdout='', stderr='b', rc=3, timed_out=False))
+
+
+    def test_large_stdin_does_not_block_the_loop(self):
+
+        data = 'x' * (4 * 1024 * 1024)
+        arrival = dict()
+        start = time.time()
+
+        def on_stdout(key, chunk):
+            arrival.setdefault(key, time.time() - start)
+
+        # the first command reads its stdin only after a second
+        results = self.loop.run([ ('slow', 'sleep 1; wc -c', data), ('fast', 'echo fast') ], on_stdout)
+
+        self.assertEqual(results['slow']['rc'], 0)
+        self.assertEqual(results['fast']['rc'], 0)
+        self.assertLess(arrival['fast'], 0.9)
+        self.assertGreaterEqual(arrival['slow'], 1)
+
+
+    def test_stdin_is_passed_completely(self):
+
+        data = ''.join([ '%d\n' % index for index in range(200000) ])
+
+        results = self.loop.run([ ('cat', 'cat', data) ])
+
+        self.assertEqual(results['cat']['stdout'], data.rstrip())
+
+
+    def test_command_not_reading_stdin(self):
+
+        results = self.loop.run([ ('true', 'exit 0', 'x' * (1024 * 1024)) ])
+
+        self.assertEqual(results['true']['rc'], 0)
+
+
+    def test_timeout_while_writing_stdin(self):
+
+        self.cfg.controller_fetch_timeout = 0.5
+
+        results = self.loop.run([ ('stuck', 'sleep 5', 'x' * (1024 * 1024)) ])
+
+        self.assertTrue(results['stuck']['timed_out'])
+
+
+    def set_exit_flag_after(self, delay):
+
+        timer = threading.Timer(delay, setattr, (self.cfg, 'exit_flag', True))
+        timer.start()
+
+        return timer
+
+
+    def test_running_commands_finish_on_exit(self):
+
+        self.cfg.controller_max_fetches_in_flight = 1
+        timer = self.set_exit_flag_after(0.2)
+
+        # e.g. "message-queue.py remove", its messages are deleted already
+        results = self.loop.run([ ('running', 'sleep 0.5; echo done'), ('next', 'echo next') ])
+        timer.join()
+
+        self.assertEqual(results, dict(running=dict(stdout='done', stderr='', rc=0, timed_out=False)))
+
+
+    def test_cursor_protocol_cancels_on_exit(self):
+
+        self.cfg.controller_queue_protocol = 'cursor'
+        timer = self.set_exit_flag_after(0.2)
+
+        start = time.time()
+        results = self.loop.run([ ('running', 'sleep 5; echo done') ])
+        timer.join()
+
+        self.assertTrue(results['running']['timed_out'])
+        self.assertLess(time.time() - start, 2)
@@ -0,0 +1,99 @@
+import os
+
+import support
+import record_codec
+from filer import filer
+
+
+def make_statement(index, result='SUCCESS - done'):
+
+    return dict([ ('execution_id', 'h1:%d:0' % index),
+                  ('epoche_from', 1000.0 + index),
+                  ('epoche_until', 1000.0 + index),
+                  ('result', result) ])
+
+
+class filer_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(filer_test, self).setUp()
+        self.filename = os.path.join(self.dir, 'JOB02__P.job_history')
+
+
+    def make_filer(self, entry_count=5, compaction_records=1000):
+
+        cfg = self.make_config(dict(job_history_entry_count=entry_count, history_compaction_records=compaction_records))
+
+        return filer(cfg, self.logger, self.filename)
+
+
+    def count_lines(self):
+
+        with open(self.filename, 'r') as f_stream:
+            return len(f_stream.readlines())
+
+
+    def test_entries_are_appended(self):
+
+        history_file = self.make_filer()
+
+        for index in (1, 0, 2):
+            self.assertTrue(history_file.write_statement(make_statement(index)))
+
+        # header and one line per entry
+        self.assertEqual(self.count_lines(), 4)
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (2, 1, 0) ])
+        self.assertEqual(history_file.get_last_statement(), make_statement(2))
+        self.assertEqual(history_file.read_content(since=1001.0, until=1002.0), [ make_statement(1) ])
+
+
+    def test_read_content_is_limited_to_the_entry_count(self):
+
+        history_file = self.make_filer(entry_count=3)
+        history_file.write_statements([ make_statement(index) for index in range(6) ])
+
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (5, 4, 3) ])
+
+
+    def test_compaction_trims_and_sorts_the_file(self):
+
+        history_file = self.make_filer(entry_count=3, compaction_records=4)
+
+        history_file.write_statements([ make_statement(index) for index in (0, 2, 1) ])
+        self.assertEqual(self.count_lines(), 4)
+
+        history_file.write_statement(make_statement(3))
+
+        self.assertEqual(self.count_lines(), 4)
+        self.assertEqual(history_file.appended_records, 0)
+        self.assertFalse(os.path.exists(self.filename + '.tmp'))
+
+        with open(self.filename, 'r') as f_stream:
+            lines = f_stream.readlines()
+
+        # oldest first, appending keeps the order
+        self.assertEqual(record_codec.decode_records(lines), [ make_statement(index) for index in (1, 2, 3) ])
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (3, 2, 1) ])
+
+
+    def test_existing_file_is_compacted_with_the_first_write(self):
+
+        history_file = self.make_filer(entry_count=2)
+        history_file.write_statements([ make_statement(index) for index in range(4) ])
+
+        history_file = self.make_filer(entry_count=2)
+        history_file.write_statement(make_statement(4))
+
+        self.assertEqual(self.count_lines(), 3)
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (4, 3) ])
+
+
+    def test_failed_write(self):
+
+        history_file = self.make_filer()
+        os.remove(self.filename)
+        os.mkdir(self.filename)
+
+        self.assertFalse(history_file.write_statement(make_statement(0)))
+        self.assertEqual(history_file.read_content(), [])
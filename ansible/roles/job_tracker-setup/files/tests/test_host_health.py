@@ -0,0 +1,69 @@
+import os
+import time
+
+import support
+from host_health import host_health
+
+
+class host_health_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(host_health_test, self).setUp()
+        self.cfg = self.make_config(dict([ ('controller_breaker_failure_threshold', 2),
+                                           ('controller_breaker_backoff_min_in_sec', 10),
+                                           ('controller_breaker_backoff_max_in_sec', 25) ]))
+        self.health = host_health(self.cfg, self.logger)
+
+
+    def read_status_file(self, hostname):
+
+        with open(os.path.join(self.dir, 'source_host__%s.state' % hostname)) as f_stream:
+            return f_stream.read()
+
+
+    def test_opens_after_threshold(self):
+
+        self.health.record_failure('h1', 'unreachable')
+        self.assertTrue(self.health.allow('h1'))
+        self.assertEqual(self.health.get_open_until('h1'), 0.0)
+
+        self.health.record_failure('h1', 'unreachable')
+        self.assertFalse(self.health.allow('h1'))
+        self.assertAlmostEqual(self.health.get_open_until('h1'), time.time() + 10, delta=1)
+        self.assertTrue(self.read_status_file('h1').startswith('2 '))
+
+
+    def test_probe_after_backoff(self):
+
+        for n in range(2):
+            self.health.record_failure('h1')
+
+        self.health.breakers['h1']['open_until'] = time.time() - 1
+
+        self.assertTrue(self.health.allow('h1'))
+        self.assertEqual(self.health.breakers['h1']['state'], host_health.state_half_open)
+
+        # a failed probe opens it again with doubled backoff, up to the max
+        self.health.record_failure('h1')
+        self.assertFalse(self.health.allow('h1'))
+        self.assertEqual(self.health.breakers['h1']['backoff'], 20)
+
+        self.health.breakers['h1']['open_until'] = time.time() - 1
+        self.health.allow('h1')
+        self.health.record_failure('h1')
+        self.assertEqual(self.health.breakers['h1']['backoff'], 25)
+
+
+    def test_success_closes(self):
+
+        for n in range(2):
+            self.health.record_failure('h1')
+
+        self.health.breakers['h1']['open_until'] = time.time() - 1
+        self.health.allow('h1')
+        self.health.record_success('h1')
+
+        self.assertTrue(self.health.allow('h1'))
+        self.assertEqual(self.health.breakers['h1']['failures'], 0)
+        self.assertTrue(self.read_status_file('h1').startswith('0 '))
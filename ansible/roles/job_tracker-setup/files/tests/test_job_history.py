@@ -0,0 +1,182 @@
+import os
+
+import support
+from filer import filer
+from ring_filer import ring_filer
+from job_history import get_history_file, job_history
+
+
+def make_statement(index, result='SUCCESS - done'):
+
+    return dict([ ('execution_id', 'id%d' % index),
+                  ('epoche_from', 1000.0 + index),
+                  ('epoche_until', 1000.0 + index),
+                  ('result', result) ])
+
+
+class job_history_test(support.temp_dir_case):
+
+    def make_history_config(self, backend, **global_config):
+
+        global_config.update(history_backend=backend, history_db=os.path.join(self.dir, 'job_history.sqlite'))
+
+        return self.make_config(global_config)
+
+
+    def get_filename(self, extension='job_history'):
+
+        return os.path.join(self.dir, 'JOB02__P.%s' % extension)
+
+
+    def write_v1_file(self, count):
+
+        with open(self.get_filename(), 'w') as f_stream:
+            for index in range(count):
+                f_stream.write('%r\n' % make_statement(index))
+
+
+    def read_bytes(self, filename):
+
+        with open(filename, 'rb') as f_stream:
+            return f_stream.read()
+
+
+    def test_file_backend_converts_old_files(self):
+
+        self.write_v1_file(3)
+        cfg = self.make_history_config('file')
+
+        history_file = get_history_file(cfg, self.logger, 'JOB02', 'P')
+
+        self.assertTrue(self.read_bytes(self.get_filename()).startswith('{"_format":"job_history","_version":2}\n'))
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (2, 1, 0) ])
+
+
+    def test_readonly_file(self):
+
+        self.write_v1_file(3)
+        before = self.read_bytes(self.get_filename())
+        cfg = self.make_history_config('file')
+
+        history_file = get_history_file(cfg, self.logger, 'JOB02', 'P', readonly=True)
+
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (2, 1, 0) ])
+        self.assertEqual(self.read_bytes(self.get_filename()), before)
+
+        get_history_file(cfg, self.logger, 'JOB01', 'I', readonly=True).read_content()
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'JOB01__I.job_history')))
+
+
+    def test_readonly_sqlite(self):
+
+        self.write_v1_file(3)
+        cfg = self.make_history_config('sqlite')
+
+        # no database yet: none is created, the history file is not imported
+        history_file = get_history_file(cfg, self.logger, 'JOB02', 'P', readonly=True)
+
+        self.assertEqual(history_file.read_content(), [])
+        self.assertFalse(os.path.exists(cfg.history_db))
+
+        writer = get_history_file(cfg, self.logger, 'JOB02', 'P')
+        writer.write_statement(make_statement(3))
+        writer.db.commit()
+
+        history_file = get_history_file(cfg, self.logger, 'JOB02', 'P', readonly=True)
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (3, 2, 1, 0) ])
+
+        history_file.db.close()
+        writer.db.close()
+
+
+    def test_readonly_ring_keeps_its_layout(self):
+
+        cfg = self.make_history_config('ring', job_history_entry_count=5)
+        ring = ring_filer(cfg, self.logger, self.get_filename('job_ring'))
+        ring.write_statements([ make_statement(index) for index in range(3) ])
+        ring.close()
+
+        before = self.read_bytes(self.get_filename('job_ring'))
+        cfg = self.make_history_config('ring', job_history_entry_count=10, history_ring_text_bytes=64)
+
+        history_file = get_history_file(cfg, self.logger, 'JOB02', 'P', readonly=True)
+
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (2, 1, 0) ])
+        history_file.close()
+
+        self.assertEqual(self.read_bytes(self.get_filename('job_ring')), before)
+
+        get_history_file(cfg, self.logger, 'JOB01', 'I', readonly=True).read_content()
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'JOB01__I.job_ring')))
+
+
+    def test_commit_writes_once_per_cycle(self):
+
+        cfg = self.make_history_config('file')
+        history = job_history(cfg, self.logger, dict(name='JOB02', env='P'))
+
+        history.interpret_new_messages([ dict([ ('id', 'h1:%d:0' % index),
+                                                ('epoche_timestamp', 1000.0 + index),
+                                                ('event', event),
+                                                ('message_text', 'load') ])
+                                         for index, event in enumerate([ 'STARTED', 'SUCCESS' ]) ])
+
+        self.assertEqual(history.pending, [])
+
+        content = filer(cfg, self.logger, self.get_filename()).read_content()
+
+        self.assertEqual([ (statement['epoche_from'], statement['result']) for statement in content ],
+                         [ (1000.0, 'SUCCESS - load'), (1000.0, 'STARTED - load') ])
+        self.assertEqual(content, history.get_history())
+
+
+    def test_history_is_read_once(self):
+
+        self.write_v1_file(3)
+        history = job_history(self.make_history_config('file'), self.logger, dict(name='JOB02', env='P'))
+
+        reads = []
+        read_content = history.file.read_content
+
+        def count_reads(*args):
+            reads.append(args)
+            return read_content(*args)
+
+        history.file.read_content = count_reads
+
+        for n in range(3):
+            history.get_status()
+            history.get_last_statement()
+
+        self.assertEqual(len(reads), 1)
+
+
+    def test_cache_is_written_through(self):
+
+        cfg = self.make_history_config('file', job_history_entry_count=3)
+        history = job_history(cfg, self.logger, dict(name='JOB02', env='P'))
+
+        # out of order, the cache sorts as the file does
+        for index in (1, 4, 0, 3, 2):
+            history.write_statement(make_statement(index))
+
+        self.assertEqual(history.get_history(), [ make_statement(index) for index in (4, 3, 2) ])
+
+        self.assertTrue(history.commit())
+        self.assertEqual(filer(cfg, self.logger, self.get_filename()).read_content(), history.get_history())
+
+
+    def test_invalidate_reads_the_file_again(self):
+
+        cfg = self.make_history_config('file')
+        history = job_history(cfg, self.logger, dict(name='JOB02', env='P'))
+        history.write_statement(make_statement(0))
+        history.commit()
+
+        # e.g. edited while the controller is running, followed by a SIGHUP
+        filer(cfg, self.logger, self.get_filename()).write_statement(make_statement(1))
+
+        self.assertEqual(history.get_history(), [ make_statement(0) ])
+
+        history.invalidate()
+        self.assertEqual(history.get_history(), [ make_statement(index) for index in (1, 0) ])
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import subprocess
+
+import support
+
+
+class message_queue_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(message_queue_test, self).setUp()
+        self.queue = support.make_queue(os.path.join(self.dir, 'queue.sqlite'))
+        self.mq = support.load_message_queue()
+        self.mq.set_timeformat('EPOCHE')
+
+
+    def add(self, count, job='JOB02', instance='P'):
+
+        support.make_queue(self.queue, [ (instance, job, 'STARTED', 'message %d' % index) for index in range(count) ])
+
+
+    def run_queue(self, *args, **kwargs):
+        ''' Returns:
+                stdout (string) of message-queue.py with <args> '''
+
+        p = subprocess.Popen([ sys.executable, support.MESSAGE_QUEUE, '-f', self.queue ] + list(args),
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate(kwargs.get('stdin'))
+
+        self.assertEqual(p.returncode, 0, err)
+
+        return out
+
+
+    def run_json(self, *args, **kwargs):
+
+        return [ json.loads(line) for line in self.run_queue(*args, **kwargs).splitlines() ]
+
+
+    def test_fetch_and_ack(self):
+
+        self.add(5)
+
+        first = self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson', '-i', '3')
+        self.assertEqual([ msg['message'] for msg in first ], [ 'message 0', 'message 1', 'message 2' ])
+
+        # fetch leaves the items in the queue
+        self.assertEqual(self.run_queue('length').strip(), '5')
+
+        second = self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson', '-i', '3', '--after', str(first[-1]['_id']),
+                               '--ack-upto', str(first[-1]['_id']))
+        self.assertEqual([ msg['message'] for msg in second ], [ 'message 3', 'message 4' ])
+        self.assertEqual(self.run_queue('length').strip(), '2')
+
+        # without --after the cursor applies
+        self.assertEqual(self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson'), second)
+
+        self.run_queue('ack', '--upto', str(second[-1]['_id']))
+        self.assertEqual(self.run_queue('length').strip(), '0')
+        self.assertEqual(self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson'), [])
+
+
+    def test_ack_purges_in_bulk_and_keeps_ids_unique(self):
+
+        self.add(5)
+
+        con, cur = self.mq.open_db(self.queue)
+        self.assertEqual(self.mq.ack_upto(con, cur, 100, purge_rows=3), 5)
+
+        # the last acknowledged item is kept, its id is not handed out again
+        cur.execute("SELECT id FROM messages")
+        self.assertEqual(cur.fetchall(), [ (5,) ])
+        con.close()
+
+        self.add(1)
+        self.assertEqual([ msg['_id'] for msg in self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson') ], [ 6 ])
+
+
+    def test_remove(self):
+
+        self.add(3)
+
+        removed = self.run_json('remove', '-t', 'EPOCHE', '-o', 'ndjson', '-i', '2')
+
+        self.assertEqual([ msg['message'] for msg in removed ], [ 'message 0', 'message 1' ])
+        self.assertEqual(self.run_queue('length').strip(), '1')
+
+
+    def test_filtered_fetch(self):
+
+        self.add(2, job='JOB02')
+        self.add(3, job='OTHER')
+        self.add(1, job='JOB01', instance='I')
+
+        job_filter = json.dumps([ [ 'P', 'JOB02' ], [ 'I', 'JOB01' ] ])
+        records = self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson', '-i', '10', '--filter', '-', stdin=job_filter)
+
+        self.assertEqual([ (msg['job'], msg['_id']) for msg in records[:-1] ], [ ('JOB02', 1), ('JOB02', 2), ('JOB01', 6) ])
+        self.assertEqual(records[-1], dict(_cursor=6))
+
+        # a full page was scanned up to its last item
+        records = self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson', '-i', '1', '--after', '1', '--filter', '-', stdin=job_filter)
+        self.assertEqual(records, [ records[0], dict(_cursor=2) ])
+
+
+    def test_filtered_remove_deletes_the_scanned_items(self):
+
+        self.add(2, job='OTHER')
+        self.add(1, job='JOB02')
+
+        records = self.run_json('remove', '-t', 'EPOCHE', '-o', 'ndjson', '--filter', '-', stdin='[["P", "JOB02"]]')
+
+        self.assertEqual([ msg['_id'] for msg in records[:-1] ], [ 3 ])
+        self.assertEqual(records[-1], dict(_cursor=3))
+        self.assertEqual(self.run_queue('length').strip(), '0')
+
+        self.assertEqual([ msg['job'] for msg in self.run_json('list', '-t', 'EPOCHE', '-o', 'ndjson') ], [])
+
+
+    def test_filtered_list(self):
+
+        self.add(1, job='OTHER')
+        self.add(1, job='JOB02')
+
+        records = self.run_json('list', '-t', 'EPOCHE', '-o', 'ndjson', '--filter', '-', stdin='[["P", "JOB02"]]')
+
+        self.assertEqual([ msg['job'] for msg in records ], [ 'JOB02' ])
+
+
+    def test_item_added_during_a_filtered_scan_is_not_skipped(self):
+
+        self.add(2, job='OTHER')
+
+        con, cur = self.mq.open_db(self.queue)
+        self.mq.set_filter(con, cur, [ ('P', 'JOB02') ])
+
+        select_new_items = self.mq.select_new_items
+
+        def select_while_adding(*args, **kwargs):
+            # another process adds a matching item right before the select
+            self.add(1, job='JOB02')
+            return select_new_items(*args, **kwargs)
+
+        self.mq.select_new_items = select_while_adding
+        try:
+            msgs, scanned = self.mq.select_filtered_items(cur, 0, 10)
+        finally:
+            self.mq.select_new_items = select_new_items
+
+        # scanned up to the newest item before the select, the new one follows
+        self.assertEqual((msgs, scanned), ([], 2))
+
+        msgs, scanned = self.mq.select_filtered_items(cur, scanned, 10)
+        self.assertEqual(([ msg['_id'] for msg in msgs ], scanned), ([ 3 ], 3))
+
+        con.close()
+
+
+    def test_binary_output(self):
+
+        from decoder import binary_decoder
+
+        support.make_queue(self.queue, [ (u'P', u'JOB02', u'STARTED', u'Grüße ✓'), ('P', 'JOB02', 'SUCCESS', 'done') ])
+
+        decoder = binary_decoder()
+        records = decoder.feed(self.run_queue('fetch', '-t', 'EPOCHE', '-o', 'binary', '--clock'))
+        decoder.close()
+
+        self.assertEqual(records[0].keys(), [ '_clock' ])
+        self.assertEqual([ (msg['_id'], msg['event'], msg['message']) for msg in records[1:] ],
+                         [ (1, 'STARTED', u'Grüße ✓'.encode('utf-8')), (2, 'SUCCESS', 'done') ])
+
+        json_records = self.run_json('fetch', '-t', 'EPOCHE', '-o', 'ndjson')
+        self.assertEqual([ msg['timestamp'] for msg in records[1:] ], [ msg['timestamp'] for msg in json_records ])
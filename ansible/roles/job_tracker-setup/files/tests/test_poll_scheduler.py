@@ -0,0 +1,61 @@
+import time
+
+import support
+from poll_scheduler import poll_scheduler
+
+
+class poll_scheduler_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(poll_scheduler_test, self).setUp()
+        self.cfg = self.make_config(dict([ ('controller_interval_in_sec', 10),
+                                           ('controller_poll_interval_min_in_sec', 2),
+                                           ('controller_poll_interval_max_in_sec', 30) ]))
+        self.scheduler = poll_scheduler(self.cfg, self.logger)
+        self.hosts = [ dict(hostname='h1'), dict(hostname='h2') ]
+
+
+    def test_new_hosts_are_due(self):
+
+        self.assertEqual(self.scheduler.get_due_hosts(self.hosts), self.hosts)
+        self.assertEqual(self.scheduler.get_time_to_next_poll(self.hosts), 0.0)
+
+
+    def test_intervals_adapt(self):
+
+        self.scheduler.update('h1', 5)
+        self.assertEqual(self.scheduler.get_interval('h1'), 5)
+
+        self.scheduler.update('h1', 0)
+        self.assertEqual(self.scheduler.get_interval('h1'), 7.5)
+
+        self.scheduler.update('h1', 10, queue_remaining=100)
+        self.assertEqual(self.scheduler.get_interval('h1'), 2)
+
+        for n in range(10):
+            self.scheduler.update('h1', 0)
+        self.assertEqual(self.scheduler.get_interval('h1'), 30)
+
+        self.assertEqual(self.scheduler.get_due_hosts(self.hosts), [ dict(hostname='h2') ])
+
+
+    def test_time_to_next_poll(self):
+
+        self.scheduler.update('h1', 0)
+        self.scheduler.update('h2', 1)
+
+        self.assertAlmostEqual(self.scheduler.get_time_to_next_poll(self.hosts), 5, delta=0.5)
+
+
+    def test_postpone(self):
+
+        self.scheduler.postpone('h1', time.time() + 20)
+        self.scheduler.update('h2', 0)
+
+        self.assertEqual(self.scheduler.get_due_hosts(self.hosts), [])
+        self.assertAlmostEqual(self.scheduler.get_time_to_next_poll(self.hosts), 15, delta=0.5)
+
+        # never brought forward
+        self.scheduler.postpone('h2', 0.0)
+        self.assertAlmostEqual(self.scheduler.get_time_to_next_poll(self.hosts), 15, delta=0.5)
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+
+import support
+from queue_agent import queue_agent_pool
+
+
+class queue_agent_test(support.temp_dir_case):
+    ''' the agents run message-queue.py locally instead of over ssh '''
+
+    def setUp(self):
+
+        super(queue_agent_test, self).setUp()
+
+        self.queue = support.make_queue(os.path.join(self.dir, 'queue.sqlite'))
+        self.cfg = self.make_config(source_hosts=[ dict([ ('hostname', 'h1'),
+                                                          ('user', 'u'),
+                                                          ('key', ''),
+                                                          ('message_queue', self.queue),
+                                                          ('message_queue_handler', '%s %s' % (sys.executable, support.MESSAGE_QUEUE)) ]) ])
+        self.pool = queue_agent_pool(self.cfg, self.logger, lambda user, key, host: 'exec sh -c')
+
+
+    def tearDown(self):
+
+        self.pool.stop_all()
+        super(queue_agent_test, self).tearDown()
+
+
+    def add(self, *messages):
+
+        support.make_queue(self.queue, [ ('P', 'JOB02', 'STARTED', message) for message in messages ])
+
+
+    def collect(self, count, timeout=5):
+        ''' Returns:
+                (hostname, message text) of the next <count> messages '''
+
+        deadline = time.time() + timeout
+        collected = self.pool.collect()
+
+        while len(collected) < count and time.time() < deadline:
+            self.pool.wait(0.1)
+            collected.extend(self.pool.collect())
+
+        return [ (hostname, msg['message']) for hostname, msg in collected ]
+
+
+    def length(self):
+
+        mq = support.load_message_queue()
+        con, cur = mq.open_db(self.queue)
+
+        try:
+            return mq.count_items(cur)
+        finally:
+            con.close()
+
+
+    def wait_for_length(self, length, timeout=5):
+
+        deadline = time.time() + timeout
+
+        while self.length() != length and time.time() < deadline:
+            time.sleep(0.05)
+
+        return self.length()
+
+
+    def test_messages_are_pushed_and_deleted_when_acknowledged(self):
+
+        self.add('first', 'second')
+
+        self.assertEqual(self.collect(2), [ ('h1', 'first'), ('h1', 'second') ])
+
+        # new messages arrive without a new request
+        self.add('third')
+        self.assertEqual(self.collect(1), [ ('h1', 'third') ])
+
+        self.assertEqual(self.length(), 3)
+        self.pool.ack(dict(h1=[ 1, 2, 3 ]))
+        self.assertEqual(self.wait_for_length(0), 0)
+
+
+    def test_unacknowledged_messages_are_sent_again_by_a_restarted_agent(self):
+
+        self.add('first', 'second')
+        self.assertEqual(len(self.collect(2)), 2)
+
+        self.pool.ack(dict(h1=[ 1 ]))
+        self.assertEqual(self.wait_for_length(1), 1)
+
+        self.pool.agents['h1']['process'].kill()
+        self.pool.agents['h1']['process'].wait()
+
+        self.assertEqual(self.collect(1), [ ('h1', 'second') ])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+
+import support
+import record_codec
+
+
+RECORDS = [ dict([ ('epoche_from', 1466000000.0), ('epoche_until', 1466000100.0),
+                   ('execution_id', 'h1:1:0'), ('result', 'SUCCESS - done') ]),
+            dict([ ('epoche_from', 1466000200.0), ('epoche_until', 1466000300.0),
+                   ('execution_id', 'h1:2:0'), ('result', 'FAILURE - Übertragung ✗') ]) ]
+
+
+def encode_file(records):
+
+    return [ record_codec.encode_header() ] + [ record_codec.encode_record(record) for record in records ]
+
+
+class record_codec_test(support.temp_dir_case):
+
+    def assert_strings(self, records):
+
+        for record in records:
+            for key, value in record.items():
+                self.assertNotIsInstance(key, unicode)
+                self.assertNotIsInstance(value, unicode, key)
+
+
+    def test_round_trip(self):
+
+        records = record_codec.decode_records(encode_file(RECORDS))
+
+        self.assertEqual(records, RECORDS)
+        self.assert_strings(records)
+
+
+    def test_ascii_only_values_are_strings(self):
+
+        records = record_codec.decode_records(encode_file(RECORDS[:1]))
+
+        self.assertEqual(records, RECORDS[:1])
+        self.assert_strings(records)
+
+
+    def test_version_1(self):
+
+        lines = [ '%r\n' % record for record in RECORDS ]
+
+        self.assertEqual(record_codec.get_version(lines), 1)
+        self.assertEqual(record_codec.decode_records(lines), RECORDS)
+
+
+    def test_empty_file_is_current(self):
+
+        self.assertEqual(record_codec.get_version([]), record_codec.VERSION)
+        self.assertEqual(record_codec.decode_records([]), [])
+
+
+    def test_corrupt_line_is_skipped(self):
+
+        lines = encode_file(RECORDS)
+        lines.insert(2, lines[1][:20] + '\n')
+
+        records = record_codec.decode_records(lines, self.logger)
+
+        self.assertEqual(records, RECORDS)
+        self.assert_strings(records)
+
+
+    def test_unsupported_version(self):
+
+        self.assertRaises(ValueError, record_codec.decode_records, [ '{"_format":"job_history","_version":3}\n' ])
+        self.assertRaises(ValueError, record_codec.decode_records, [ '{"_format":"other","_version":2}\n' ])
+
+
+    def test_encode_strings_of_nested_values(self):
+
+        value = record_codec.encode_strings(json.loads('{"jobs": [ {"name": "Jöb", "count": 1} ], "ok": true}'))
+
+        self.assertEqual(value, { 'jobs': [ { 'name': 'Jöb', 'count': 1 } ], 'ok': True })
+        self.assertNotIsInstance(value.keys()[0], unicode)
+        self.assertNotIsInstance(value['jobs'][0]['name'], unicode)
@@ -0,0 +1,55 @@
+import support
+from reorder_buffer import reorder_buffer
+
+
+def make_message(timestamp, source_id=1, source='h1'):
+
+    return dict([ ('id', '%s:%d' % (source, source_id)),
+                  ('source', source),
+                  ('source_id', source_id),
+                  ('epoche_timestamp', timestamp) ])
+
+
+class reorder_buffer_test(support.temp_dir_case):
+
+    def make_buffer(self, grace, **job):
+
+        job.update(name='JOB02', env='P')
+
+        return reorder_buffer(self.make_config(dict(controller_reorder_grace_in_sec=grace)), self.logger, job)
+
+
+    def test_sorts_within_grace(self):
+
+        buf = self.make_buffer(5)
+
+        buf.add([ make_message(103, 1), make_message(101, 2, 'h2') ])
+        self.assertEqual(buf.release(now=104), [])
+
+        buf.add([ make_message(102, 3) ])
+        self.assertEqual([ msg['epoche_timestamp'] for msg in buf.release(now=107.5) ], [ 101, 102 ])
+        self.assertEqual([ msg['epoche_timestamp'] for msg in buf.get_held_messages() ], [ 103 ])
+
+        self.assertEqual([ msg['epoche_timestamp'] for msg in buf.release(now=108, flush=True) ], [ 103 ])
+        self.assertEqual(buf.get_held_messages(), [])
+
+
+    def test_no_grace_passes_through(self):
+
+        buf = self.make_buffer(0)
+
+        # a source host clock ahead of the local clock
+        buf.add([ make_message(1000.5, 1), make_message(990, 2) ])
+
+        self.assertEqual([ msg['epoche_timestamp'] for msg in buf.release(now=1000) ], [ 990, 1000.5 ])
+        self.assertEqual(buf.get_held_messages(), [])
+
+
+    def test_job_grace_overrides_the_default(self):
+
+        buf = self.make_buffer(0, reorder_grace_in_sec=10)
+
+        buf.add([ make_message(100) ])
+
+        self.assertEqual(buf.release(now=105), [])
+        self.assertEqual(len(buf.release(now=110)), 1)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+
+import support
+from ring_filer import ring_filer
+
+
+def make_statement(index, result='SUCCESS - done'):
+
+    return dict([ ('execution_id', 'h1:%d:0' % index),
+                  ('epoche_from', 1000.0 + index),
+                  ('epoche_until', 1000.0 + index),
+                  ('result', result) ])
+
+
+class ring_filer_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(ring_filer_test, self).setUp()
+        self.filename = os.path.join(self.dir, 'JOB02__P.job_ring')
+        self.rings = []
+
+
+    def tearDown(self):
+
+        for ring in self.rings:
+            ring.close()
+
+        super(ring_filer_test, self).tearDown()
+
+
+    def open_ring(self, entry_count=5, text_bytes=64):
+
+        cfg = self.make_config(dict(history_backend='ring', job_history_entry_count=entry_count,
+                                    history_ring_text_bytes=text_bytes))
+        ring = ring_filer(cfg, self.logger, self.filename)
+        self.rings.append(ring)
+
+        return ring
+
+
+    def test_keeps_the_newest_entries(self):
+
+        ring = self.open_ring(entry_count=3)
+
+        # out of order, the oldest are evicted
+        for index in (4, 0, 5, 1, 3, 2):
+            self.assertTrue(ring.write_statement(make_statement(index)))
+
+        self.assertEqual(ring.read_content(), [ make_statement(index) for index in (5, 4, 3) ])
+        self.assertEqual(ring.get_last_statement(), make_statement(5))
+        self.assertEqual(ring.read_content(since=1004.0), [ make_statement(index) for index in (5, 4) ])
+
+
+    def test_reopen(self):
+
+        ring = self.open_ring()
+        ring.write_statements([ make_statement(index) for index in range(3) ])
+        ring.close()
+
+        self.assertEqual(self.open_ring().read_content(), [ make_statement(index) for index in (2, 1, 0) ])
+
+
+    def test_resize_keeps_the_newest_entries(self):
+
+        ring = self.open_ring(entry_count=5)
+        ring.write_statements([ make_statement(index) for index in range(5) ])
+        ring.close()
+
+        ring = self.open_ring(entry_count=3)
+
+        self.assertEqual(ring.read_content(), [ make_statement(index) for index in (4, 3, 2) ])
+        self.assertEqual(os.path.getsize(self.filename), ring.get_size())
+
+
+    def test_multibyte_text_is_cut_on_a_character_boundary(self):
+
+        # 'h1:0:0' (6 bytes) leaves 13 bytes for the result, 'SUCCESS - ' takes 10
+        ring = self.open_ring(text_bytes=19)
+
+        ring.write_statements([ make_statement(0, 'SUCCESS - üü'),
+                                make_statement(1, u'SUCCESS - ü✓'),
+                                make_statement(2, u'SUCCESS - ✓✓') ])
+
+        self.assertEqual([ statement['result'] for statement in ring.read_content() ],
+                         [ 'SUCCESS - ✓', 'SUCCESS - ü', 'SUCCESS - ü' ])
+
+        statement = make_statement(3)
+        statement['execution_id'] = 'ü' * 10
+        ring.write_statement(statement)
+
+        self.assertEqual(ring.get_last_statement()['execution_id'], 'ü' * 9)
+        self.assertEqual(ring.get_last_statement()['result'], 'S')
+
+        # read back as valid utf-8
+        for statement in ring.read_content():
+            statement['execution_id'].decode('utf-8')
+            statement['result'].decode('utf-8')
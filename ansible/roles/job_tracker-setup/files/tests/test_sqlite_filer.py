@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import os
+
+import support
+from filer import filer
+from sqlite_filer import history_database, sqlite_filer
+
+
+def make_statement(index, result='SUCCESS - done'):
+
+    return dict([ ('execution_id', 'h1:%d:0' % index),
+                  ('epoche_from', 1000.0 + index),
+                  ('epoche_until', 1000.0 + index),
+                  ('result', result) ])
+
+
+class sqlite_filer_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(sqlite_filer_test, self).setUp()
+        self.databases = []
+        self.cfg = self.make_config(dict(job_history_entry_count=3, history_compaction_records=1))
+        self.filename = os.path.join(self.dir, 'job_history.sqlite')
+        self.db = self.open_database()
+
+
+    def tearDown(self):
+
+        for db in self.databases:
+            db.close()
+
+        super(sqlite_filer_test, self).tearDown()
+
+
+    def open_database(self, readonly=False):
+
+        db = history_database(self.cfg, self.logger, self.filename, readonly)
+        self.databases.append(db)
+
+        return db
+
+
+    def test_jobs_share_the_database(self):
+
+        job01 = sqlite_filer(self.cfg, self.logger, self.db, 'JOB01', 'I')
+        job02 = sqlite_filer(self.cfg, self.logger, self.db, 'JOB02', 'P')
+
+        job01.write_statements([ make_statement(index) for index in (0, 2) ])
+        job02.write_statement(make_statement(1))
+
+        self.assertEqual(job01.read_content(), [ make_statement(index) for index in (2, 0) ])
+        self.assertEqual(job02.read_content(), [ make_statement(1) ])
+        self.assertEqual(job01.get_last_statement(), make_statement(2))
+
+
+    def test_read_content(self):
+
+        history_file = sqlite_filer(self.cfg, self.logger, self.db, 'JOB02', 'P')
+
+        # retention: the newest <job_history_entry_count> are kept
+        for index in (3, 1, 0, 4, 2):
+            history_file.write_statement(make_statement(index))
+
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (4, 3, 2) ])
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM history"), [ (3,) ])
+        self.assertEqual(history_file.read_content(since=1003.0, until=1004.0), [ make_statement(3) ])
+
+        # of entries with the same epoche_until the first written comes first
+        later = dict(make_statement(4), execution_id='h1:5:0')
+        history_file.write_statement(later)
+        self.assertEqual(history_file.read_content(limit=2), [ make_statement(4), later ])
+
+
+    def test_strings_are_utf8(self):
+
+        history_file = sqlite_filer(self.cfg, self.logger, self.db, 'JOB02', 'P')
+        history_file.write_statement(make_statement(0, 'SUCCESS - Grüße ✓'))
+
+        result = history_file.get_last_statement()['result']
+
+        self.assertIsInstance(result, str)
+        self.assertEqual(result, 'SUCCESS - Grüße ✓')
+
+
+    def test_statements_are_visible_to_others_after_the_commit(self):
+
+        sqlite_filer(self.cfg, self.logger, self.db, 'JOB02', 'P').write_statement(make_statement(0))
+
+        reader = sqlite_filer(self.cfg, self.logger, self.open_database(readonly=True), 'JOB02', 'P')
+        self.assertEqual(reader.read_content(), [])
+
+        self.assertTrue(self.db.commit())
+        self.assertEqual(reader.read_content(), [ make_statement(0) ])
+
+
+    def test_history_file_is_imported_once(self):
+
+        filename = os.path.join(self.dir, 'JOB02__P.job_history')
+        filer(self.cfg, self.logger, filename).write_statements([ make_statement(index) for index in range(2) ])
+
+        history_file = sqlite_filer(self.cfg, self.logger, self.db, 'JOB02', 'P')
+        history_file.import_file(filename)
+        history_file.write_statement(make_statement(2))
+        history_file.import_file(filename)
+
+        self.assertEqual(history_file.read_content(), [ make_statement(index) for index in (2, 1, 0) ])
@@ -0,0 +1,96 @@
+import time
+import threading
+
+import support
+from ssh_master import ssh_master_pool
+from controller import Controller
+
+
+class blocking_ssh():
+    ''' stands in for ssh_master_pool.run_ssh, blocks until released '''
+
+    def __init__(self, rc):
+
+        self.rc = rc
+        self.calls = []
+        self.release = threading.Event()
+
+
+    def __call__(self, args):
+
+        self.calls.append(args)
+        self.release.wait(10)
+        return self.rc
+
+
+class ssh_master_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(ssh_master_test, self).setUp()
+        self.cfg = self.make_config()
+        self.pool = ssh_master_pool(self.cfg, self.logger)
+
+
+    def wait_refreshed(self, name):
+
+        deadline = time.time() + 5
+
+        while name in self.pool.refreshing and time.time() < deadline:
+            time.sleep(0.01)
+
+
+    def test_ensure_does_not_block_on_an_unreachable_host(self):
+
+        ssh = blocking_ssh(rc=255)
+        self.pool.run_ssh = ssh
+
+        start = time.time()
+        alive = self.pool.ensure('u', '', 'dead-host')
+
+        self.assertFalse(alive)
+        self.assertLess(time.time() - start, 1)
+
+        # one health check at a time per host
+        self.assertFalse(self.pool.ensure('u', '', 'dead-host'))
+        time.sleep(0.1)
+        self.assertEqual(len(ssh.calls), 1)
+
+        ssh.release.set()
+        self.wait_refreshed('u@dead-host')
+        self.assertFalse(self.pool.ensure('u', '', 'dead-host'))
+
+
+    def test_ensure_reports_a_started_master(self):
+
+        ssh = blocking_ssh(rc=0)
+        ssh.release.set()
+        self.pool.run_ssh = ssh
+
+        self.assertFalse(self.pool.ensure('u', '', 'host'))
+        self.wait_refreshed('u@host')
+        self.assertTrue(self.pool.ensure('u', '', 'host'))
+
+        # no new check within <controller_ssh_master_check_interval_in_sec>
+        self.assertEqual(len(ssh.calls), 1)
+
+
+    def test_ssh_command_without_master(self):
+
+        ssh = blocking_ssh(rc=255)
+        self.pool.run_ssh = ssh
+
+        controller = Controller(self.cfg, self.logger)
+        controller.ssh_masters = self.pool
+
+        self.assertNotIn('ControlPath', controller.get_ssh_command('u', '', 'dead-host'))
+
+        ssh.rc = 0
+        ssh.release.set()
+        self.wait_refreshed('u@dead-host')
+        self.pool.last_check.clear()
+        controller.get_ssh_command('u', '', 'dead-host')
+        self.wait_refreshed('u@dead-host')
+
+        self.assertIn('ControlPath=%s' % self.pool.get_control_path('u', 'dead-host'),
+                      controller.get_ssh_command('u', '', 'dead-host'))
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import subprocess
+
+import support
+import transport
+from controller import Controller
+from transport import get_transport, local_sqlite_transport, unix_socket_transport
+
+
+def make_messages(count, job='JOB02'):
+
+    return [ ('P', job, 'STARTED', 'message %d' % index) for index in range(count) ]
+
+
+class transport_test(support.temp_dir_case):
+
+    def setUp(self):
+
+        super(transport_test, self).setUp()
+        self.queue = support.make_queue(os.path.join(self.dir, 'queue.sqlite'))
+        self.cfg = self.make_config()
+
+
+    def tearDown(self):
+
+        transport._connections.clear()
+        super(transport_test, self).tearDown()
+
+
+    def make_host(self, **host):
+
+        return dict([ ('hostname', 'h1'),
+                      ('user', 'u'),
+                      ('key', ''),
+                      ('message_queue', self.queue),
+                      ('message_queue_handler', 'python %s' % support.MESSAGE_QUEUE) ] + host.items())
+
+
+    def test_transport_is_abstract(self):
+
+        self.assertRaises(TypeError, transport.transport, self.cfg, self.logger, self.make_host())
+
+        class incomplete(transport.transport):
+
+            def fetch(self, max_items):
+                return []
+
+        self.assertRaises(TypeError, incomplete, self.cfg, self.logger, self.make_host())
+
+
+    def test_ssh_unless_configured(self):
+
+        # a queue on this host is read over ssh as well unless configured otherwise
+        host = self.make_host(hostname='localhost')
+
+        self.assertIsInstance(get_transport(self.cfg, self.logger, host, None), transport.ssh_transport)
+
+        host['transport'] = 'local-sqlite'
+        self.assertIsInstance(get_transport(self.cfg, self.logger, host, None), local_sqlite_transport)
+
+
+    def test_ssh_close_sends_the_pending_ack(self):
+
+        self.cfg.controller_queue_protocol = 'cursor'
+        cntr = Controller(self.cfg, self.logger)
+        commands = []
+        cntr.run_shell = lambda cmd: commands.append(cmd) or dict(stdout='', stderr='', rc=0)
+
+        queue = transport.ssh_transport(self.cfg, self.logger, self.make_host(), cntr)
+
+        # nothing acknowledged yet
+        queue.close()
+        self.assertEqual(commands, [])
+
+        queue.fetched(7)
+        queue.ack([ 5, 7 ])
+        self.assertIn('--ack-upto 7', queue.get_fetch_command(10))
+
+        queue.close()
+        self.assertEqual(len(commands), 1)
+        self.assertIn('ack --upto 7', commands[0])
+
+        # fetched again from the cursor
+        self.assertIn('--after 0', queue.get_fetch_command(10))
+
+
+    def test_local_sqlite(self):
+
+        support.make_queue(self.queue, make_messages(5))
+        queue = local_sqlite_transport(self.cfg, self.logger, self.make_host(transport='local-sqlite'))
+
+        first = queue.fetch(3)
+        second = queue.fetch(3)
+
+        self.assertEqual([ msg['message'] for msg in first + second ], [ 'message %d' % index for index in range(5) ])
+        self.assertEqual(queue.length(), 5)
+
+        queue.ack([ msg['_id'] for msg in first ])
+        self.assertEqual(queue.length(), 2)
+
+        # unacknowledged messages are delivered again after close
+        queue.close()
+        self.assertEqual(queue.fetch(10), second)
+
+
+    def test_unix_socket(self):
+
+        support.make_queue(self.queue, make_messages(3))
+        socket_path = os.path.join(self.dir, 'queue.sock')
+
+        server = subprocess.Popen([ sys.executable, support.MESSAGE_QUEUE, '-f', self.queue, 'serve',
+                                    '-s', socket_path, '-t', 'EPOCHE' ])
+
+        try:
+            deadline = time.time() + 10
+            while not os.path.exists(socket_path) and time.time() < deadline:
+                time.sleep(0.05)
+
+            queue = unix_socket_transport(self.cfg, self.logger, self.make_host(transport='unix-socket', socket=socket_path))
+
+            messages = queue.fetch(2)
+            self.assertEqual([ msg['message'] for msg in messages ], [ 'message 0', 'message 1' ])
+            self.assertEqual([ msg['message'] for msg in queue.fetch(2) ], [ 'message 2' ])
+
+            queue.ack([ msg['_id'] for msg in messages ])
+            self.assertEqual(queue.length(), 1)
+
+            # the unacknowledged message is sent again on the next connection
+            queue.close()
+            self.assertEqual([ msg['message'] for msg in queue.fetch(2) ], [ 'message 2' ])
+            queue.close()
+
+        finally:
+            server.kill()
+            server.wait()